@@ -1,11 +1,13 @@
 import streamlit as st
 import time
-from modules import services, views
+from modules import services, views, arquivamento
 
 # Configuração da Página deve ser a primeira linha
 st.set_page_config(layout="wide", page_title="Sistema Coleta")
 
 def main():
+    arquivamento.iniciar_agendamento()  # Só liga se COLETA_ARQUIVAMENTO_H > 0
+
     # Verifica se já está logado na sessão (Memória RAM)
     if 'usuario_logado_temp' not in st.session_state:
         try:
@@ -26,6 +28,8 @@ def main():
         st.write(f"👤 **{usuario}**")
         
         if st.button("🔄 Atualizar Tela"):
+            # Confere a versão das abas (1 célula); só baixa de novo se mudou
+            services.expirar_cache()
             st.rerun()
 
         st.divider()
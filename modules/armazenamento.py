@@ -0,0 +1,267 @@
+import streamlit as st
+import pandas as pd
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from modules import services
+
+# --- BACKEND LOCAL (SQLITE) ---
+# Mesmas operações das funções de services.py, só que em SQLite (WAL) no disco
+# do servidor. Com COLETA_BACKEND=sqlite ele vira o banco "vivo" e a planilha
+# do Google passa a ser só um espelho exportado de tempos em tempos.
+
+INTERVALO_ESPELHO_MIN = 10  # minutos entre exportações para o Sheets
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS projetos (
+    id TEXT PRIMARY KEY, nome TEXT, data_criacao TEXT, total_lotes INTEGER, status TEXT
+);
+CREATE TABLE IF NOT EXISTS controle_lotes (
+    id_projeto TEXT, lote INTEGER, status TEXT, usuario TEXT, progresso TEXT,
+    checkpoint TEXT, lease_ate TEXT, PRIMARY KEY (id_projeto, lote)
+);
+CREATE TABLE IF NOT EXISTS dados_brutos (
+    id INTEGER PRIMARY KEY, id_projeto TEXT, lote INTEGER, ean TEXT, descricao TEXT,
+    site TEXT, cep TEXT, endereco TEXT, link TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_dados_projeto_lote ON dados_brutos (id_projeto, lote);
+CREATE INDEX IF NOT EXISTS ix_lotes_status ON controle_lotes (id_projeto, status);
+CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor TEXT);
+"""
+
+# id_linha (coluna I do Sheets) não é guardado: aqui o id da linha é a chave primária.
+# link_auto também não: no banco local o reuso só preenche o link.
+COLS_SQL = [c for c in services.COLS_DADOS if c not in ("id_linha", "link_auto")]
+
+class BackendSQLite:
+    def __init__(self, arquivo):
+        self.arquivo = arquivo
+        self._local = threading.local()
+        with self._con() as con:
+            con.executescript(ESQUEMA)
+
+    def _con(self):
+        # Uma conexão por thread (sqlite3 não compartilha conexão entre threads)
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.arquivo, timeout=30, isolation_level=None)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.execute("PRAGMA busy_timeout=30000")
+            self._local.con = con
+        return con
+
+    def _tocar_versao(self, con):
+        # Toda escrita sobe a versão; o espelho só exporta quando ela muda
+        con.execute("INSERT INTO meta VALUES ('versao', '1') ON CONFLICT(chave) DO UPDATE SET valor = CAST(valor AS INTEGER) + 1")
+
+    def versao(self):
+        row = self._con().execute("SELECT valor FROM meta WHERE chave = 'versao'").fetchone()
+        return int(row[0]) if row else 0
+
+    def vazio(self):
+        return self._con().execute("SELECT COUNT(*) FROM projetos").fetchone()[0] == 0
+
+    # --- LEITURA ---
+    def carregar_projetos_ativos(self):
+        return pd.read_sql_query("SELECT * FROM projetos WHERE status = 'Ativo'", self._con())
+
+    def carregar_lotes_do_projeto(self, id_projeto):
+        df = pd.read_sql_query("SELECT * FROM controle_lotes WHERE id_projeto = ? ORDER BY lote", self._con(), params=(str(id_projeto),))
+        vencido = (df['status'] == 'Em Andamento') & df['lease_ate'].map(services.lease_vencido)
+        df.loc[vencido, 'status'] = 'Livre'
+        df.loc[vencido, 'usuario'] = ''
+        return df
+
+    def carregar_dados_lote(self, id_projeto, numero_lote):
+        df = pd.read_sql_query(
+            "SELECT id_projeto, lote, ean, descricao, site, cep, endereco, link, id AS _row_index "
+            "FROM dados_brutos WHERE id_projeto = ? AND lote = ? ORDER BY id",
+            self._con(), params=(str(id_projeto), int(numero_lote)))
+        df['lote'] = df['lote'].astype(str)
+        df['link'] = df['link'].fillna("")
+        return df
+
+    def iterar_linhas_projeto(self, id_projeto):
+        # Linhas A-H do projeto, em streaming (cursor), para a exportação
+        cur = self._con().execute(
+            "SELECT id_projeto, lote, ean, descricao, site, cep, endereco, link FROM dados_brutos "
+            "WHERE id_projeto = ? ORDER BY lote, id", (str(id_projeto),))
+        for row in cur:
+            yield ["" if v is None else v for v in row]
+
+    # --- ESCRITA ---
+    def criar_projeto(self, id_p, nome, data_criacao, total_lotes, l_lotes, dados):
+        con = self._con()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            con.execute("INSERT INTO projetos VALUES (?, ?, ?, ?, 'Ativo')", (id_p, nome, data_criacao, int(total_lotes)))
+            con.executemany("INSERT INTO controle_lotes VALUES (?, ?, ?, ?, ?, ?, '')", [l[:6] for l in l_lotes])
+            # dados: DataFrame ou blocos de DataFrame (upload lido aos pedaços)
+            for bloco in ([dados] if isinstance(dados, pd.DataFrame) else dados):
+                con.executemany(
+                    "INSERT INTO dados_brutos (id_projeto, lote, ean, descricao, site, cep, endereco, link) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    bloco[COLS_SQL].astype(object).itertuples(index=False, name=None))
+            self._tocar_versao(con)
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+
+    def reservar_lote(self, id_projeto, numero_lote, usuario):
+        con = self._con()
+        con.execute("BEGIN IMMEDIATE")  # Trava de escrita: leitura + update atômicos
+        try:
+            row = con.execute("SELECT status, usuario, lease_ate FROM controle_lotes WHERE id_projeto = ? AND lote = ?",
+                              (str(id_projeto), int(numero_lote))).fetchone()
+            if not row or not services.pode_reservar(row[0], row[1], row[2], usuario):
+                con.execute("ROLLBACK")
+                return False
+            con.execute("UPDATE controle_lotes SET status = 'Em Andamento', usuario = ?, lease_ate = ? WHERE id_projeto = ? AND lote = ?",
+                        (usuario, services.novo_lease(), str(id_projeto), int(numero_lote)))
+            self._tocar_versao(con)
+            con.execute("COMMIT")
+            return True
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+
+    def renovar_lease(self, id_projeto, numero_lote, usuario):
+        cur = self._con().execute(
+            "UPDATE controle_lotes SET lease_ate = ? WHERE id_projeto = ? AND lote = ? AND status = 'Em Andamento' AND usuario = ?",
+            (services.novo_lease(), str(id_projeto), int(numero_lote), usuario))
+        return cur.rowcount > 0
+
+    def salvar_lote_links(self, alteracoes):
+        if not alteracoes: return True
+        con = self._con()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            con.executemany("UPDATE dados_brutos SET link = ? WHERE id = ?",
+                            [(str(a['link'] or ""), int(a['indice_excel'])) for a in alteracoes])
+            self._tocar_versao(con)
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        return True
+
+    def salvar_progresso_lote(self, df_editado, id_projeto, numero_lote, concluir=False, checkpoint_val="", sincronizados=None, usuario=None):
+        links = df_editado['link'].fillna("").astype(str)
+        linhas = df_editado['_row_index'].astype(int)
+        pares = [(l, int(r)) for r, l in zip(linhas, links) if sincronizados is None or sincronizados.get(int(r)) != l]
+        prog_str = f"{int((links.str.strip() != '').sum())}/{len(df_editado)}"
+
+        con = self._con()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            if pares: con.executemany("UPDATE dados_brutos SET link = ? WHERE id = ?", pares)
+            if concluir and usuario is not None:
+                # Só entrega quem ainda tem o lote
+                dono = con.execute("SELECT status, usuario FROM controle_lotes WHERE id_projeto = ? AND lote = ?",
+                                   (str(id_projeto), int(numero_lote))).fetchone()
+                if not dono or tuple(dono) != ("Em Andamento", usuario):
+                    con.execute("ROLLBACK")
+                    return False
+            if concluir:
+                con.execute("UPDATE controle_lotes SET status = 'Concluído', progresso = ?, checkpoint = '', lease_ate = '' WHERE id_projeto = ? AND lote = ?",
+                            (prog_str, str(id_projeto), int(numero_lote)))
+            elif checkpoint_val:
+                con.execute("UPDATE controle_lotes SET progresso = ?, checkpoint = ? WHERE id_projeto = ? AND lote = ?",
+                            (prog_str, checkpoint_val, str(id_projeto), int(numero_lote)))
+            else:
+                con.execute("UPDATE controle_lotes SET progresso = ? WHERE id_projeto = ? AND lote = ?",
+                            (prog_str, str(id_projeto), int(numero_lote)))
+            self._tocar_versao(con)
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        if sincronizados is not None:
+            for link, linha in pares: sincronizados[linha] = link
+        return True
+
+    # --- MIGRAÇÃO / ESPELHO ---
+    def importar_do_sheets(self):
+        # Carga inicial: copia projetos, controle_lotes e os dados de cada projeto
+        # (dados_brutos ou o shard da coluna aba_dados) para o SQLite vazio
+        if not self.vazio(): raise Exception("O banco local já tem projetos.")
+        ss = services.abrir_planilha()
+        def valores(ws, n_cols):
+            dados = services.retry_api(ws.get_all_values) or []
+            return [(list(l) + [""] * n_cols)[:n_cols] for l in dados[1:]]
+        projetos = valores(services.abrir_aba(ss, "projetos"), 6)
+        destinos = {}  # destino -> ids dos projetos que estão nele
+        for p in projetos: destinos.setdefault(p[5].strip() or services.ABA_DADOS_PADRAO, set()).add(p[0])
+        con = self._con()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            con.executemany("INSERT OR IGNORE INTO projetos VALUES (?, ?, ?, ?, ?)", [p[:5] for p in projetos])
+            con.executemany("INSERT OR IGNORE INTO controle_lotes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            [l[:6] + [l[8]] for l in valores(services.abrir_aba(ss, "controle_lotes"), 9)])
+            for destino, ids in destinos.items():
+                linhas = valores(services.abrir_aba_dados(ss, destino), len(COLS_SQL))
+                con.executemany("INSERT INTO dados_brutos (id_projeto, lote, ean, descricao, site, cep, endereco, link) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                [l for l in linhas if l[0] in ids])
+            self._tocar_versao(con)
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+
+    def exportar_para_sheets(self):
+        # Reescreve as abas do Sheets (a partir da linha 2, mantendo o cabeçalho)
+        versao = self.versao()
+        ss = services.abrir_planilha()
+        con = self._con()
+
+        # id_linha no espelho = "<id_projeto>-<id do SQLite>" (único e estável)
+        dados = con.execute("SELECT id_projeto, lote, ean, descricao, site, cep, endereco, COALESCE(link, ''), id_projeto || '-' || id, '' FROM dados_brutos ORDER BY id_projeto, lote, id").fetchall()
+        # Faixa de cada lote no espelho, para o índice de controle_lotes continuar valendo
+        faixas = {}
+        for i, row in enumerate(dados):
+            chave = (row[0], int(row[1]))
+            ini, _ = faixas.get(chave, (i + 2, i + 2))
+            faixas[chave] = (ini, i + 2)
+        lotes = [list(r[:6]) + list(faixas.get((r[0], int(r[1])), ("", ""))) + [r[6] or ""]
+                 for r in con.execute("SELECT id_projeto, lote, status, usuario, progresso, checkpoint, lease_ate FROM controle_lotes ORDER BY id_projeto, lote")]
+        # O espelho é todo em dados_brutos: aba_dados (F) fica vazia
+        projetos = [list(r) + [""] for r in con.execute("SELECT id, nome, data_criacao, total_lotes, status FROM projetos")]
+
+        ws_l = services.abrir_aba(ss, "controle_lotes")
+        services.garantir_colunas_controle(ws_l)
+        services.garantir_coluna_destino(services.abrir_aba(ss, "projetos"))
+        services.garantir_coluna_id(services.abrir_aba(ss, "dados_brutos"))
+        for nome, linhas, col_fim in [("projetos", projetos, "F"), ("controle_lotes", lotes, "I"), ("dados_brutos", [list(d) for d in dados], services.COL_FIM_DADOS)]:
+            ws = services.abrir_aba(ss, nome)
+            for a in range(0, len(linhas), services.TAM_BLOCO_UPLOAD):
+                bloco = linhas[a:a + services.TAM_BLOCO_UPLOAD]
+                services.retry_api(ws.update, range_name=f"A{a + 2}:{col_fim}{a + 1 + len(bloco)}", values=bloco)
+            services.retry_api(ws.batch_clear, [f"A{len(linhas) + 2}:{col_fim}"])
+        services.invalidar_cache()
+        services.marcar_alteracao("projetos", "controle_lotes")
+        con.execute("INSERT INTO meta VALUES ('versao_espelho', ?) ON CONFLICT(chave) DO UPDATE SET valor = excluded.valor", (str(versao),))
+        con.execute("INSERT INTO meta VALUES ('espelho_em', ?) ON CONFLICT(chave) DO UPDATE SET valor = excluded.valor",
+                    (datetime.now(services.TZ_BRASIL).strftime(services.FMT_LEASE),))
+        print(f"🪞 Espelho do Sheets atualizado (versão {versao}).")
+
+    def info_espelho(self):
+        meta = dict(self._con().execute("SELECT chave, valor FROM meta").fetchall())
+        return {'versao': int(meta.get('versao', 0)), 'versao_espelho': int(meta.get('versao_espelho', 0)), 'espelho_em': meta.get('espelho_em', '')}
+
+    def _loop_espelho(self):
+        while True:
+            time.sleep(INTERVALO_ESPELHO_MIN * 60)
+            try:
+                info = self.info_espelho()
+                if info['versao'] != info['versao_espelho']: self.exportar_para_sheets()
+            except Exception as e:
+                print(f"Erro ao exportar espelho: {e}")
+
+# Um banco (e uma thread de espelho) por processo
+@st.cache_resource
+def get_sqlite():
+    backend = BackendSQLite(services.caminho_local("coleta.db"))
+    threading.Thread(target=backend._loop_espelho, name="espelho_sheets", daemon=True).start()
+    return backend
@@ -0,0 +1,245 @@
+import streamlit as st
+import threading
+import json
+import gzip
+import os
+import time
+from datetime import datetime
+from modules import services, fila_salvamento, snapshot_dados
+from modules.cache_compartilhado import CacheDisco, TravaLonga
+
+# --- ARQUIVAMENTO DE PROJETOS CONCLUÍDOS ---
+# Projeto com todos os lotes "Concluído" sai das abas quentes (projetos,
+# controle_lotes e dados) e vai para um .json.gz em DIR_LOCAL/arquivo (e,
+# se configurado, para uma planilha de arquivo). O arquivo local é gravado
+# antes de qualquer remoção: se algo falhar no meio, nada se perde e basta
+# rodar de novo. Formato: 1ª linha = cabeçalho (projeto + lotes), depois
+# uma linha JSON por linha de dados (A-I).
+
+PLANILHA_ARQUIVO = os.environ.get("COLETA_PLANILHA_ARQUIVO") or None
+ABA_ARQUIVO = "dados_arquivados"
+INTERVALO_AUTO_H = float(os.environ.get("COLETA_ARQUIVAMENTO_H", 0))  # 0 = só pelo botão
+_lock = threading.Lock()
+
+def _dir():
+    d = services.caminho_local("arquivo")
+    os.makedirs(d, exist_ok=True)
+    return d
+
+def _arquivo_projeto(id_p):
+    return os.path.join(_dir(), f"{id_p}.json.gz")
+
+def _arquivo_indice():
+    return os.path.join(_dir(), "indice.json")
+
+def projetos_arquivados():
+    # {id: {'nome', 'data', 'total_lotes', 'linhas', 'arquivado_em'}}
+    try:
+        with open(_arquivo_indice(), encoding="utf-8") as f: return json.load(f)
+    except FileNotFoundError: return {}
+
+def _salvar_indice(indice):
+    tmp = _arquivo_indice() + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f: json.dump(indice, f, ensure_ascii=False)
+    os.replace(tmp, _arquivo_indice())
+
+def esta_arquivado(id_p):
+    return os.path.exists(_arquivo_projeto(id_p))
+
+def iterar_linhas(id_p):
+    # Linhas A-I do projeto arquivado, em streaming
+    with gzip.open(_arquivo_projeto(id_p), "rt", encoding="utf-8") as f:
+        f.readline()  # cabeçalho
+        for l in f:
+            if l.strip(): yield json.loads(l)
+
+def projetos_arquivaveis():
+    # Projetos ativos com todos os lotes concluídos (pelo cache de controle)
+    status = {}
+    for r in services.ler_registros_cache("controle_lotes"):
+        status.setdefault(str(r.get('id_projeto')), []).append(str(r.get('status')))
+    return [p for p in services.ler_registros_cache("projetos")
+            if p.get('status') == 'Ativo' and status.get(str(p.get('id')))
+            and all(s == 'Concluído' for s in status[str(p.get('id'))])]
+
+def _total_esperado(lotes):
+    # Soma o N de "feitos/N" de cada lote
+    total = 0
+    for l in lotes:
+        try: total += int(str(l.get('progresso', '')).split("/")[1])
+        except: return None
+    return total
+
+def _linhas_do_projeto(ws, id_p):
+    faixas = services._faixas_pelo_indice(id_p)
+    if faixas:
+        try: return list(services._iterar_linhas_projeto(ws, id_p, faixas, validar=True))
+        except services._IndiceDesatualizado: pass
+    faixas = services._faixas_pela_coluna_a(ws, id_p)
+    return list(services._iterar_linhas_projeto(ws, id_p, faixas, validar=False)) if faixas else []
+
+def _gravar_arquivo(id_p, cabecalho, linhas):
+    tmp = _arquivo_projeto(id_p) + ".tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        f.write(json.dumps(cabecalho, ensure_ascii=False) + "\n")
+        for l in linhas: f.write(json.dumps(l, ensure_ascii=False) + "\n")
+    os.replace(tmp, _arquivo_projeto(id_p))
+
+def _copiar_para_planilha_arquivo(ss, linhas):
+    planilha = services.retry_api(ss.client.open_by_key, PLANILHA_ARQUIVO)
+    try: ws = services.retry_api(planilha.worksheet, ABA_ARQUIVO)
+    except Exception as e:
+        if not services.aba_inexistente(e): raise  # Cota/rede: não é motivo para criar a aba
+        ws = services.retry_api(planilha.add_worksheet, ABA_ARQUIVO, 1000, len(services.COLS_DADOS))
+        services.retry_api(ws.append_row, services.COLS_DADOS)
+    for a in range(0, len(linhas), services.TAM_BLOCO_UPLOAD):
+        services.retry_api(ws.append_rows, linhas[a:a + services.TAM_BLOCO_UPLOAD])
+
+def _blocos_contiguos(linhas):
+    # [5, 6, 7, 10] -> [(10, 10), (5, 7)]: de baixo para cima, assim apagar um bloco não mexe nos de cima
+    blocos = []
+    for l in sorted(linhas):
+        if blocos and l == blocos[-1][1] + 1: blocos[-1] = (blocos[-1][0], l)
+        else: blocos.append((l, l))
+    return blocos[::-1]
+
+def _apagar_linhas_dos_projetos(ws, ids, trava):
+    # Apaga só as linhas dos projetos (coluna A relida agora), sem regravar o resto da aba:
+    # reservas, leases e uploads de outras réplicas nas outras linhas continuam valendo.
+    # Os números de linha só valem para quem tem a trava: outro arquivamento apagando
+    # junto faria estes apontarem para linhas de outros projetos.
+    trava.conferir()
+    col_a = services.retry_api(ws.col_values, 1) or []
+    blocos = _blocos_contiguos(i + 1 for i, v in enumerate(col_a) if i > 0 and str(v) in ids)
+    for ini, fim in blocos:
+        trava.conferir()
+        services.retry_api(ws.delete_rows, ini, fim)
+    return sum(fim - ini + 1 for ini, fim in blocos)
+
+def _corrigir_faixas(ws_l, ws_d, rotas):
+    # Depois de apagar linhas de dados_brutos: regrava só G:H dos lotes de lá que mudaram de lugar
+    dados = services.retry_api(ws_d.get, "A2:B") or []
+    faixas = {}
+    for i, l in enumerate(dados):
+        l = (list(l) + ["", ""])[:2]
+        ini, _ = faixas.get((l[0], l[1]), (i + 2, i + 2))
+        faixas[(l[0], l[1])] = (ini, i + 2)
+    ctrl = services.retry_api(ws_l.get, "A2:H") or []
+    updates = []
+    for i, l in enumerate(ctrl):
+        l = (list(l) + [""] * 8)[:8]
+        nova = faixas.get((l[0], l[1]))
+        if not nova or rotas.get(l[0], services.ABA_DADOS_PADRAO) != services.ABA_DADOS_PADRAO: continue
+        if [str(l[6]), str(l[7])] != [str(nova[0]), str(nova[1])]:
+            updates.append({'range': f"G{i + 2}:H{i + 2}", 'values': [list(nova)]})
+    if updates: services.retry_api(ws_l.batch_update, updates)
+
+def _cabecalho_arquivo(id_p):
+    with gzip.open(_arquivo_projeto(id_p), "rt", encoding="utf-8") as f: return json.loads(f.readline())
+
+def _largura(linhas, n):
+    return [(list(l) + [""] * n)[:n] for l in linhas]
+
+def arquivar(ids):
+    # Retorna a lista de ids arquivados. Projetos que não estão 100% concluídos são ignorados.
+    if services.backend_local(): raise Exception("Arquivamento só funciona com o backend Google Sheets.")
+    ids = {str(i) for i in ids}
+    if not ids: return []
+    fila_salvamento.get_fila().descarregar()
+    # Uma réplica arquivando por vez. Sem cache compartilhado, a trava fica no
+    # disco local (vale entre os processos que dividem o DIR_LOCAL).
+    comp = services.cache_compartilhado() or CacheDisco(services.caminho_local("cache"))
+    with _lock, TravaLonga(comp, "arquivamento") as trava:
+        if not trava.ativa: raise Exception("Outro processo está arquivando agora. Tente de novo depois.")
+        ss = services.abrir_planilha()
+        ws_p = services.abrir_aba(ss, "projetos")
+        ws_l = services.abrir_aba(ss, "controle_lotes")
+        services.garantir_coluna_destino(ws_p)
+        services.garantir_colunas_controle(ws_l)
+        proj = services.retry_api(ws_p.get_all_values) or [[]]
+        ctrl = services.retry_api(ws_l.get_all_values) or [[]]
+        cab_p, linhas_p = proj[0], _largura(proj[1:], 6)
+        cab_l, linhas_l = ctrl[0], _largura(ctrl[1:], 9)
+
+        # 1. Confere de novo na planilha (não no cache) e grava os arquivos locais
+        destinos, arquivados = {}, []
+        indice = projetos_arquivados()
+        for id_p in sorted(ids):
+            if esta_arquivado(id_p):
+                # Arquivamento anterior que parou no meio: só falta tirar das abas
+                destinos[id_p] = _cabecalho_arquivo(id_p).get('destino') or services.ABA_DADOS_PADRAO
+                arquivados.append(id_p)
+                continue
+            lotes = [dict(zip(cab_l, l)) for l in linhas_l if l[0] == id_p]
+            if not lotes or any(l.get('status') != 'Concluído' for l in lotes): continue
+            registro = next((dict(zip(cab_p, p)) for p in linhas_p if p[0] == id_p), None)
+            if not registro: continue
+            destino = str(registro.get('aba_dados') or "").strip() or services.ABA_DADOS_PADRAO
+            linhas = _linhas_do_projeto(services.abrir_aba_dados(ss, destino), id_p)
+            esperado = _total_esperado(lotes)
+            if esperado is not None and len(linhas) != esperado:
+                print(f"⚠️ Projeto {id_p}: {len(linhas)} linhas lidas, {esperado} esperadas. Não arquivado.")
+                continue
+            _gravar_arquivo(id_p, {'projeto': registro, 'lotes': lotes, 'destino': destino}, linhas)
+            if PLANILHA_ARQUIVO: _copiar_para_planilha_arquivo(ss, linhas)
+            indice[id_p] = {'nome': registro.get('nome', ''), 'data': registro.get('data', ''),
+                            'total_lotes': len(lotes), 'linhas': len(linhas),
+                            'arquivado_em': datetime.now(services.TZ_BRASIL).strftime(services.FMT_LEASE)}
+            _salvar_indice(indice)
+            destinos[id_p] = destino
+            arquivados.append(id_p)
+        if not arquivados: return []
+
+        # 2. Dados: shard próprio é apagado; em dados_brutos saem só as linhas do projeto
+        compartilhados = {i for i in arquivados if destinos[i] == services.ABA_DADOS_PADRAO}
+        em_uso = {l[0] for l in linhas_l if l[2] == 'Em Andamento'}
+        rotas = {p[0]: (str(p[5]).strip() or services.ABA_DADOS_PADRAO) for p in linhas_p}
+        if compartilhados and any(rotas.get(i) == services.ABA_DADOS_PADRAO for i in em_uso):
+            # Apagar linhas de dados_brutos muda as linhas de quem está trabalhando nela: fica para depois
+            print("⏸️ Há lotes em andamento em dados_brutos: projetos de lá ficam só no arquivo por enquanto.")
+            arquivados = [i for i in arquivados if i not in compartilhados]
+            compartilhados = set()
+        for id_p in arquivados:
+            destino = destinos[id_p]
+            if destino == services.ABA_DADOS_PADRAO: continue
+            trava.conferir()
+            try: ws_d = services.abrir_aba_dados(ss, destino)
+            except Exception: ws_d = None  # Shard já apagado numa tentativa anterior
+            if ws_d is not None:
+                if "/" in destino: services.retry_api(ss.client.del_spreadsheet, destino.split("/", 1)[0])
+                else: services.retry_api(ss.del_worksheet, ws_d)
+            with services._lock_ws_dados: services._ws_dados.pop(destino, None)
+            snapshot_dados.apagar(destino)
+        if compartilhados:
+            ws_d = services.abrir_aba_dados(ss, services.ABA_DADOS_PADRAO)
+            _apagar_linhas_dos_projetos(ws_d, compartilhados, trava)
+
+        # 3. Controle e projetos: só as linhas dos arquivados saem (faixas de dados_brutos corrigidas)
+        saem = set(arquivados)
+        _apagar_linhas_dos_projetos(ws_l, saem, trava)
+        _apagar_linhas_dos_projetos(ws_p, saem, trava)
+        if compartilhados:
+            trava.conferir()
+            _corrigir_faixas(ws_l, ws_d, rotas)
+
+        services.invalidar_cache()
+        services.marcar_alteracao("projetos", "controle_lotes")
+        print(f"🗃️ {len(arquivados)} projeto(s) arquivado(s): {', '.join(arquivados)}")
+        return arquivados
+
+# --- AGENDAMENTO ---
+def _loop():
+    while True:
+        time.sleep(INTERVALO_AUTO_H * 3600)
+        try:
+            ids = [p['id'] for p in projetos_arquivaveis()]
+            if ids: arquivar(ids)
+        except Exception as e:
+            print(f"Erro no arquivamento automático: {e}")
+
+# Uma thread por processo, só se COLETA_ARQUIVAMENTO_H > 0
+@st.cache_resource
+def iniciar_agendamento():
+    if INTERVALO_AUTO_H <= 0 or services.backend_local(): return False
+    threading.Thread(target=_loop, name="arquivamento", daemon=True).start()
+    return True
@@ -0,0 +1,198 @@
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# --- CACHE ENTRE PROCESSOS ---
+# Com várias réplicas do Streamlit, cada processo tem o próprio cache das
+# abas de controle e todos disputam a mesma cota do Google. Esta camada guarda
+# a última cópia de cada aba num lugar comum (disco local ou Redis) e usa uma
+# trava por aba ("single-flight"): só um processo busca a aba; os outros
+# esperam e leem o que ele gravou. Ligada por COLETA_CACHE_COMPARTILHADO:
+#   "disco"               -> arquivos em DIR_LOCAL/cache (réplicas na mesma máquina)
+#   "redis://host:6379/0" -> Redis (precisa do pacote redis)
+# RedisMemoria imita o pedaço do cliente redis usado aqui, para testes.
+
+ESPERA_TRAVA = 30    # segundos esperando outro processo terminar a busca
+VALIDADE_TRAVA = 60  # trava de processo que morreu no meio expira sozinha
+
+class CacheDisco:
+    def __init__(self, pasta):
+        self.pasta = pasta
+        os.makedirs(pasta, exist_ok=True)
+
+    def _arq(self, nome):
+        return os.path.join(self.pasta, f"{nome}.json")
+
+    def ler(self, nome):
+        try:
+            with open(self._arq(nome), encoding="utf-8") as f: return json.load(f)
+        except (FileNotFoundError, ValueError): return None
+
+    def gravar(self, nome, valor):
+        tmp = f"{self._arq(nome)}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f: json.dump(valor, f, ensure_ascii=False)
+        os.replace(tmp, self._arq(nome))
+
+    def apagar(self, nome):
+        try: os.remove(self._arq(nome))
+        except FileNotFoundError: pass
+
+    def _dono(self, caminho):
+        try:
+            with open(caminho, encoding="utf-8") as f: return f.read()
+        except FileNotFoundError: return None
+
+    def adquirir(self, nome, espera):
+        # Arquivo .lock criado com O_EXCL: só um processo consegue. Dentro vai o token do dono.
+        caminho = self._arq(nome) + ".lock"
+        token = uuid.uuid4().hex
+        limite = time.time() + espera
+        while True:
+            try:
+                fd = os.open(caminho, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                with os.fdopen(fd, "w", encoding="utf-8") as f: f.write(token)
+                return token
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(caminho) > VALIDADE_TRAVA: os.remove(caminho)
+                except FileNotFoundError: pass
+            if time.time() > limite: return None
+            time.sleep(0.1)
+
+    def renovar(self, nome, token):
+        # False se a trava venceu e passou para outro processo
+        caminho = self._arq(nome) + ".lock"
+        if self._dono(caminho) != token: return False
+        os.utime(caminho)
+        return True
+
+    def liberar(self, nome, token):
+        caminho = self._arq(nome) + ".lock"
+        if self._dono(caminho) != token: return
+        try: os.remove(caminho)
+        except FileNotFoundError: pass
+
+class CacheRedis:
+    def __init__(self, cliente, prefixo="coleta:"):
+        self.r = cliente
+        self.prefixo = prefixo
+
+    def ler(self, nome):
+        bruto = self.r.get(self.prefixo + nome)
+        return json.loads(bruto) if bruto else None
+
+    def gravar(self, nome, valor):
+        self.r.set(self.prefixo + nome, json.dumps(valor, ensure_ascii=False))
+
+    def apagar(self, nome):
+        self.r.delete(self.prefixo + nome)
+
+    def adquirir(self, nome, espera):
+        token = uuid.uuid4().hex
+        limite = time.time() + espera
+        while True:
+            if self.r.set(f"{self.prefixo}trava:{nome}", token, nx=True, px=VALIDADE_TRAVA * 1000): return token
+            if time.time() > limite: return None
+            time.sleep(0.1)
+
+    def renovar(self, nome, token):
+        chave = f"{self.prefixo}trava:{nome}"
+        atual = self.r.get(chave)
+        if atual is None or (atual.decode() if isinstance(atual, bytes) else atual) != token: return False
+        self.r.set(chave, token, px=VALIDADE_TRAVA * 1000)
+        return True
+
+    def liberar(self, nome, token):
+        chave = f"{self.prefixo}trava:{nome}"
+        atual = self.r.get(chave)
+        if atual is not None and (atual.decode() if isinstance(atual, bytes) else atual) == token: self.r.delete(chave)
+
+class RedisMemoria:
+    # Cliente redis falso (get/set com nx e px/delete), compartilhado entre threads
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.dados = {}  # chave -> (valor, expira_em ou None)
+
+    def _vivo(self, chave):
+        item = self.dados.get(chave)
+        if item and item[1] is not None and item[1] < time.time():
+            del self.dados[chave]
+            return None
+        return item
+
+    def get(self, chave):
+        with self.lock:
+            item = self._vivo(chave)
+            return item[0] if item else None
+
+    def set(self, chave, valor, nx=False, px=None):
+        with self.lock:
+            if nx and self._vivo(chave): return None
+            self.dados[chave] = (valor, time.time() + px / 1000 if px else None)
+            return True
+
+    def delete(self, chave):
+        with self.lock: return 1 if self.dados.pop(chave, None) else 0
+
+def criar(config, pasta):
+    if not config: return None
+    if config == "disco": return CacheDisco(pasta)
+    if config == "memoria": return CacheRedis(RedisMemoria())
+    import redis
+    return CacheRedis(redis.Redis.from_url(config))
+
+@contextmanager
+def exclusivo(cache, nome):
+    # Rende True se conseguiu a trava; sem trava (timeout) o chamador busca mesmo assim
+    token = cache.adquirir(nome, ESPERA_TRAVA)
+    try: yield token is not None
+    finally:
+        if token: cache.liberar(nome, token)
+
+class TravaLonga:
+    # Trava para trabalhos mais longos que VALIDADE_TRAVA (ex.: arquivamento):
+    # uma thread renova a trava enquanto o bloco roda. 'ativa' fica False se
+    # não conseguiu a trava ou se ela foi perdida no meio (renovação falhou).
+    #   with TravaLonga(cache, "nome") as t:
+    #       if not t.ativa: return
+    #       ...; t.conferir()  # antes de cada passo que não pode rodar em dois processos
+    def __init__(self, cache, nome, espera=None):
+        self.cache, self.nome = cache, nome
+        self.espera = ESPERA_TRAVA if espera is None else espera
+        self.token = None
+        self.perdida = False
+        self._parar = threading.Event()
+
+    @property
+    def ativa(self):
+        return self.token is not None and not self.perdida
+
+    def conferir(self):
+        if not self.ativa: raise Exception(f"Trava '{self.nome}' não está mais com este processo.")
+
+    def _renovar(self):
+        while not self._parar.wait(VALIDADE_TRAVA / 3):
+            try: ok = self.cache.renovar(self.nome, self.token)
+            except Exception as e:
+                print(f"Erro ao renovar trava {self.nome}: {e}")
+                ok = False
+            if not ok:
+                self.perdida = True
+                return
+
+    def __enter__(self):
+        self.token = self.cache.adquirir(self.nome, self.espera)
+        if self.token:
+            self._thread = threading.Thread(target=self._renovar, name=f"trava_{self.nome}", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.token:
+            self._parar.set()
+            self._thread.join()
+            self.cache.liberar(self.nome, self.token)
+        return False
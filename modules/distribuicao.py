@@ -0,0 +1,185 @@
+import streamlit as st
+import threading
+import json
+import os
+import time
+from modules import services
+
+# --- DISTRIBUIÇÃO AUTOMÁTICA DE LOTES ---
+# Botão "Próximo lote": em vez de o operador escolher num selectbox (e a
+# reserva brigar com outro operador depois), o distribuidor mantém em memória
+# a fila de lotes livres de todos os projetos ativos, montada do cache de
+# controle_lotes, e entrega o melhor pela política. Pegar trabalho vira uma
+# reserva só (reservar_lote). Lote em andamento do próprio operador vem antes
+# de tudo. Critérios, na ordem configurada no painel admin:
+#   afinidade  -> mesmo grupo site/CEP do último lote do operador, depois o mesmo projeto
+#   prioridade -> prioridade do projeto (maior primeiro; padrão 0)
+#   fifo       -> projeto mais antigo primeiro, lotes em ordem
+# Configuração em DIR_LOCAL/distribuicao.json (vale para todos os processos).
+
+CRITERIOS = ["afinidade", "prioridade", "fifo"]
+VALIDADE_FILA_SEG = 15   # Depois disso a fila é remontada do cache
+VALIDADE_GRUPOS_SEG = 300  # Site/CEP dos lotes de um projeto é relido depois disso
+TENTATIVAS_RESERVA = 5   # Lotes tentados por pedido (outro processo pode ter pego)
+
+def _arquivo():
+    return services.caminho_local("distribuicao.json")
+
+def carregar_config():
+    try:
+        with open(_arquivo(), encoding="utf-8") as f: cfg = json.load(f)
+    except (FileNotFoundError, ValueError): cfg = {}
+    ordem = [c for c in cfg.get('ordem', CRITERIOS) if c in CRITERIOS]
+    return {'ordem': ordem or list(CRITERIOS), 'prioridades': {str(k): int(v) for k, v in cfg.get('prioridades', {}).items()}}
+
+def salvar_config(ordem, prioridades):
+    tmp = _arquivo() + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f: json.dump({'ordem': list(ordem), 'prioridades': prioridades}, f, ensure_ascii=False)
+    os.replace(tmp, _arquivo())
+    get_distribuidor().invalidar()
+
+def _grupos_do_projeto(id_p):
+    # lote -> "site|cep" da primeira linha do lote. None sem cópia local dos dados.
+    local = services.backend_local()
+    if local: linhas = local.iterar_linhas_projeto(id_p)
+    else:
+        from modules import snapshot_dados
+        if not snapshot_dados.disponivel(): return None
+        linhas = snapshot_dados.iterar_linhas(services.destino_dados_projeto(id_p), id_p)
+    i_lote, i_site, i_cep = (services.COLS_DADOS.index(c) for c in ("lote", "site", "cep"))
+    grupos = {}
+    for l in linhas: grupos.setdefault(str(l[i_lote]), f"{str(l[i_site]).strip().lower()}|{str(l[i_cep]).strip()}")
+    return grupos
+
+class Distribuidor:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.montada_em = 0
+        self.cfg = carregar_config()
+        self.livres = []        # [(id_p, lote, ordem do projeto)]
+        self.em_andamento = {}  # usuario -> [(id_p, lote)] com reserva válida
+        self.ultimo = {}        # usuario -> (id_p, lote) do último lote pego
+        self.grupos = {}        # id_p -> (lido em, {lote: grupo} ou None)
+
+    def invalidar(self):
+        with self.lock: self.montada_em = 0
+
+    def _ler(self):
+        # Fora do self.lock: os caches de projetos/controle_lotes podem ir à API
+        cfg = carregar_config()
+        livres, andamento, ultimo_planilha = [], {}, {}
+        projs = services.carregar_projetos_ativos()
+        for ordem, id_p in enumerate(projs['id'].astype(str) if not projs.empty else []):
+            lotes = services.carregar_lotes_do_projeto(id_p)
+            if lotes.empty: continue
+            for lote, status, usuario in zip(lotes['lote'], lotes['status'], lotes['usuario']):
+                try: num = int(lote)
+                except (TypeError, ValueError): continue
+                usuario = str(usuario or "")
+                if status == 'Livre': livres.append((id_p, num, ordem))
+                elif status == 'Em Andamento' and usuario: andamento.setdefault(usuario, []).append((id_p, num))
+                if usuario: ultimo_planilha[usuario] = (id_p, num)
+        ativos = set(projs['id'].astype(str)) if not projs.empty else set()
+        return cfg, livres, andamento, ultimo_planilha, ativos
+
+    def _atualizar(self):
+        # Remonta a fila vencida: lê sem a trava e troca o resultado com ela
+        with self.lock:
+            if time.time() - self.montada_em <= VALIDADE_FILA_SEG: return
+        cfg, livres, andamento, ultimo_planilha, ativos = self._ler()
+        with self.lock:
+            self.cfg, self.livres, self.em_andamento = cfg, livres, andamento
+            # Sem histórico neste processo, o último lote do operador vem da planilha
+            for usuario, item in ultimo_planilha.items(): self.ultimo.setdefault(usuario, item)
+            self.grupos = {k: v for k, v in self.grupos.items() if k in ativos}
+            self.montada_em = time.time()
+
+    def _faltam_grupos(self, usuario):
+        # Projetos que a afinidade vai consultar e cujos grupos faltam ou venceram. Chamar com self.lock.
+        # Só o projeto do último lote e o do melhor candidato de outro projeto: cada um custa
+        # uma varredura da cópia local dos dados (num processo novo, uma leitura da aba inteira).
+        ultimo = self.ultimo.get(usuario)
+        if "afinidade" not in self.cfg['ordem'] or not ultimo: return set()
+        if self.em_andamento.get(usuario): return set()  # Retomada: a afinidade nem entra
+        projetos = {ultimo[0]}
+        outros = [l for l in self.livres if l[0] != ultimo[0]]
+        if outros: projetos.add(min(outros, key=lambda item: self._chave(item, usuario))[0])
+        agora = time.time()
+        return {id_p for id_p in projetos if agora - self.grupos.get(id_p, (0, None))[0] > VALIDADE_GRUPOS_SEG}
+
+    def _carregar_grupos(self, ids):
+        # Fora do self.lock: cada projeto custa uma varredura da cópia local dos dados
+        novos = {}
+        for id_p in ids:
+            try: novos[id_p] = (time.time(), _grupos_do_projeto(id_p))
+            except Exception as e:
+                print(f"Distribuição: grupos do projeto {id_p} indisponíveis ({e})")
+                novos[id_p] = (time.time(), None)
+        with self.lock: self.grupos.update(novos)
+
+    def _grupo(self, id_p, lote):
+        # Só consulta o que _carregar_grupos já trouxe (nada é lido com self.lock)
+        return (self.grupos.get(id_p, (0, None))[1] or {}).get(str(lote))
+
+    def _afinidade(self, id_p, lote, ultimo):
+        # (0, 0) mesmo site/CEP, (1, distância) mesmo projeto, (2, 0) resto
+        if not ultimo: return (2, 0)
+        g = self._grupo(*ultimo)
+        if g and self._grupo(id_p, lote) == g: return (0, 0)
+        if id_p == ultimo[0]: return (1, abs(lote - ultimo[1]))
+        return (2, 0)
+
+    def _chave(self, item, usuario):
+        id_p, lote, ordem = item
+        partes = []
+        for crit in self.cfg['ordem']:
+            if crit == "afinidade": partes.append(self._afinidade(id_p, lote, self.ultimo.get(usuario)))
+            elif crit == "prioridade": partes.append(-self.cfg['prioridades'].get(id_p, 0))
+            elif crit == "fifo": partes.append((ordem, lote))
+        partes.append((ordem, lote))  # Desempate estável
+        return tuple(partes)
+
+    def _tirar(self, id_p, lote, usuario):
+        self.livres = [l for l in self.livres if (l[0], l[1]) != (id_p, lote)]
+        if usuario in self.em_andamento:
+            self.em_andamento[usuario] = [l for l in self.em_andamento[usuario] if l != (id_p, lote)]
+
+    def _escolher(self, usuario):
+        # (id_p, lote, retomar?) ou None. Chamar com self.lock.
+        meus = self.em_andamento.get(usuario)
+        if meus: return meus[0] + (True,)
+        if not self.livres: return None
+        id_p, lote, _ = min(self.livres, key=lambda item: self._chave(item, usuario))
+        return id_p, lote, False
+
+    def proximo(self, usuario):
+        # Reserva e devolve (id_p, lote, retomar?) para o operador, ou None se não há lote livre
+        for _ in range(TENTATIVAS_RESERVA):
+            self._atualizar()
+            with self.lock: faltam = self._faltam_grupos(usuario)
+            if faltam: self._carregar_grupos(faltam)
+            with self.lock:
+                escolha = self._escolher(usuario)
+                if not escolha: return None
+                id_p, lote, retomar = escolha
+                # Sai da fila antes de reservar: outro operador deste processo não recebe o mesmo lote
+                self._tirar(id_p, lote, usuario)
+            if services.reservar_lote(id_p, lote, usuario):
+                with self.lock: self.ultimo[usuario] = (id_p, lote)
+                return id_p, lote, retomar
+        return None
+
+    def registrar(self, id_p, lote, usuario):
+        # Lote pego pela escolha manual: sai da fila e conta para a afinidade
+        with self.lock:
+            self._tirar(str(id_p), int(lote), usuario)
+            self.ultimo[usuario] = (str(id_p), int(lote))
+
+    def tamanho(self):
+        self._atualizar()
+        with self.lock: return len(self.livres)
+
+# Uma fila por processo
+@st.cache_resource
+def get_distribuidor():
+    return Distribuidor()
@@ -0,0 +1,174 @@
+import streamlit as st
+import threading
+import os
+import re
+import time
+import zipfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from modules import services
+
+# --- EXPORTAÇÃO EM SEGUNDO PLANO ---
+# Cada pedido vira um trabalho num pool de threads: um projeto por tarefa,
+# vários em paralelo, e a tela só acompanha o progresso. Mais de um projeto
+# sai num .zip. O arquivo de cada projeto fica em DIR_LOCAL/exportacoes com a
+# versão dos dados no nome: pedir de novo um projeto que não mudou devolve o
+# arquivo pronto, sem baixar as linhas de novo (a versão ainda custa a
+# conferência do snapshot: colunas A e H:I da aba).
+# Versão antiga só é apagada se nenhum trabalho da lista a usa (zip ou
+# download) e ninguém a pediu em RETENCAO_VERSAO_SEG: cada uso toca o
+# arquivo, então o mtime é o último uso (vale também para outras réplicas).
+
+TRABALHADORES = int(os.environ.get("COLETA_EXPORT_WORKERS", 3))
+MAX_TRABALHOS = 20  # Trabalhos mantidos na lista (o .zip dos mais antigos é apagado)
+RETENCAO_VERSAO_SEG = 3600
+_lock_arquivos = threading.Lock()  # Uso de um arquivo do cache x limpeza das versões antigas
+
+def _pasta():
+    d = services.caminho_local("exportacoes")
+    os.makedirs(d, exist_ok=True)
+    return d
+
+def _nome_seguro(nome):
+    return re.sub(r'[\\/:*?"<>|]', "_", str(nome)).strip() or "projeto"
+
+def versao_dados(id_p):
+    # None = sem versão confiável: o arquivo é gerado de novo a cada pedido
+    from modules import arquivamento, snapshot_dados
+    if arquivamento.esta_arquivado(id_p):
+        return "arq" + re.sub(r"\D", "", arquivamento.projetos_arquivados().get(str(id_p), {}).get('arquivado_em', ""))
+    local = services.backend_local()
+    if local: return f"db{local.versao()}"
+    if snapshot_dados.disponivel():
+        try: return snapshot_dados.versao_projeto(services.destino_dados_projeto(id_p), id_p)
+        except Exception as e: print(f"Exportação: sem versão para {id_p} ({e})")
+    return None
+
+def _usar(arq):
+    # Marca o uso do arquivo (protege da limpeza). False se ele não existe mais.
+    try:
+        os.utime(arq)
+        return True
+    except FileNotFoundError: return False
+
+def _limpar_versoes(id_p, formato, atual, em_uso):
+    # Apaga versões antigas do projeto/formato sem uso recente. em_uso: caminhos que algum trabalho ainda usa.
+    agora = time.time()
+    with _lock_arquivos:
+        protegidos = set(em_uso()) | {atual}
+        for antigo in os.listdir(_pasta()):
+            caminho = os.path.join(_pasta(), antigo)
+            if not (antigo.startswith(f"{id_p}_") and antigo.endswith(f".{formato}")) or caminho in protegidos: continue
+            try:
+                if agora - os.path.getmtime(caminho) > RETENCAO_VERSAO_SEG: os.remove(caminho)
+            except FileNotFoundError: pass
+
+def gerar_projeto(id_p, formato, em_uso=set):
+    # (caminho do arquivo, veio do cache?)
+    versao = versao_dados(id_p)
+    nome = f"{id_p}_{versao or 'atual'}.{formato}"
+    arq = os.path.join(_pasta(), nome)
+    if versao:
+        with _lock_arquivos:
+            if _usar(arq): return arq, True
+    # Com versão, o snapshot acabou de ser conferido: baixar_excel não confere de novo
+    conteudo = services.baixar_excel(id_p, formato, conferido=versao is not None)
+    if not conteudo: raise Exception("Projeto sem dados ou erro na leitura.")
+    tmp = f"{arq}.{uuid.uuid4().hex[:6]}.tmp"
+    with open(tmp, "wb") as f: f.write(conteudo)
+    os.replace(tmp, arq)
+    _limpar_versoes(id_p, formato, arq, em_uso)
+    return arq, False
+
+class Trabalho:
+    def __init__(self, projetos, formato):
+        self.id = uuid.uuid4().hex[:8]
+        self.projetos = projetos  # [(id_p, nome)]
+        self.formato = formato
+        self.criado_em = datetime.now(services.TZ_BRASIL).strftime("%d/%m %H:%M:%S")
+        self.status = "Na fila"
+        self.feitos = 0
+        self.do_cache = 0
+        self.gerados = []   # [(nome, caminho)]
+        self.erros = {}     # nome -> mensagem
+        self.arquivo = None
+        self.nome_download = None
+
+class Exportador:
+    def __init__(self, trabalhadores):
+        self.pool = ThreadPoolExecutor(max_workers=trabalhadores, thread_name_prefix="exportacao")
+        self.lock = threading.Lock()
+        self.trabalhos = []  # Mais recente primeiro
+
+    def enviar(self, projetos, formato):
+        t = Trabalho(list(projetos), formato)
+        with self.lock:
+            self.trabalhos.insert(0, t)
+            for velho in self.trabalhos[MAX_TRABALHOS:]:
+                if velho.arquivo and velho.arquivo.endswith(".zip"):
+                    try: os.remove(velho.arquivo)
+                    except FileNotFoundError: pass
+            del self.trabalhos[MAX_TRABALHOS:]
+        for id_p, nome in t.projetos: self.pool.submit(self._projeto, t, id_p, nome)
+        return t
+
+    def _projeto(self, t, id_p, nome):
+        with self.lock: t.status = "Gerando"
+        try:
+            arq, do_cache = gerar_projeto(id_p, t.formato, self._em_uso)
+            with self.lock:
+                t.gerados.append((nome, arq))
+                t.do_cache += do_cache
+        except Exception as e:
+            print(f"Erro ao exportar {id_p}: {e}")
+            with self.lock: t.erros[nome] = str(e)
+        with self.lock:
+            t.feitos += 1
+            ultimo = t.feitos == len(t.projetos)
+        if ultimo: self._finalizar(t)
+
+    def _finalizar(self, t):
+        try:
+            if not t.gerados: raise Exception("nenhum projeto exportado")
+            if len(t.projetos) == 1:
+                nome, arq = t.gerados[0]
+                nome_download = f"{_nome_seguro(nome)}.{t.formato}"
+            else:
+                # csv comprime bem; xlsx e parquet já são comprimidos
+                modo = zipfile.ZIP_DEFLATED if t.formato == "csv" else zipfile.ZIP_STORED
+                arq = os.path.join(_pasta(), f"trabalho_{t.id}.zip")
+                usados = set()
+                with zipfile.ZipFile(arq, "w", modo) as z:
+                    for nome, caminho in t.gerados:
+                        interno = f"{_nome_seguro(nome)}.{t.formato}"
+                        if interno in usados: interno = f"{_nome_seguro(nome)}_{os.path.basename(caminho).split('_')[0]}.{t.formato}"
+                        usados.add(interno)
+                        z.write(caminho, interno)
+                nome_download = f"exportacao_{datetime.now(services.TZ_BRASIL).strftime('%Y%m%d_%H%M')}.zip"
+            with self.lock:
+                t.arquivo, t.nome_download = arq, nome_download
+                t.status = "Pronto com erros" if t.erros else "Pronto"
+        except Exception as e:
+            print(f"Erro ao finalizar exportação {t.id}: {e}")
+            with self.lock: t.status = f"Erro: {e}"
+
+    def _em_uso(self):
+        # Arquivos de projeto que os trabalhos da lista ainda vão zipar ou servir
+        with self.lock: return {caminho for t in self.trabalhos for _, caminho in t.gerados}
+
+    def listar(self):
+        # Cópia do estado para a tela (as threads continuam mexendo nos objetos)
+        with self.lock:
+            return [{'id': t.id, 'criado_em': t.criado_em, 'formato': t.formato, 'status': t.status,
+                     'total': len(t.projetos), 'feitos': t.feitos, 'do_cache': t.do_cache,
+                     'erros': dict(t.erros), 'arquivo': t.arquivo, 'nome_download': t.nome_download}
+                    for t in self.trabalhos]
+
+    def pendentes(self):
+        with self.lock: return sum(1 for t in self.trabalhos if t.status in ("Na fila", "Gerando"))
+
+# Um pool por processo
+@st.cache_resource
+def get_exportador():
+    return Exportador(TRABALHADORES)
@@ -0,0 +1,176 @@
+import streamlit as st
+import threading
+import json
+import os
+import time
+from collections import Counter, OrderedDict
+from modules import services, journal_local
+
+# --- FILA DE SALVAMENTO (WRITE-BEHIND) ---
+# O callback do data_editor só enfileira. Uma thread por processo junta as
+# edições, mantém apenas o último valor de cada célula H{linha} e envia em
+# batch_update. O que ainda não foi enviado fica num journal local, para
+# sobreviver a uma queda do servidor (um journal por processo; ver
+# modules/journal_local.py). As células são identificadas por
+# (id_projeto, linha): cada projeto pode ter o próprio shard de dados.
+
+INTERVALO_ENVIO = 1.0      # segundos entre envios
+MAX_CELULAS_ENVIO = 500    # células por batch_update
+MAX_ESPERA_ERRO = 30       # teto do backoff quando o Google falha
+MAX_CONFIRMADOS = 100000   # células confirmadas lembradas (para o sync diferencial)
+
+class FilaSalvamento:
+    def __init__(self, arquivo_journal):
+        self.arquivo_journal = arquivo_journal
+        self.lock = threading.Lock()
+        self.evento = threading.Event()
+        self.pendentes = {}   # (id_projeto, linha) -> {'link', 'id_linha', 'ean', 'site', 'id_projeto', 'lote'}
+        self.em_envio = {}    # (id_projeto, linha) -> item (já saiu da fila, aguardando o Google)
+        self.confirmados = OrderedDict()  # (id_projeto, linha) -> último link gravado com sucesso
+        self.enviados = 0
+        self.descartados = Counter()  # (id_projeto, lote) -> links sem linha na aba (linha apagada)
+        self.ultimo_envio = None
+        self.ultimo_erro = ""
+        self._carregar_journal()
+        self.thread = threading.Thread(target=self._loop, name="fila_salvamento", daemon=True)
+        self.thread.start()
+
+    # --- JOURNAL ---
+    def _carregar_journal(self):
+        # O próprio journal e os de processos que morreram (adotados e apagados)
+        orfaos = journal_local.orfaos(self.arquivo_journal)
+        for arq in [self.arquivo_journal] + orfaos:
+            try:
+                with open(arq, encoding="utf-8") as f:
+                    dados = json.load(f)
+                # Chave "id_projeto|linha" (journal antigo: só a linha)
+                for k, v in dados.items(): self.pendentes.setdefault((v['id_projeto'], int(k.split("|")[-1])), v)
+            except FileNotFoundError: pass
+            except Exception as e:
+                print(f"Erro ao ler journal da fila ({os.path.basename(arq)}): {e}")
+        if orfaos:
+            with self.lock: gravou = self._gravar_journal()
+            # Só apaga os adotados depois que o conteúdo está no journal deste processo
+            if gravou:
+                for arq in orfaos: journal_local.liberar(arq)
+        if self.pendentes:
+            print(f"♻️ Recuperadas {len(self.pendentes)} edições não enviadas do journal.")
+            self.evento.set()
+
+    def _gravar_journal(self):
+        # Chamar com o lock. Grava pendentes + em envio (escrita atômica via rename).
+        dados = {f"{i}|{l}": v for (i, l), v in {**self.em_envio, **self.pendentes}.items()}
+        tmp = self.arquivo_journal + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(dados, f)
+            os.replace(tmp, self.arquivo_journal)
+            return True
+        except Exception as e:
+            print(f"Erro ao gravar journal da fila: {e}")
+            return False
+
+    # --- API ---
+    def enfileirar(self, id_projeto, numero_lote, alteracoes):
+        if not alteracoes: return
+        with self.lock:
+            for item in alteracoes:
+                # Mesma célula editada várias vezes: fica só o último valor
+                self.pendentes[(str(id_projeto), int(item['indice_excel']))] = {
+                    'link': item['link'],
+                    'id_linha': str(item.get('id_linha') or ""),
+                    'ean': str(item.get('ean') or ""),
+                    'site': str(item.get('site') or ""),
+                    'id_projeto': str(id_projeto),
+                    'lote': str(numero_lote)
+                }
+            self._gravar_journal()
+        self.evento.set()
+
+    def status(self, id_projeto=None, numero_lote=None):
+        with self.lock:
+            itens = list(self.pendentes.values()) + list(self.em_envio.values())
+            if id_projeto is not None:
+                itens = [i for i in itens if i['id_projeto'] == str(id_projeto) and (numero_lote is None or i['lote'] == str(numero_lote))]
+            descartados = sum(n for (i, l), n in self.descartados.items()
+                              if id_projeto is None or (i == str(id_projeto) and (numero_lote is None or l == str(numero_lote))))
+            return {
+                'pendentes': len(itens),
+                'descartados': descartados,
+                'enviados': self.enviados,
+                'ultimo_envio': self.ultimo_envio,
+                'ultimo_erro': self.ultimo_erro
+            }
+
+    def confirmados_de(self, id_projeto, linhas):
+        # {linha: link} das células do projeto que a fila já gravou no Sheets
+        id_projeto = str(id_projeto)
+        with self.lock:
+            return {l: self.confirmados[(id_projeto, l)] for l in linhas if (id_projeto, l) in self.confirmados}
+
+    def descarregar(self, timeout=15):
+        # Bloqueia até a fila esvaziar (usado antes de Checkpoint/Entrega)
+        limite = time.time() + timeout
+        self.evento.set()
+        while time.time() < limite:
+            with self.lock:
+                if not self.pendentes and not self.em_envio: return True
+            time.sleep(0.2)
+        return False
+
+    # --- THREAD ---
+    def _loop(self):
+        espera = INTERVALO_ENVIO
+        while True:
+            self.evento.wait(espera)
+            self.evento.clear()
+            ok = self._enviar()
+            espera = INTERVALO_ENVIO if ok else min(espera * 2, MAX_ESPERA_ERRO)
+
+    def _enviar(self):
+        with self.lock:
+            if not self.pendentes: return True
+            # Um envio por projeto (cada projeto pode estar num shard diferente)
+            chaves = sorted(self.pendentes)[:MAX_CELULAS_ENVIO]
+            id_envio = chaves[0][0]
+            for chave in chaves:
+                if chave[0] == id_envio: self.em_envio[chave] = self.pendentes.pop(chave)
+            lote_envio = dict(self.em_envio)
+
+        alteracoes = [{'indice_excel': linha, 'id_linha': item.get('id_linha', ""), 'ean': item.get('ean', ""),
+                       'site': item.get('site', ""), 'link': item['link']} for (_, linha), item in lote_envio.items()]
+        perdidos = []
+        try:
+            ok = services.salvar_lote_links(id_envio, None, alteracoes, perdidos)
+        except Exception as e:
+            ok = False
+            self.ultimo_erro = str(e)
+
+        with self.lock:
+            for chave, item in lote_envio.items():
+                self.em_envio.pop(chave, None)
+                # Se falhou, devolve para a fila (a não ser que já exista edição mais nova)
+                if not ok and chave not in self.pendentes:
+                    self.pendentes[chave] = item
+            if ok:
+                perdidos = set(perdidos)
+                for item in lote_envio.values():
+                    if item.get('id_linha') in perdidos: self.descartados[(item['id_projeto'], item['lote'])] += 1
+                for chave, item in lote_envio.items():
+                    self.confirmados[chave] = str(item['link'] or "")
+                    self.confirmados.move_to_end(chave)
+                while len(self.confirmados) > MAX_CONFIRMADOS: self.confirmados.popitem(last=False)
+                self.enviados += len(lote_envio)
+                self.ultimo_envio = time.time()
+                self.ultimo_erro = ""
+            elif not self.ultimo_erro:
+                self.ultimo_erro = "Falha ao enviar links"
+            self._gravar_journal()
+            tem_mais = bool(self.pendentes)
+        if ok and tem_mais: self.evento.set()
+        return ok
+
+# Uma fila por processo do Streamlit
+@st.cache_resource
+def get_fila():
+    return FilaSalvamento(journal_local.arquivo_do_processo("fila_links.json"))
@@ -0,0 +1,54 @@
+import glob
+import os
+import socket
+from modules import services
+try: import fcntl
+except ImportError: fcntl = None  # Windows: sem trava, vale o comportamento de processo único
+
+# --- ARQUIVOS DE RECUPERAÇÃO POR PROCESSO ---
+# O journal da fila de links e o spool do log de tempo ficam em DIR_LOCAL,
+# que pode ser o mesmo para várias réplicas (COLETA_CACHE_COMPARTILHADO=disco).
+# Cada processo grava no próprio arquivo (<nome>.<host>-<pid><ext>) e segura
+# uma trava (flock no ".lock" ao lado) enquanto vive. Ao subir, o processo
+# adota os arquivos cuja trava está livre (o dono morreu), inclusive o
+# arquivo antigo de nome fixo, e apaga cada um depois de regravar o conteúdo
+# no seu. O SO solta o flock quando o processo morre, até por kill -9.
+
+_travas = {}  # caminho -> descritor do .lock (a trava vale enquanto ele estiver aberto)
+_nomes = {}   # arquivo do processo -> nome base (para achar os órfãos)
+
+def _travar(caminho):
+    # True se pegou a trava exclusiva do arquivo, sem esperar
+    if caminho in _travas: return True
+    fd = os.open(caminho + ".lock", os.O_CREAT | os.O_RDWR)
+    if fcntl is not None:
+        try: fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+    _travas[caminho] = fd
+    return True
+
+def arquivo_do_processo(nome):
+    base, ext = os.path.splitext(nome)
+    caminho = services.caminho_local(f"{base}.{socket.gethostname()}-{os.getpid()}{ext}")
+    _travar(caminho)
+    _nomes[caminho] = nome
+    return caminho
+
+def orfaos(proprio):
+    # Arquivos de processos mortos do mesmo nome base, já travados por este processo.
+    # Depois de regravar o conteúdo, o chamador devolve cada um com liberar().
+    nome = _nomes.get(proprio)
+    if not nome: return []
+    base, ext = os.path.splitext(services.caminho_local(nome))
+    candidatos = [base + ext] + sorted(glob.glob(f"{glob.escape(base)}.*{ext}"))
+    return [c for c in candidatos if c != proprio and os.path.exists(c) and _travar(c)]
+
+def liberar(caminho):
+    # Apaga o arquivo adotado e solta a trava dele
+    for arq in (caminho, caminho + ".lock"):
+        try: os.remove(arq)
+        except FileNotFoundError: pass
+    fd = _travas.pop(caminho, None)
+    if fd is not None: os.close(fd)
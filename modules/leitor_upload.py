@@ -0,0 +1,86 @@
+import codecs
+import csv
+import io
+import pandas as pd
+from modules import services
+
+# --- LEITURA DO UPLOAD EM BLOCOS ---
+# O arquivo do admin é lido aos pedaços: .xlsx pelo openpyxl em modo
+# read_only (linha a linha, sem montar a planilha inteira) e .csv pelo
+# read_csv com chunksize. Cada bloco sai como DataFrame de texto já limpo
+# ("nan"/"None" viram ""), com as colunas na posição do modelo. A memória
+# fica no tamanho do bloco, não do arquivo.
+
+COLS_MODELO = ["Site*", "Descrição*", "EAN*", "Quantidade no Lote*", "CEP", "Endereço"]
+MIN_COLUNAS = 3  # Site, Descrição e EAN são obrigatórias
+VAZIOS = ["nan", "None", "NaT", "<NA>"]
+
+def _nome_coluna(c):
+    return services.remove_accents(str(c or "")).replace("*", "").strip().lower()
+
+def validar_cabecalho(cabecalho):
+    # Erro se faltam colunas obrigatórias; nomes diferentes do modelo só geram aviso
+    cabecalho = list(cabecalho)
+    while cabecalho and not str(cabecalho[-1] or "").strip(): cabecalho.pop()
+    if len(cabecalho) < MIN_COLUNAS: raise ValueError("Excel inválido (poucas colunas).")
+    return [f"Coluna {i + 1}: esperado '{m}', veio '{c}'" for i, (c, m) in enumerate(zip(cabecalho, COLS_MODELO))
+            if _nome_coluna(c) != _nome_coluna(m)]
+
+def _texto(v):
+    # Mesmo resultado do read_excel(dtype=str): número inteiro sem ".0"
+    if v is None: return ""
+    if isinstance(v, float) and v.is_integer(): return str(int(v))
+    return str(v)
+
+def _normalizar(df, largura):
+    df = df.iloc[:, :largura].astype(str).mask(lambda d: d.isin(VAZIOS), "")
+    for i in range(len(df.columns), largura): df[f"_col{i}"] = ""
+    df.columns = range(largura)
+    return df[df.apply(lambda c: c.str.strip() != "").any(axis=1)]  # Linha toda em branco fica de fora
+
+def _blocos_xlsx(arq, tam_bloco, avisos):
+    from openpyxl import load_workbook
+    wb = load_workbook(arq, read_only=True, data_only=True)
+    try:
+        linhas = wb.worksheets[0].iter_rows(values_only=True)
+        avisos.extend(validar_cabecalho(next(linhas, ())))
+        largura = len(COLS_MODELO)
+        bloco = []
+        for linha in linhas:
+            bloco.append([_texto(v) for v in (list(linha) + [None] * largura)[:largura]])
+            if len(bloco) == tam_bloco:
+                yield _normalizar(pd.DataFrame(bloco), largura)
+                bloco = []
+        if bloco: yield _normalizar(pd.DataFrame(bloco), largura)
+    finally: wb.close()
+
+def _blocos_csv(arq, tam_bloco, avisos):
+    amostra = arq.read(64 * 1024)
+    arq.seek(0)
+    try:
+        codecs.getincrementaldecoder("utf-8-sig")().decode(amostra, final=False)  # A amostra pode cortar um caractere no fim
+        codificacao = "utf-8-sig"
+    except UnicodeDecodeError: codificacao = "latin-1"  # Excel brasileiro salva CSV em Windows-1252
+    try: sep = csv.Sniffer().sniff(amostra.decode(codificacao, errors="ignore"), delimiters=";,\t").delimiter
+    except csv.Error: sep = ";"
+    leitor = pd.read_csv(io.TextIOWrapper(arq, encoding=codificacao, newline=""), sep=sep, dtype=str,
+                         keep_default_na=False, chunksize=tam_bloco, skip_blank_lines=True)
+    primeiro = True
+    for bloco in leitor:
+        if primeiro:
+            avisos.extend(validar_cabecalho(bloco.columns))
+            primeiro = False
+        yield _normalizar(bloco, len(COLS_MODELO))
+
+def ler_blocos(origem, nome_arq, tam_bloco, avisos=None):
+    # Gera DataFrames de até tam_bloco linhas, colunas 0-5 na ordem do modelo.
+    # origem: arquivo enviado (.xlsx ou .csv) ou um DataFrame já carregado.
+    avisos = [] if avisos is None else avisos
+    if isinstance(origem, pd.DataFrame):
+        avisos.extend(validar_cabecalho(origem.columns))
+        for ini in range(0, len(origem), tam_bloco):
+            yield _normalizar(origem.iloc[ini:ini + tam_bloco], len(COLS_MODELO))
+    elif str(nome_arq).lower().endswith(".csv"):
+        yield from _blocos_csv(origem, tam_bloco, avisos)
+    else:
+        yield from _blocos_xlsx(origem, tam_bloco, avisos)
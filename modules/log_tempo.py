@@ -0,0 +1,117 @@
+import streamlit as st
+import threading
+import json
+import os
+from modules import services, journal_local
+
+# --- ESCRITOR DE LOG DE TEMPO (registro_tempo) ---
+# salvar_log_tempo só coloca o evento no buffer (e no spool em disco). Uma
+# thread junta os eventos e grava com um único append_rows, por tempo ou
+# quando o buffer enche. Se o Google falhar, os eventos continuam no spool e
+# vão na próxima tentativa, inclusive depois de reiniciar o servidor (um
+# spool por processo; ver modules/journal_local.py).
+
+CABECALHO = ["id", "lote", "data", "responsavel", "h_ini", "h_fim", "duracao", "projeto", "desc", "id_projeto"]
+INTERVALO_FLUSH = 10     # segundos
+MAX_BUFFER = 50          # eventos; acima disso o flush é imediato
+MAX_ESPERA_ERRO = 300    # teto do backoff
+
+class EscritorLog:
+    def __init__(self, arquivo_spool):
+        self.arquivo_spool = arquivo_spool
+        self.lock = threading.Lock()
+        self.evento = threading.Event()
+        self.buffer = []
+        self.ws = None          # Handle da aba, para não chamar worksheet() a cada evento
+        self.gravados = 0
+        self.falhas = 0
+        self.ultimo_erro = ""
+        self._carregar_spool()
+        threading.Thread(target=self._loop, name="log_tempo", daemon=True).start()
+
+    def _carregar_spool(self):
+        # O próprio spool e os de processos que morreram (adotados e apagados)
+        orfaos = journal_local.orfaos(self.arquivo_spool)
+        for arq in [self.arquivo_spool] + orfaos:
+            try:
+                with open(arq, encoding="utf-8") as f:
+                    self.buffer += [json.loads(l) for l in f if l.strip()]
+            except FileNotFoundError: pass
+            except Exception as e:
+                print(f"Erro ao ler spool de tempo ({os.path.basename(arq)}): {e}")
+        if orfaos:
+            try:
+                with self.lock: self._reescrever_spool()
+                for arq in orfaos: journal_local.liberar(arq)
+            except Exception as e:
+                print(f"Erro ao gravar spool de tempo: {e}")
+        if self.buffer: print(f"♻️ {len(self.buffer)} registro(s) de tempo recuperados do spool.")
+
+    def _reescrever_spool(self):
+        # Chamar com o lock
+        tmp = self.arquivo_spool + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for linha in self.buffer: f.write(json.dumps(linha, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.arquivo_spool)
+
+    def registrar(self, linha):
+        with self.lock:
+            self.buffer.append(linha)
+            try:
+                with open(self.arquivo_spool, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(linha, ensure_ascii=False) + "\n")
+            except Exception as e:
+                print(f"Erro ao gravar spool de tempo: {e}")
+            cheio = len(self.buffer) >= MAX_BUFFER
+        if cheio: self.evento.set()
+
+    def status(self):
+        with self.lock:
+            return {'pendentes': len(self.buffer), 'gravados': self.gravados, 'falhas': self.falhas, 'ultimo_erro': self.ultimo_erro}
+
+    def _aba(self):
+        if self.ws is None:
+            ss = services.abrir_planilha()
+            try: ws = services.retry_api(ss.worksheet, "registro_tempo")
+            except Exception as e:
+                if not services.aba_inexistente(e): raise  # Cota/rede: flush falha e tenta de novo
+                ws = services.retry_api(ss.add_worksheet, "registro_tempo", 1000, len(CABECALHO))
+                services.retry_api(ws.append_row, CABECALHO)
+            # Aba antiga (A-I, sem id_projeto): ganha a coluna J
+            if ws.col_count < len(CABECALHO): services.retry_api(ws.add_cols, len(CABECALHO) - ws.col_count)
+            if (services.retry_api(ws.row_values, 1) or [])[:len(CABECALHO)] != CABECALHO:
+                services.retry_api(ws.update, range_name="A1:J1", values=[CABECALHO])
+            self.ws = ws
+        return self.ws
+
+    def flush(self):
+        with self.lock:
+            lote = list(self.buffer)
+        if not lote: return True
+        try:
+            services.retry_api(self._aba().append_rows, lote)
+        except Exception as e:
+            self.ws = None
+            with self.lock:
+                self.falhas += 1
+                self.ultimo_erro = str(e)
+            print(f"❌ Falha ao gravar {len(lote)} registro(s) de tempo (ficam no spool): {e}")
+            return False
+        with self.lock:
+            # Tira só o que foi enviado (pode ter chegado evento novo no meio)
+            self.buffer = self.buffer[len(lote):]
+            self.gravados += len(lote)
+            self.ultimo_erro = ""
+            self._reescrever_spool()
+        return True
+
+    def _loop(self):
+        espera = INTERVALO_FLUSH
+        while True:
+            self.evento.wait(espera)
+            self.evento.clear()
+            espera = INTERVALO_FLUSH if self.flush() else min(espera * 2, MAX_ESPERA_ERRO)
+
+@st.cache_resource
+def get_escritor():
+    return EscritorLog(journal_local.arquivo_do_processo("spool_registro_tempo.jsonl"))
@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import deque
+import pandas as pd
+
+# --- MÉTRICAS DA API DO SHEETS ---
+# Buffer circular em memória (por processo) com uma entrada por chamada
+# feita via services.retry_api. Alimenta a aba "API Sheets" do Admin.
+
+MAX_REGISTROS = 5000
+
+_registros = deque(maxlen=MAX_REGISTROS)
+_lock = threading.Lock()
+
+def medir_volume(resultado, args, kwargs):
+    # Retorna (linhas, celulas) transferidas. Leitura: olha o resultado; escrita: os valores enviados.
+    dados = resultado if isinstance(resultado, list) else kwargs.get('values')
+    if dados is None:
+        dados = next((a for a in args if isinstance(a, list)), None)
+    if not isinstance(dados, list) or not dados: return 0, 0
+    primeiro = dados[0]
+    if isinstance(primeiro, dict):
+        # get_all_records -> lista de dicts; batch_update -> lista de {'range', 'values'}
+        if 'values' in primeiro and 'range' in primeiro:
+            linhas = sum(len(d.get('values') or []) for d in dados)
+            celulas = sum(len(l) for d in dados for l in (d.get('values') or []))
+            return linhas, celulas
+        return len(dados), len(dados) * len(primeiro)
+    if isinstance(primeiro, list):
+        return len(dados), sum(len(l) for l in dados)
+    # Lista simples (col_values, row_values, append_row)
+    return 1, len(dados)
+
+def registrar(operacao, aba, chamador, linhas, celulas, latencia, tentativas, espera, erro=""):
+    with _lock:
+        _registros.append({
+            'ts': time.time(),
+            'operacao': operacao,
+            'aba': aba,
+            'chamador': chamador,
+            'linhas': linhas,
+            'celulas': celulas,
+            'latencia': latencia,
+            'tentativas': tentativas,
+            'espera': espera,
+            'erro': erro
+        })
+
+def limpar():
+    with _lock: _registros.clear()
+
+def como_dataframe(janela_min=None):
+    with _lock: dados = list(_registros)
+    df = pd.DataFrame(dados)
+    if df.empty or not janela_min: return df
+    return df[df['ts'] >= time.time() - janela_min * 60]
+
+def chamadas_por_minuto(df):
+    if df.empty: return pd.DataFrame()
+    minuto = pd.to_datetime(df['ts'], unit='s').dt.floor('min')
+    return df.assign(minuto=minuto).groupby(['minuto', 'operacao']).size().unstack(fill_value=0)
+
+def latencia_por_funcao(df):
+    if df.empty: return pd.DataFrame()
+    g = df.groupby(['chamador', 'operacao'])['latencia']
+    res = pd.DataFrame({
+        'chamadas': g.size(),
+        'p50 (s)': g.quantile(0.5),
+        'p95 (s)': g.quantile(0.95),
+        'max (s)': g.max()
+    })
+    return res.round(3).sort_values('p95 (s)', ascending=False).reset_index()
+
+def maiores_chamadores(df, top=10):
+    if df.empty: return pd.DataFrame()
+    res = df.groupby('chamador').agg(
+        chamadas=('operacao', 'size'),
+        celulas=('celulas', 'sum'),
+        tempo_total_s=('latencia', 'sum'),
+        espera_cota_s=('espera', 'sum'),
+        retries=('tentativas', lambda t: int((t - 1).sum())),
+        erros=('erro', lambda e: int((e != "").sum()))
+    )
+    return res.round(2).sort_values('tempo_total_s', ascending=False).head(top).reset_index()
@@ -0,0 +1,143 @@
+import threading
+import json
+import os
+import re
+import time
+from datetime import datetime, timedelta
+import pandas as pd
+from modules import services
+
+# --- ROLLUPS DE PRODUTIVIDADE ---
+# Agregados de registro_tempo mantidos em disco (DIR_LOCAL). Cada atualização
+# lê só as linhas novas depois da marca d'água (última linha processada), então
+# o custo não cresce com o histórico. O painel só lê os agregados prontos.
+
+INTERVALO_ATUALIZACAO_MIN = 5
+VERSAO_ESTADO = 2  # Mudou a chave dos agregados: estado de outra versão é refeito do zero
+DIAS_RITMO_ETA = 7  # janela para calcular o ritmo de lotes/dia de cada projeto
+RE_DESC = re.compile(r"^(\w+)\s*\((\d+)/(\d+)\)")
+
+_lock = threading.Lock()
+
+def _arquivo():
+    return services.caminho_local("rollups_produtividade.json")
+
+def _estado_vazio():
+    # Projeto identificado pelo id (coluna J); registros antigos, sem id, por "nome:<nome>"
+    return {
+        'versao': VERSAO_ESTADO,
+        'marca_dagua': 0,        # linhas de dados de registro_tempo já processadas
+        'atualizado_em': 0,
+        'operadores': {},        # usuario -> {'itens', 'segundos', 'sessoes'}
+        'lotes': {},             # "id_projeto|lote" -> {'projeto', 'lote', 'segundos', 'sessoes', 'inicio', 'fim', 'operadores', 'concluido'}
+        'ultimo_feitos': {},     # "id_projeto|lote" -> feitos no último evento (para calcular o delta)
+        'concluidos_dia': {}     # id_projeto -> {data: lotes concluídos}
+    }
+
+def carregar_estado():
+    try:
+        with open(_arquivo(), encoding="utf-8") as f: estado = json.load(f)
+        return estado if estado.get('versao') == VERSAO_ESTADO else _estado_vazio()
+    except FileNotFoundError: return _estado_vazio()
+    except Exception as e:
+        print(f"Erro ao ler rollups (recomeçando do zero): {e}")
+        return _estado_vazio()
+
+def _salvar_estado(estado):
+    tmp = _arquivo() + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f: json.dump(estado, f, ensure_ascii=False)
+    os.replace(tmp, _arquivo())
+
+def _aplicar_linha(estado, linha):
+    # linha: id, lote, data, responsavel, h_ini, h_fim, duracao, projeto, desc, id_projeto
+    linha = (list(linha) + [""] * 10)[:10]
+    _, lote, data, usuario, h_ini, h_fim, duracao, projeto, desc, id_projeto = linha
+    try: segundos = int(float(duracao or 0))
+    except: segundos = 0
+    m = RE_DESC.match(str(desc))
+    acao, feitos = (m.group(1), int(m.group(2))) if m else (str(desc), 0)
+    # Dois uploads com o mesmo nome de arquivo são projetos diferentes: a chave é o id
+    id_projeto = str(id_projeto).strip() or f"nome:{projeto}"
+    chave = f"{id_projeto}|{lote}"
+
+    # Itens feitos nesta sessão = feitos agora - feitos no evento anterior do mesmo lote
+    delta = max(0, feitos - estado['ultimo_feitos'].get(chave, 0))
+    estado['ultimo_feitos'][chave] = feitos
+
+    op = estado['operadores'].setdefault(usuario, {'itens': 0, 'segundos': 0, 'sessoes': 0})
+    op['itens'] += delta
+    op['segundos'] += segundos
+    op['sessoes'] += 1
+
+    lt = estado['lotes'].setdefault(chave, {'projeto': projeto, 'lote': str(lote), 'segundos': 0, 'sessoes': 0,
+                                            'inicio': f"{data} {h_ini}", 'fim': "", 'operadores': [], 'concluido': False})
+    lt['segundos'] += segundos
+    lt['sessoes'] += 1
+    if usuario not in lt['operadores']: lt['operadores'].append(usuario)
+    if acao == "Fim":
+        lt['fim'] = f"{data} {h_fim}"
+        if not lt['concluido']:
+            lt['concluido'] = True
+            dia = estado['concluidos_dia'].setdefault(id_projeto, {})
+            dia[data] = dia.get(data, 0) + 1
+
+def atualizar_rollups(forcar=False):
+    # Processa só as linhas novas de registro_tempo. Retorna quantas entraram.
+    with _lock:
+        estado = carregar_estado()
+        if not forcar and time.time() - estado['atualizado_em'] < INTERVALO_ATUALIZACAO_MIN * 60: return 0
+        ss = services.abrir_planilha()
+        try: ws = services.abrir_aba(ss, "registro_tempo")
+        except Exception as e:
+            if services.aba_inexistente(e): return 0  # Ninguém registrou tempo ainda
+            raise
+        ini = estado['marca_dagua'] + 2  # +1 do cabeçalho, +1 porque a linha é 1-based
+        novas = services.retry_api(ws.get, f"A{ini}:J") or []
+        for linha in novas:
+            if any(str(v).strip() for v in linha): _aplicar_linha(estado, linha)
+        estado['marca_dagua'] += len(novas)
+        estado['atualizado_em'] = time.time()
+        _salvar_estado(estado)
+        if novas: print(f"📊 Rollups: {len(novas)} registro(s) novo(s) processados.")
+        return len(novas)
+
+# --- TABELAS DO PAINEL ---
+def tabela_operadores(estado):
+    linhas = [{'operador': u, 'itens': d['itens'], 'horas': round(d['segundos'] / 3600, 1), 'sessões': d['sessoes'],
+               'itens/hora': round(d['itens'] / (d['segundos'] / 3600), 1) if d['segundos'] else 0.0}
+              for u, d in estado['operadores'].items()]
+    df = pd.DataFrame(linhas)
+    return df.sort_values('itens/hora', ascending=False) if not df.empty else df
+
+def tabela_ciclo_lotes(estado):
+    linhas = []
+    for d in estado['lotes'].values():
+        ciclo_h = None
+        if d['concluido'] and d['fim']:
+            try:
+                ciclo = datetime.strptime(d['fim'], "%Y-%m-%d %H:%M:%S") - datetime.strptime(d['inicio'], "%Y-%m-%d %H:%M:%S")
+                ciclo_h = round(ciclo.total_seconds() / 3600, 1)
+            except: pass
+        linhas.append({'projeto': d['projeto'], 'lote': d['lote'], 'concluído': d['concluido'],
+                       'trabalho (min)': round(d['segundos'] / 60, 1), 'ciclo (h)': ciclo_h,
+                       'sessões': d['sessoes'], 'operadores': ", ".join(d['operadores'])})
+    return pd.DataFrame(linhas)
+
+def tabela_eta_projetos(estado):
+    # Situação atual vem de controle_lotes (cacheado); o ritmo vem dos rollups
+    projs = services.carregar_projetos_ativos()
+    if projs.empty: return pd.DataFrame()
+    limite = (datetime.now(services.TZ_BRASIL) - timedelta(days=DIAS_RITMO_ETA)).strftime("%Y-%m-%d")
+    linhas = []
+    for _, p in projs.iterrows():
+        lotes = services.carregar_lotes_do_projeto(p['id'])
+        total = len(lotes)
+        feitos = int((lotes['status'] == 'Concluído').sum()) if total else 0
+        por_dia = estado['concluidos_dia'].get(str(p['id'])) or estado['concluidos_dia'].get(f"nome:{p['nome']}", {})
+        ritmo = sum(n for d, n in por_dia.items() if d >= limite) / DIAS_RITMO_ETA
+        faltam = total - feitos
+        eta = (datetime.now(services.TZ_BRASIL) + timedelta(days=faltam / ritmo)).strftime("%d/%m/%Y") if ritmo and faltam else ("-" if faltam else "Concluído")
+        linhas.append({'projeto': p['nome'], 'lotes': total, 'concluídos': feitos,
+                       '%': round(100 * feitos / total, 1) if total else 0.0,
+                       'lotes/dia (7d)': round(ritmo, 1), 'previsão': eta})
+    return pd.DataFrame(linhas)
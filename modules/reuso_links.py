@@ -0,0 +1,91 @@
+import streamlit as st
+import sqlite3
+import threading
+from datetime import datetime
+import pandas as pd
+from modules import services
+
+# --- REUSO DE LINKS (EAN + SITE) ---
+# Índice persistente (ean, site) -> último link coletado, num SQLite em
+# DIR_LOCAL e inteiro em memória (dict) para o upload consultar 100k linhas
+# com um único Series.map. É alimentado pelas escritas de links e pode ser
+# refeito do histórico (abas de dados + arquivo de projetos concluídos).
+# Chave: EAN só com dígitos e sem zeros à esquerda (o Excel costuma comê-los)
+# + "|" + site em minúsculas, sem acentos.
+
+class IndiceReuso:
+    def __init__(self, arquivo):
+        self.lock = threading.Lock()
+        self.con = sqlite3.connect(arquivo, check_same_thread=False)
+        self.con.execute("CREATE TABLE IF NOT EXISTS links (chave TEXT PRIMARY KEY, link TEXT, atualizado_em TEXT)")
+        self.mapa = dict(self.con.execute("SELECT chave, link FROM links"))
+
+    def registrar(self, ean, site, link):
+        # Séries (ou listas) alinhadas; só entra quem tem EAN e link
+        df = pd.DataFrame({'chave': chaves(pd.Series(ean, dtype=object), pd.Series(site, dtype=object)),
+                           'link': pd.Series(link, dtype=object).fillna("").astype(str).str.strip()})
+        df = df[(df['chave'] != "") & (df['link'] != "")].drop_duplicates('chave', keep='last')
+        if df.empty: return 0
+        agora = datetime.now(services.TZ_BRASIL).strftime(services.FMT_LEASE)
+        with self.lock:
+            self.con.executemany(
+                "INSERT INTO links VALUES (?, ?, ?) ON CONFLICT(chave) DO UPDATE SET link = excluded.link, atualizado_em = excluded.atualizado_em",
+                [(c, l, agora) for c, l in zip(df['chave'], df['link'])])
+            self.con.commit()
+            self.mapa.update(zip(df['chave'], df['link']))
+        return len(df)
+
+    def buscar(self, ean, site):
+        # Série de links achados (NaN onde não há), alinhada com 'ean'
+        ch = chaves(ean, site)
+        with self.lock: return ch.map(self.mapa).where(ch != "")
+
+    def tamanho(self):
+        with self.lock: return len(self.mapa)
+
+def chaves(ean, site):
+    e = ean.fillna("").astype(str).str.replace(r"\D", "", regex=True).str.lstrip("0")
+    s = site.fillna("").astype(str).str.strip().str.lower()
+    s = s.map({v: services.remove_accents(v) for v in s.unique()})  # Poucos sites distintos
+    return (e + "|" + s).where(e != "", "")
+
+@st.cache_resource
+def get_indice():
+    return IndiceReuso(services.caminho_local("reuso_links.db"))
+
+def preencher_upload(dados):
+    # Preenche 'link' das linhas já coletadas antes e marca link_auto = "1" (para revisão)
+    achados = get_indice().buscar(dados['ean'], dados['site'])
+    usar = achados.notna() & (dados['link'].astype(str).str.strip() == "")
+    dados.loc[usar, 'link'] = achados[usar]
+    dados.loc[usar, 'link_auto'] = "1"
+    return int(usar.sum())
+
+def reconstruir():
+    # Refaz o índice a partir de todo o histórico: arquivo primeiro (mais antigo), depois as abas
+    from modules import arquivamento
+    idx = get_indice()
+    i_ean, i_site, i_link = (services.COLS_DADOS.index(c) for c in ("ean", "site", "link"))
+    total = 0
+    for id_a in arquivamento.projetos_arquivados():
+        linhas = list(arquivamento.iterar_linhas(id_a))
+        total += idx.registrar([l[i_ean] for l in linhas], [l[i_site] for l in linhas], [l[i_link] for l in linhas])
+
+    ss = services.abrir_planilha()
+    destinos = [services.ABA_DADOS_PADRAO] + sorted({str(p.get('aba_dados') or "").strip() for p in services.ler_registros_cache("projetos")} - {""})
+    from modules import snapshot_dados
+    for destino in destinos:
+        if snapshot_dados.disponivel():
+            try:
+                cols = snapshot_dados.colunas(destino, ["ean", "site", "link"])
+                total += idx.registrar(cols['ean'], cols['site'], cols['link'])
+                continue
+            except Exception as e: print(f"Reuso: snapshot de {destino} indisponível ({e})")
+        try: valores = services.retry_api(services.abrir_aba_dados(ss, destino).get_all_values) or []
+        except Exception as e:
+            print(f"Reuso: aba {destino} ignorada ({e})")
+            continue
+        linhas = [(list(l) + [""] * len(services.COLS_DADOS)) for l in valores[1:]]
+        total += idx.registrar([l[i_ean] for l in linhas], [l[i_site] for l in linhas], [l[i_link] for l in linhas])
+    print(f"♻️ Índice de reuso refeito: {idx.tamanho()} chaves ({total} links lidos).")
+    return idx.tamanho()
@@ -1,36 +1,171 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import gspread
 from google.oauth2.service_account import Credentials
 from datetime import datetime, timedelta, timezone
+from modules import metricas
 import uuid
 import time
 import io
 import unicodedata
 import random
 import traceback
+import os
+import threading
+import sys
+import re
+import pickle
+import shutil
 
 # --- CONFIGURAÇÃO ---
 TZ_BRASIL = timezone(timedelta(hours=-3))
 ID_PLANILHA_COLETA = "1IwV0h5HrqBkl4owb3lVzPIl2lLxj9n3cfH15U_SISlQ" 
 
+# Pasta local para arquivos de estado do servidor (journal, spool, etc.)
+DIR_LOCAL = os.environ.get("COLETA_DIR_LOCAL", ".dados_locais")
+
+# Ordem fixa das colunas A-J da aba dados_brutos
+COLS_DADOS = ["id_projeto", "lote", "ean", "descricao", "site", "cep", "endereco", "link", "id_linha", "link_auto"]
+COL_ID_LINHA = "I"
+COL_FIM_DADOS = "J"  # Última coluna das abas de dados (link_auto: "1" = preenchido pelo reuso, a revisar)
+# Colunas G-I da aba controle_lotes: faixa de linhas do lote em dados_brutos + validade da reserva
+COLS_EXTRA_CONTROLE = ["linha_ini", "linha_fim", "lease_ate"]
+
 def remove_accents(input_str):
     if not isinstance(input_str, str): return str(input_str)
     nfkd_form = unicodedata.normalize('NFKD', input_str)
     return "".join([c for c in nfkd_form if not unicodedata.combining(c)])
 
+def caminho_local(nome):
+    os.makedirs(DIR_LOCAL, exist_ok=True)
+    return os.path.join(DIR_LOCAL, nome)
+
+# --- LIMITADOR DE COTA (TOKEN BUCKET POR PROCESSO) ---
+# O Sheets limita leituras e escritas por minuto para a conta de serviço.
+# Todas as sessões do processo passam pelo mesmo balde, então quando a cota
+# aperta elas entram em fila em vez de estourar o 429 juntas.
+COTA_LEITURAS_MIN = int(os.environ.get("COLETA_COTA_LEITURAS_MIN", 60))
+COTA_ESCRITAS_MIN = int(os.environ.get("COLETA_COTA_ESCRITAS_MIN", 60))
+OPS_LEITURA = {"get_all_records", "get_all_values", "col_values", "row_values", "get", "batch_get", "get_values", "acell", "cell", "open_by_key", "worksheet"}
+STATUS_TRANSITORIOS = {408, 429, 500, 502, 503, 504}
+OPS_ABA = {"worksheet", "add_worksheet", "del_worksheet"}  # Operações da planilha que têm uma aba como alvo
+AUXILIARES_ABA = {"abrir_aba", "abrir_aba_dados", "ws_dados_projeto"}
+
+class LimitadorCota:
+    def __init__(self, por_minuto):
+        self.capacidade = float(por_minuto)
+        self.tokens = float(por_minuto)
+        self.taxa = por_minuto / 60.0
+        self.ultimo = time.monotonic()
+        self.pausado_ate = 0.0
+        self.lock = threading.Lock()
+
+    def adquirir(self):
+        # Reserva um token (pode ficar negativo = fila) e dorme fora do lock
+        with self.lock:
+            agora = time.monotonic()
+            self.tokens = min(self.capacidade, self.tokens + (agora - self.ultimo) * self.taxa)
+            self.ultimo = agora
+            self.tokens -= 1
+            espera = max(0.0, -self.tokens / self.taxa, self.pausado_ate - agora)
+        if espera > 0: time.sleep(espera)
+        return espera
+
+    def pausar(self, segundos):
+        # Recebemos 429: segura todo mundo e esvazia o balde
+        with self.lock:
+            self.pausado_ate = max(self.pausado_ate, time.monotonic() + segundos)
+            self.tokens = min(self.tokens, 0.0)
+
+_limitadores = {"leitura": LimitadorCota(COTA_LEITURAS_MIN), "escrita": LimitadorCota(COTA_ESCRITAS_MIN)}
+
+def configurar_cota(leituras_min, escritas_min):
+    _limitadores["leitura"] = LimitadorCota(leituras_min)
+    _limitadores["escrita"] = LimitadorCota(escritas_min)
+_info_chamada = threading.local()
+
+def _tipo_operacao(func):
+    return "leitura" if getattr(func, "__name__", "") in OPS_LEITURA else "escrita"
+
+def _classificar_erro(e):
+    # Retorna (status, transitorio, retry_after)
+    resp = getattr(e, "response", None)
+    status = getattr(resp, "status_code", None) or getattr(e, "code", None)
+    if not isinstance(status, int): status = None
+    retry_after = None
+    try:
+        valor = resp.headers.get("Retry-After") if resp is not None else None
+        if valor: retry_after = float(valor)
+    except: retry_after = None
+    if status is not None: return status, status in STATUS_TRANSITORIOS, retry_after
+    # Sem status HTTP: falha de rede/timeout é transitória, o resto não
+    return None, isinstance(e, (OSError, TimeoutError)), retry_after
+
+def aba_inexistente(e):
+    # gspread.exceptions.WorksheetNotFound (ou a da planilha falsa): resposta normal, não falha da API
+    return type(e).__name__ == "WorksheetNotFound"
+
+def info_ultima_chamada():
+    # {'operacao', 'espera', 'tentativas', 'status'} da última retry_api desta thread
+    return getattr(_info_chamada, "ultima", None)
+
+def _nome_aba(func, args=()):
+    dono = getattr(func, "__self__", None)
+    if type(dono).__name__ == "Worksheet": return getattr(dono, "title", "")
+    # Chamadas na planilha (worksheet, add_worksheet, del_worksheet): a aba vem no 1º argumento
+    if getattr(func, "__name__", "") not in OPS_ABA or not args: return ""
+    return args[0] if isinstance(args[0], str) else getattr(args[0], "title", "")
+
+def _chamador():
+    # Função que pediu a chamada, pulando os auxiliares que só abrem handles
+    f = sys._getframe(2)
+    while f.f_back is not None and f.f_code.co_name in AUXILIARES_ABA: f = f.f_back
+    return f.f_code.co_name
+
 # --- RETRY API ---
 def retry_api(func, *args, **kwargs):
     max_tentativas = 5
+    operacao = getattr(func, "__name__", str(func))
+    limitador = _limitadores[_tipo_operacao(func)]
+    chamador = _chamador()
+    t_ini = time.perf_counter()
+    espera_total = 0.0
+    info = {'operacao': operacao, 'espera': 0.0, 'tentativas': 0, 'status': None}
+    _info_chamada.ultima = info
+
+    def _registrar(resultado=None, erro=""):
+        linhas, celulas = metricas.medir_volume(resultado, args, kwargs)
+        metricas.registrar(operacao, _nome_aba(func, args), chamador, linhas, celulas,
+                           time.perf_counter() - t_ini, info['tentativas'], espera_total, erro)
+
     for i in range(max_tentativas):
+        espera_total += limitador.adquirir()
+        info['tentativas'] = i + 1
         try:
-            return func(*args, **kwargs)
+            resultado = func(*args, **kwargs)
+            info['espera'] = espera_total
+            _registrar(resultado)
+            if espera_total > 1 or i > 0:
+                print(f"⏱️ {operacao}: {i + 1} tentativa(s), {espera_total:.1f}s de espera")
+            return resultado
         except Exception as e:
-            if i == max_tentativas - 1:
-                print(f"❌ Erro fatal API: {e}")
+            if aba_inexistente(e):
+                # Quem chamou decide (ex.: criar a aba); não conta como erro nas métricas
+                _registrar()
+                raise
+            status, transitorio, retry_after = _classificar_erro(e)
+            info['status'] = status
+            info['espera'] = espera_total
+            if not transitorio or i == max_tentativas - 1:
+                _registrar(erro=str(status or type(e).__name__))
+                print(f"❌ Erro fatal API ({operacao}, status {status}, {i + 1} tentativa(s)): {e}")
                 raise e 
-            wait_time = (1.5 ** i) + random.uniform(0, 1) 
+            # Full jitter; respeita o Retry-After quando o Google manda
+            wait_time = retry_after if retry_after else random.uniform(0, min(30, 2 ** (i + 1)))
+            if status == 429: limitador.pausar(wait_time)
             time.sleep(wait_time)
+            espera_total += wait_time
     return None
 
 # --- AUTENTICAÇÃO ESTÁVEL (COM CACHE) ---
@@ -61,191 +196,867 @@ def get_conexao_cached():
         creds = Credentials.from_service_account_info(creds_dict, scopes=scope)
         client = gspread.authorize(creds)
         
-        return client.open_by_key(ID_PLANILHA_COLETA)
+        return retry_api(client.open_by_key, ID_PLANILHA_COLETA)
     except Exception as e:
         # Mostra o erro real na tela para sabermos o que é, se persistir
         st.error(f"Erro fatal de conexão: {e}") 
         return None
 
+_planilha_substituta = None
+
+def usar_planilha(ss):
+    # Troca a planilha real por outra (ex.: sheets_falso.PlanilhaFalsa no teste de carga). None volta ao Google.
+    global _planilha_substituta
+    _planilha_substituta = ss
+    invalidar_cache()
+    _ws_versoes.clear()
+    _ultima_leitura_versoes[:] = [0.0, {}]
+    with _lock_ws_dados: _ws_dados.clear()
+    _controle_conferido.clear()
+
 def abrir_planilha(client_ignorado=None):
     # Ignora argumentos antigos e usa sempre a conexão cacheada
+    if _planilha_substituta is not None: return _planilha_substituta
     return get_conexao_cached()
 
 # Mantido para compatibilidade
 def get_client_coleta():
     return True 
 
+# --- BACKEND ---
+# "sheets" (padrão): Google Sheets é o banco. "sqlite": banco local em
+# DIR_LOCAL (modules/armazenamento.py) e o Sheets vira espelho periódico.
+BACKEND = os.environ.get("COLETA_BACKEND", "sheets")
+
+def backend_local():
+    if BACKEND != "sqlite": return None
+    from modules import armazenamento
+    return armazenamento.get_sqlite()
+
+# --- SHARDS DE DADOS (UMA ABA OU PLANILHA POR PROJETO) ---
+# A coluna F de projetos (aba_dados) diz onde ficam as linhas do projeto:
+#   ""                        -> dados_brutos (projetos antigos)
+#   "dados_<id>"              -> aba própria na planilha principal
+#   "<chave_planilha>/<aba>"  -> planilha própria (fora do limite de células da principal)
+# Todo shard tem o layout A-J de dados_brutos, então faixas e _row_index
+# continuam valendo, só que relativos ao shard.
+MODO_SHARD = os.environ.get("COLETA_SHARD_DADOS", "aba")  # "nenhum", "aba" ou "planilha"
+PASTA_SHARDS = os.environ.get("COLETA_PASTA_SHARDS") or None  # pasta do Drive para o modo "planilha"
+ABA_DADOS_PADRAO = "dados_brutos"
+_ws_dados = {}  # aba ou destino -> (id(ss), handle) (evita um worksheet() por chamada)
+_lock_ws_dados = threading.Lock()
+
+def destino_dados_projeto(id_projeto):
+    for row in ler_registros_cache("projetos"):
+        if str(row.get('id')) == str(id_projeto):
+            return str(row.get('aba_dados') or "").strip() or ABA_DADOS_PADRAO
+    return ABA_DADOS_PADRAO
+
+def abrir_aba(ss, nome):
+    # Handle da aba, aberto uma vez por conexão: no gspread 6 worksheet() é uma
+    # leitura de metadados na API, então passa pelo retry_api (cota e métricas).
+    # nome pode ser "<chave_planilha>/<aba>" (shard em planilha própria).
+    with _lock_ws_dados: item = _ws_dados.get(nome)
+    if item and item[0] == id(ss): return item[1]
+    if "/" in nome:
+        chave, aba = nome.split("/", 1)
+        ws = retry_api(retry_api(ss.client.open_by_key, chave).worksheet, aba)
+    else:
+        ws = retry_api(ss.worksheet, nome)
+    with _lock_ws_dados: _ws_dados[nome] = (id(ss), ws)
+    return ws
+
+def abrir_aba_dados(ss, destino):
+    return abrir_aba(ss, destino)
+
+def ws_dados_projeto(ss, id_projeto):
+    return abrir_aba_dados(ss, destino_dados_projeto(id_projeto))
+
+def _criar_shard(ss, id_p, nome, n_linhas):
+    # Cria o shard já no tamanho certo (cabeçalho + linhas) e devolve o destino
+    linhas = n_linhas + 1
+    if MODO_SHARD == "planilha":
+        nova = retry_api(ss.client.create, f"Coleta - {nome} ({id_p})", folder_id=PASTA_SHARDS)
+        ws = nova.sheet1
+        retry_api(ws.resize, linhas, len(COLS_DADOS))
+        destino = f"{nova.id}/{ws.title}"
+    else:
+        destino = f"dados_{id_p}"
+        ws = retry_api(ss.add_worksheet, destino, linhas, len(COLS_DADOS))
+    retry_api(ws.update, range_name=f"A1:{COL_FIM_DADOS}1", values=[COLS_DADOS])
+    with _lock_ws_dados: _ws_dados[destino] = (id(ss), ws)
+    return destino
+
+def garantir_coluna_id(ws_d):
+    # Garante as colunas I:J (id_linha, link_auto) nas abas de dados antigas, criadas só com A-H
+    if ws_d.col_count < len(COLS_DADOS):
+        retry_api(ws_d.add_cols, len(COLS_DADOS) - ws_d.col_count)
+    header = retry_api(ws_d.row_values, 1) or []
+    if header[8:] != COLS_DADOS[8:]:
+        retry_api(ws_d.update, range_name=f"I1:{COL_FIM_DADOS}1", values=[COLS_DADOS[8:]])
+
+def garantir_coluna_destino(ws_p):
+    # Garante o cabeçalho F1 (aba_dados) em projetos
+    if ws_p.col_count < 6:
+        retry_api(ws_p.add_cols, 6 - ws_p.col_count)
+    header = retry_api(ws_p.row_values, 1) or []
+    if header[5:6] != ["aba_dados"]:
+        retry_api(ws_p.update, range_name="F1", values=[["aba_dados"]])
+
+# --- CACHE DAS ABAS DE CONTROLE (projetos / controle_lotes) ---
+# Compartilhado por todas as sessões do processo. Nossas próprias escritas
+# atualizam (ou invalidam) o cache na hora, então o TTL só cobre escritas
+# feitas por fora (outro processo ou edição manual na planilha).
+TTL_CACHE_CONTROLE = 20  # segundos
+_cache_abas = {}         # nome_aba -> (timestamp, registros)
+_lock_cache = threading.Lock()
+_locks_leitura = {"projetos": threading.Lock(), "controle_lotes": threading.Lock()}
+
+def _col_letra_para_idx(letra):
+    return ord(letra.upper()) - ord("A")
+
+def _cache_valido(nome_aba):
+    with _lock_cache:
+        item = _cache_abas.get(nome_aba)
+        if item and time.time() - item[0] < TTL_CACHE_CONTROLE: return item[1]
+    return None
+
+def guardar_cache_aba(nome_aba, registros, versao=None, ts=None):
+    with _lock_cache:
+        _cache_abas[nome_aba] = (ts or time.time(), registros)
+        if versao is not None: _versoes_cache[nome_aba] = versao
+
+def invalidar_cache(nome_aba=None):
+    with _lock_cache:
+        if nome_aba:
+            _cache_abas.pop(nome_aba, None)
+            _versoes_cache.pop(nome_aba, None)
+        else:
+            _cache_abas.clear()
+            _versoes_cache.clear()
+    _apagar_compartilhado([nome_aba] if nome_aba else list(LINHA_VERSAO))
+
+def expirar_cache():
+    # Vence o TTL mas mantém os dados: a próxima leitura só confere a versão
+    with _lock_cache:
+        for nome, (_, registros) in list(_cache_abas.items()): _cache_abas[nome] = (0, registros)
+
+def ler_registros_cache(nome_aba):
+    registros = _cache_valido(nome_aba)
+    if registros is not None: return registros
+    # Só uma sessão busca a aba por vez; as outras esperam e usam o resultado
+    with _locks_leitura.setdefault(nome_aba, threading.Lock()):
+        registros = _cache_valido(nome_aba)
+        if registros is not None: return registros
+        comp = cache_compartilhado()
+        if not comp: return _buscar_aba(nome_aba)[0]
+        # Com réplicas: cópia de outro processo, ou busca com a trava da aba (single-flight)
+        registros = _do_compartilhado(comp, nome_aba)
+        if registros is not None: return registros
+        from modules.cache_compartilhado import exclusivo
+        with exclusivo(comp, nome_aba):
+            registros = _do_compartilhado(comp, nome_aba)  # Quem tinha a trava pode ter acabado de buscar
+            if registros is not None: return registros
+            registros, versao = _buscar_aba(nome_aba)
+            try: comp.gravar(nome_aba, {'ts': time.time(), 'versao': versao or "", 'registros': registros})
+            except Exception as e: print(f"Erro ao gravar cache compartilhado de {nome_aba}: {e}")
+            return registros
+
+def _buscar_aba(nome_aba):
+    # Chamar com o lock de leitura da aba. Retorna (registros, versao).
+    ss = abrir_planilha()
+    # Cópia vencida com a mesma versão da planilha: renova sem baixar a aba
+    versao = None
+    if nome_aba in LINHA_VERSAO:
+        try: versao = ler_versoes(ss).get(nome_aba, "")
+        except Exception as e: print(f"Erro ao ler versão de {nome_aba}: {e}")
+        with _lock_cache:
+            item = _cache_abas.get(nome_aba)
+            if item and versao and _versoes_cache.get(nome_aba) == versao:
+                _cache_abas[nome_aba] = (time.time(), item[1])
+                return item[1], versao
+    registros = retry_api(abrir_aba(ss, nome_aba).get_all_records) or []
+    guardar_cache_aba(nome_aba, registros, versao or None)
+    return registros, versao
+
+# --- CACHE ENTRE PROCESSOS (OPCIONAL) ---
+# COLETA_CACHE_COMPARTILHADO = "disco" | "redis://..." (ver modules/cache_compartilhado.py).
+# Cobre projetos e controle_lotes. Os dados de um lote não entram: cada lote
+# está com um operador só, e o link muda a cada edição.
+CONFIG_CACHE_COMPARTILHADO = os.environ.get("COLETA_CACHE_COMPARTILHADO", "")
+_cache_comp = []  # [instância] depois de criada
+
+def cache_compartilhado():
+    if not _cache_comp:
+        from modules import cache_compartilhado as cc
+        try: _cache_comp.append(cc.criar(CONFIG_CACHE_COMPARTILHADO, caminho_local("cache")))
+        except Exception as e:
+            print(f"Cache compartilhado desligado ({e})")
+            _cache_comp.append(None)
+    return _cache_comp[0]
+
+def usar_cache_compartilhado(cache):
+    # Troca o cache entre processos (ex.: CacheRedis(RedisMemoria()) em testes). None desliga.
+    _cache_comp[:] = [cache]
+
+def _do_compartilhado(comp, nome_aba):
+    try: item = comp.ler(nome_aba)
+    except Exception as e:
+        print(f"Erro ao ler cache compartilhado de {nome_aba}: {e}")
+        return None
+    if not item or time.time() - item['ts'] >= TTL_CACHE_CONTROLE: return None
+    # Mantém a idade da cópia: o TTL conta desde a busca no Google, não desde a leitura aqui
+    guardar_cache_aba(nome_aba, item['registros'], item.get('versao') or None, item['ts'])
+    return item['registros']
+
+def _apagar_compartilhado(abas):
+    if not CONFIG_CACHE_COMPARTILHADO and not _cache_comp: return
+    comp = cache_compartilhado()
+    if not comp: return
+    for aba in abas:
+        try: comp.apagar(aba)
+        except Exception as e: print(f"Erro ao apagar cache compartilhado de {aba}: {e}")
+
+# --- VERSÃO DAS ABAS DE CONTROLE ---
+# A aba "versoes" guarda um carimbo por aba (B2 = projetos, B3 = controle_lotes)
+# que toda escrita feita por este módulo troca. Com o cache vencido, o leitor
+# confere só esses carimbos (uma leitura de 4 células) e baixa a aba inteira
+# apenas se mudou. A própria escrita não adianta a versão do cache local: se
+# outro processo escreveu junto, a mudança dele não se perde.
+ABA_VERSOES = "versoes"
+LINHA_VERSAO = {"projetos": 2, "controle_lotes": 3}
+JANELA_LEITURA_VERSOES = 2  # segundos em que uma leitura das versões serve às duas abas
+_versoes_cache = {}          # nome_aba -> carimbo da cópia em cache
+_ws_versoes = {}             # id(ss) -> handle da aba "versoes"
+_ultima_leitura_versoes = [0.0, {}]
+
+def _aba_versoes(ss):
+    ws = _ws_versoes.get(id(ss))
+    if ws is not None: return ws
+    try: ws = retry_api(ss.worksheet, ABA_VERSOES)
+    except Exception as e:
+        if not aba_inexistente(e): raise
+        ws = retry_api(ss.add_worksheet, ABA_VERSOES, 10, 2)
+        linhas = [["aba", "versao"]] + [[nome, "0"] for nome in LINHA_VERSAO]
+        retry_api(ws.update, range_name=f"A1:B{len(linhas)}", values=linhas)
+    _ws_versoes.clear()
+    _ws_versoes[id(ss)] = ws
+    return ws
+
+def ler_versoes(ss=None):
+    with _lock_cache:
+        ts, versoes = _ultima_leitura_versoes
+        if time.time() - ts < JANELA_LEITURA_VERSOES: return versoes
+    ws = _aba_versoes(ss or abrir_planilha())
+    linhas = retry_api(ws.get, f"A2:B{max(LINHA_VERSAO.values())}") or []
+    versoes = {str(l[0]): str(l[1]) for l in linhas if len(l) >= 2}
+    with _lock_cache: _ultima_leitura_versoes[:] = [time.time(), versoes]
+    return versoes
+
+def marcar_alteracao(*abas):
+    # Chamar depois de escrever em projetos/controle_lotes. Falha aqui só atrasa
+    # a atualização dos outros processos até o próximo carimbo.
+    try:
+        ws = _aba_versoes(abrir_planilha())
+        carimbo = f"{time.time():.3f}-{uuid.uuid4().hex[:6]}"
+        retry_api(ws.batch_update, [{'range': f"B{LINHA_VERSAO[a]}", 'values': [[carimbo]]} for a in abas])
+        with _lock_cache: _ultima_leitura_versoes[0] = 0.0
+        _apagar_compartilhado(abas)  # As outras réplicas buscam de novo (uma só, pela trava)
+    except Exception as e:
+        _ws_versoes.clear()
+        print(f"Erro ao marcar versão de {abas}: {e}")
+
+def _atualizar_cache_lote(id_projeto, numero_lote, col_ini, valores):
+    # Write-through: replica no cache um update feito em controle_lotes a partir da coluna col_ini
+    with _lock_cache:
+        item = _cache_abas.get("controle_lotes")
+        if not item: return
+        for row in item[1]:
+            if str(row.get('id_projeto')) == str(id_projeto) and str(row.get('lote')) == str(numero_lote):
+                chaves = list(row.keys())
+                ini = _col_letra_para_idx(col_ini)
+                for j, v in enumerate(valores):
+                    if ini + j < len(chaves): row[chaves[ini + j]] = v
+                return
+
+# --- ÍNDICE ID_LINHA -> LINHA ---
+# Cada linha de dados tem um id estável na coluna I ("<id_projeto>-<n>", n =
+# posição no upload). O índice guarda, por projeto, a linha onde cada id foi
+# visto por último: as escritas resolvem a linha por dicionário, sem varrer
+# a aba. Se um id falta no índice ou não está mais onde estava (alguém
+# inseriu/apagou linhas), só a coluna I do shard é relida e o índice refeito.
+_indice_linhas = {}  # id_projeto -> {id_linha: linha}
+_lock_indice = threading.Lock()
+
+def registrar_linhas(id_projeto, ids, linhas):
+    with _lock_indice:
+        mapa = _indice_linhas.setdefault(str(id_projeto), {})
+        for i, l in zip(ids, linhas):
+            if i: mapa[str(i)] = int(l)
+
+def _reindexar_projeto(ws, id_projeto):
+    col = retry_api(ws.col_values, COLS_DADOS.index("id_linha") + 1) or []
+    prefixo = f"{id_projeto}-"
+    mapa = {str(v): i + 1 for i, v in enumerate(col) if i > 0 and str(v).startswith(prefixo)}
+    with _lock_indice: _indice_linhas[str(id_projeto)] = mapa
+    print(f"🔎 Índice de linhas do projeto {id_projeto} refeito ({len(mapa)} ids).")
+    return mapa
+
+def resolver_linhas(ws, id_projeto, ids):
+    # {id_linha: linha} dos ids pedidos
+    with _lock_indice: mapa = _indice_linhas.get(str(id_projeto), {})
+    if any(i not in mapa for i in ids): mapa = _reindexar_projeto(ws, id_projeto)
+    return {i: mapa[i] for i in ids if i in mapa}
+
+def conferir_linhas(ws, id_projeto, mapa):
+    # Detecta deslocamento lendo a coluna I só no intervalo que vai ser escrito
+    if not mapa: return mapa
+    ini, fim = min(mapa.values()), max(mapa.values())
+    col = [str(l[0]) if l else "" for l in (retry_api(ws.get, f"{COL_ID_LINHA}{ini}:{COL_ID_LINHA}{fim}") or [])]
+    col += [""] * (fim - ini + 1 - len(col))
+    if all(col[l - ini] == i for i, l in mapa.items()): return mapa
+    print(f"⚠️ Linhas do projeto {id_projeto} mudaram de lugar.")
+    novo = _reindexar_projeto(ws, id_projeto)
+    return {i: novo[i] for i in mapa if i in novo}
+
+def localizar_linhas(ws, id_projeto, ids):
+    # {id_linha: linha} resolvido pelo índice e conferido na coluna I. Toda escrita por id passa aqui.
+    return conferir_linhas(ws, id_projeto, resolver_linhas(ws, id_projeto, ids))
+
 # --- LEITURA ---
 def carregar_projetos_ativos():
+    local = backend_local()
+    if local: return local.carregar_projetos_ativos()
     try:
-        ss = abrir_planilha()
-        ws = ss.worksheet("projetos")
-        data = retry_api(ws.get_all_records)
+        data = ler_registros_cache("projetos")
         if not data: return pd.DataFrame()
         df = pd.DataFrame(data)
         return df[df['status'] == 'Ativo'] if not df.empty else df
     except: return pd.DataFrame()
 
 def carregar_lotes_do_projeto(id_projeto):
+    local = backend_local()
+    if local: return local.carregar_lotes_do_projeto(id_projeto)
     try:
-        ss = abrir_planilha()
-        ws = ss.worksheet("controle_lotes")
-        data = retry_api(ws.get_all_records)
+        data = ler_registros_cache("controle_lotes")
         if not data: return pd.DataFrame()
         df = pd.DataFrame(data)
         if not df.empty:
             df['id_projeto'] = df['id_projeto'].astype(str)
-            return df[df['id_projeto'] == str(id_projeto)]
+            df = df[df['id_projeto'] == str(id_projeto)].copy()
+            # Reserva abandonada (lease vencido) volta a aparecer como Livre
+            lease = df['lease_ate'] if 'lease_ate' in df.columns else pd.Series("", index=df.index)
+            vencido = (df['status'] == 'Em Andamento') & lease.map(lease_vencido)
+            df.loc[vencido, 'status'] = 'Livre'
+            df.loc[vencido, 'usuario'] = ''
+            return df
         return df
     except: return pd.DataFrame()
 
+# --- ÍNDICE LOTE -> FAIXA DE LINHAS ---
+_controle_conferido = set()  # Planilhas cujo cabeçalho de controle_lotes já foi conferido neste processo
+
+def garantir_colunas_controle(ws_l):
+    # Garante o cabeçalho G1:I1 (linha_ini, linha_fim, lease_ate) em controle_lotes.
+    # Uma vez por processo: o cabeçalho não some depois de criado.
+    chave = getattr(ws_l, 'spreadsheet_id', None) or id(ws_l)
+    if chave in _controle_conferido: return
+    if ws_l.col_count < 9:
+        retry_api(ws_l.add_cols, 9 - ws_l.col_count)
+    header = retry_api(ws_l.row_values, 1) or []
+    if header[6:9] != COLS_EXTRA_CONTROLE:
+        retry_api(ws_l.update, range_name="G1:I1", values=[COLS_EXTRA_CONTROLE])
+    _controle_conferido.add(chave)
+
+def _buscar_faixa_lote(ss, id_projeto, numero_lote):
+    # Retorna (linha_controle, linha_ini, linha_fim). Faixa = 0 se o índice não existir.
+    try:
+        registros = ler_registros_cache("controle_lotes")
+        for i, row in enumerate(registros or []):
+            if str(row['id_projeto']) == str(id_projeto) and str(row['lote']) == str(numero_lote):
+                try: ini, fim = int(row.get('linha_ini') or 0), int(row.get('linha_fim') or 0)
+                except: ini, fim = 0, 0
+                return i + 2, ini, fim
+    except Exception as e:
+        print(f"Erro ao ler índice de lotes: {e}")
+    return None, 0, 0
+
+def _montar_df_faixa(linhas, linha_ini):
+    # O Sheets corta células vazias no fim da linha (ex.: link em branco)
+    linhas = [(list(l) + [""] * len(COLS_DADOS))[:len(COLS_DADOS)] for l in linhas]
+    df = pd.DataFrame(linhas, columns=COLS_DADOS)
+    df['_row_index'] = range(linha_ini, linha_ini + len(df))
+    return df
+
+def _faixa_confere(df, id_projeto, numero_lote, qtd_esperada):
+    # Se alguém inseriu/apagou linhas, a faixa deixa de bater com o lote
+    if len(df) != qtd_esperada: return False
+    return bool(((df['id_projeto'].astype(str) == str(id_projeto)) & (df['lote'].astype(str) == str(numero_lote))).all())
+
+def _varrer_dados_lote(ws, id_projeto, numero_lote):
+    # Fallback: baixa a aba inteira e filtra no pandas
+    raw_data = retry_api(ws.get_all_values)
+    if not raw_data or len(raw_data) < 2: return pd.DataFrame()
+    
+    headers = raw_data.pop(0) 
+    df = pd.DataFrame(raw_data, columns=headers)
+    df.columns = [str(c).lower().strip() for c in df.columns]
+
+    if '_row_index' not in df.columns:
+        df['_row_index'] = range(2, len(df) + 2)
+        
+    cols_essenciais = COLS_DADOS + ["_row_index"]
+    for col in cols_essenciais:
+        if col not in df.columns: df[col] = "" 
+    
+    if not df.empty:
+        df = df[cols_essenciais]
+        df['id_projeto'] = df['id_projeto'].astype(str)
+        df['lote'] = df['lote'].astype(str)
+        return df[(df['id_projeto'] == str(id_projeto)) & (df['lote'] == str(numero_lote))]
+    return df
+
+def _varrer_pelo_snapshot(id_projeto, numero_lote):
+    # Mesmo resultado de _varrer_dados_lote, pela cópia colunar (modules/snapshot_dados.py)
+    try:
+        from modules import snapshot_dados
+        if not snapshot_dados.disponivel(): return None
+        df = snapshot_dados.consultar(destino_dados_projeto(id_projeto), id_projeto, numero_lote, forcar=True)
+        return df[COLS_DADOS + ['_row_index']]
+    except Exception as e:
+        print(f"Snapshot indisponível ({e}). Usando varredura completa.")
+        return None
+
+def _regravar_faixa_lote(ss, linha_ctrl, df):
+    # Auto-correção do índice depois de uma varredura completa
+    try:
+        linhas = df['_row_index'].astype(int)
+        ini, fim = int(linhas.min()), int(linhas.max())
+        if fim - ini + 1 != len(df): return  # Lote não contíguo: não dá para indexar por faixa
+        ws_l = abrir_aba(ss, "controle_lotes")
+        garantir_colunas_controle(ws_l)
+        retry_api(ws_l.update, range_name=f"G{linha_ctrl}:H{linha_ctrl}", values=[[ini, fim]])
+        _atualizar_cache_lote(df['id_projeto'].iloc[0], df['lote'].iloc[0], "G", [ini, fim])
+        marcar_alteracao("controle_lotes")
+    except Exception as e:
+        print(f"Erro ao regravar índice do lote: {e}")
+
 def carregar_dados_lote(id_projeto, numero_lote):
+    local = backend_local()
+    if local: return local.carregar_dados_lote(id_projeto, numero_lote)
     try:
         ss = abrir_planilha()
-        ws = ss.worksheet("dados_brutos")
-        raw_data = retry_api(ws.get_all_values)
-        if not raw_data or len(raw_data) < 2: return pd.DataFrame()
-        
-        headers = raw_data.pop(0) 
-        df = pd.DataFrame(raw_data, columns=headers)
-        df.columns = [str(c).lower().strip() for c in df.columns]
+        ws = ws_dados_projeto(ss, id_projeto)
 
-        if '_row_index' not in df.columns:
-            df['_row_index'] = range(2, len(df) + 2)
-            
-        cols_essenciais = ["id_projeto", "lote", "ean", "descricao", "site", "cep", "endereco", "link", "_row_index"]
-        for col in cols_essenciais:
-            if col not in df.columns: df[col] = "" 
-        
+        # 1. Leitura só da faixa do lote (A{ini}:H{fim})
+        linha_ctrl, ini, fim = _buscar_faixa_lote(ss, id_projeto, numero_lote)
+        if ini >= 2 and fim >= ini:
+            linhas = retry_api(ws.get, f"A{ini}:{COL_FIM_DADOS}{fim}") or []
+            df = _montar_df_faixa(linhas, ini)
+            if _faixa_confere(df, id_projeto, numero_lote, fim - ini + 1):
+                registrar_linhas(id_projeto, df['id_linha'], df['_row_index'])
+                return df
+            print(f"⚠️ Índice do lote {numero_lote} desatualizado. Usando varredura completa.")
+
+        # 2. Fallback seguro: snapshot local conferido contra a aba (ou varredura completa)
+        df = _varrer_pelo_snapshot(id_projeto, numero_lote)
+        if df is None: df = _varrer_dados_lote(ws, id_projeto, numero_lote)
         if not df.empty:
-            df = df[cols_essenciais]
-            df['id_projeto'] = df['id_projeto'].astype(str)
-            df['lote'] = df['lote'].astype(str)
-            return df[(df['id_projeto'] == str(id_projeto)) & (df['lote'] == str(numero_lote))]
+            registrar_linhas(id_projeto, df['id_linha'], df['_row_index'])
+            if linha_ctrl: _regravar_faixa_lote(ss, linha_ctrl, df)
         return df
     except Exception as e:
         print(f"Erro carregar dados: {e}")
         return pd.DataFrame()
 
 # --- UPLOAD BLINDADO ---
-def processar_upload(df, nome_arq):
+TAM_BLOCO_UPLOAD = 5000  # linhas por update em dados_brutos
+
+def _montar_linhas_upload(df, id_p, tam, inicio=0, site_anterior=""):
+    # Monta as colunas A-J de dados_brutos de uma vez (sem iterrows).
+    # inicio = linhas dos blocos anteriores; site_anterior = último site do bloco anterior
+    n = len(df)
+    vazio = pd.Series([""] * n, index=df.index)
+    col = lambda k: df.iloc[:, k].str.strip() if len(df.columns) > k else vazio
+    site = col(0)
+    site = site.mask(site == "").ffill().fillna(site_anterior)  # Site em branco herda o de cima
+    return pd.DataFrame({
+        'id_projeto': id_p,
+        'lote': (np.arange(inicio, inicio + n) // tam) + 1,
+        'ean': col(2),
+        'descricao': col(1),
+        'site': site,
+        'cep': col(4),
+        'endereco': col(5),
+        'link': "",
+        'id_linha': pd.Series(np.arange(inicio, inicio + n), index=df.index).astype(str).radd(f"{id_p}-"),
+        'link_auto': ""
+    }, index=df.index)
+
+def _lotes_do_upload(dados):
+    # (lote, qtd, já preenchidos pelo reuso) de cada lote
+    por_lote = dados.assign(_feito=dados['link'] != "").groupby('lote')['_feito'].agg(['size', 'sum'])
+    return [(int(num), int(r['size']), int(r['sum'])) for num, r in por_lote.iterrows()]
+
+def _status_inicial(qtd, feitos):
+    # Lote que o reuso preencheu inteiro não vai para a fila manual
+    return ["Concluído", "auto"] if feitos == qtd else ["Livre", ""]
+
+def _arquivo_upload(id_p):
+    return caminho_local(f"upload_{id_p}.pkl")
+
+def _pasta_upload(id_p):
+    # Blocos já montados (A-J) do upload, um .pkl por bloco de TAM_BLOCO_UPLOAD linhas
+    pasta = caminho_local(f"upload_{id_p}")
+    os.makedirs(pasta, exist_ok=True)
+    return pasta
+
+def _guardar_bloco_upload(id_p, ini, dados):
+    with open(os.path.join(_pasta_upload(id_p), f"{ini}.pkl"), "wb") as f: pickle.dump(dados, f)
+
+def _bloco_upload(estado, ini):
+    if 'dados' in estado: return estado['dados'].iloc[ini:ini + TAM_BLOCO_UPLOAD]  # Estado antigo, com tudo em memória
+    with open(os.path.join(_pasta_upload(estado['id_p']), f"{ini}.pkl"), "rb") as f: return pickle.load(f)
+
+def _total_upload(estado):
+    return estado['n_linhas'] if 'n_linhas' in estado else len(estado['dados'])
+
+def _salvar_estado_upload(estado):
+    tmp = _arquivo_upload(estado['id_p']) + ".tmp"
+    with open(tmp, "wb") as f: pickle.dump(estado, f)
+    os.replace(tmp, _arquivo_upload(estado['id_p']))
+
+def uploads_pendentes():
+    # Uploads que falharam no meio e podem ser retomados
+    try:
+        return sorted(a[len("upload_"):-len(".pkl")] for a in os.listdir(DIR_LOCAL) if a.startswith("upload_") and a.endswith(".pkl"))
+    except FileNotFoundError: return []
+
+def _linha_do_append(resp):
+    # append_row devolve algo como {'updates': {'updatedRange': "projetos!A12:E12"}}
+    try:
+        m = re.search(r"![A-Z]+(\d+)", resp['updates']['updatedRange'])
+        return int(m.group(1))
+    except: return None
+
+def _gravar_dados_em_blocos(ss, estado):
+    ws_dados = abrir_aba_dados(ss, estado.get('destino', ABA_DADOS_PADRAO))
+    n = _total_upload(estado)
+    blocos = list(range(0, n, TAM_BLOCO_UPLOAD))
+    # O último bloco vai primeiro: assim o col_values(1) de outro upload
+    # já enxerga a faixa inteira como ocupada e não grava por cima
+    ordem = blocos[-1:] + blocos[:-1]
+    barra = st.progress(0.0, text=f"Gravando {n} linhas em {len(blocos)} bloco(s)...")
+    for ini in ordem:
+        if ini in estado['blocos_feitos']: continue
+        fim = min(ini + TAM_BLOCO_UPLOAD, n)
+        l_ini, l_fim = estado['prox_linha'] + ini, estado['prox_linha'] + fim - 1
+        retry_api(ws_dados.update, range_name=f"A{l_ini}:{COL_FIM_DADOS}{l_fim}", values=_bloco_upload(estado, ini).values.tolist())
+        estado['blocos_feitos'].add(ini)
+        _salvar_estado_upload(estado)
+        feitos = len(estado['blocos_feitos'])
+        barra.progress(feitos / len(blocos), text=f"📍 Bloco {feitos}/{len(blocos)}: A{l_ini}:{COL_FIM_DADOS}{l_fim}")
+
+def _finalizar_upload(ss, estado):
+    # Só libera o projeto para os operadores quando todas as linhas estão gravadas
+    ws_p = abrir_aba(ss, "projetos")
+    linha = estado.get('linha_projeto')
+    if not linha:
+        ids = retry_api(ws_p.col_values, 1) or []
+        linha = ids.index(estado['id_p']) + 1 if estado['id_p'] in ids else None
+    if linha: retry_api(ws_p.update, range_name=f"E{linha}", values=[["Ativo"]])
+    invalidar_cache("projetos")
+    marcar_alteracao("projetos")
+    _limpar_upload(estado['id_p'])
+
+def _limpar_upload(id_p):
+    try: os.remove(_arquivo_upload(id_p))
+    except FileNotFoundError: pass
+    shutil.rmtree(caminho_local(f"upload_{id_p}"), ignore_errors=True)
+
+def retomar_upload(id_p):
+    with open(_arquivo_upload(id_p), "rb") as f: estado = pickle.load(f)
+    ss = abrir_planilha()
+    _gravar_dados_em_blocos(ss, estado)
+    _finalizar_upload(ss, estado)
+    return estado['id_p'], _total_upload(estado), estado['tam']
+
+def _preparar_upload(blocos, id_p):
+    # Primeira passada: monta cada bloco (A-J), aplica o reuso e guarda em disco.
+    # Só as contagens por lote ficam em memória. Retorna (n_linhas, tam, lotes, n_auto).
+    from modules import reuso_links
+    n, tam, site_ant, n_auto, por_lote = 0, 100, "", 0, {}
+    for bloco in blocos:
+        if n == 0 and len(bloco):
+            # Tamanho do lote: coluna "Quantidade no Lote" da primeira linha
+            try:
+                val = bloco.iloc[0, 3]
+                if val and val.strip(): tam = int(float(val))
+            except: tam = 100
+        if bloco.empty: continue
+        dados = _montar_linhas_upload(bloco, id_p, tam, inicio=n, site_anterior=site_ant)
+        site_ant = dados['site'].iloc[-1]
+        # REUSO: linhas (ean, site) que já têm link coletado vêm preenchidas
+        try: n_auto += reuso_links.preencher_upload(dados)
+        except Exception as e: print(f"Erro no reuso de links: {e}")
+        for num, qtd, feitos in _lotes_do_upload(dados):
+            q, f = por_lote.get(num, (0, 0))
+            por_lote[num] = (q + qtd, f + feitos)
+        _guardar_bloco_upload(id_p, n, dados.reset_index(drop=True))
+        n += len(dados)
+    return n, tam, [(num, q, f) for num, (q, f) in sorted(por_lote.items())], n_auto
+
+def _novo_id_projeto():
+    # get_all_records transforma "01234567" ou "4459e909" em número: o id nunca pode parecer um
+    while True:
+        id_p = str(uuid.uuid4())[:8]
+        try: float(id_p)
+        except ValueError: return id_p
+
+def processar_upload(origem, nome_arq):
+    # origem: arquivo enviado (.xlsx ou .csv) ou DataFrame. Lido, montado e gravado
+    # em blocos de TAM_BLOCO_UPLOAD linhas (memória limitada ao bloco)
     st.divider()
     st.markdown("### 🛠️ UPLOAD COM CORREÇÃO DE POSIÇÃO")
 
+    id_p = _novo_id_projeto()
     try:
-        ss = abrir_planilha()
-        if ss is None: raise Exception("Falha Auth.")
-        
-        # --- TRATAMENTO ---
-        df = df.astype(str)
-        for termo in ["nan", "None", "NaT", "<NA>"]:
-            df = df.replace(termo, "")
+        from modules import leitor_upload
+        local = backend_local()
+        ss = None if local else abrir_planilha()
+        if ss is None and not local: raise Exception("Falha Auth.")
 
-        if len(df.columns) < 3:
-            st.error("❌ Excel inválido (poucas colunas).")
+        # --- LEITURA + TRATAMENTO (por bloco) ---
+        st.write("📖 Lendo o arquivo em blocos...")
+        avisos = []
+        blocos = leitor_upload.ler_blocos(origem, nome_arq, TAM_BLOCO_UPLOAD, avisos)
+        try:
+            n, tam, lotes_upload, n_auto = _preparar_upload(blocos, id_p)
+        except ValueError as e:
+            _limpar_upload(id_p)
+            st.error(f"❌ {e}")
             return None, 0, 0
+        for aviso in avisos: st.warning(f"⚠️ Cabeçalho fora do modelo: {aviso}")
+        if n_auto: st.info(f"♻️ {n_auto} link(s) reaproveitado(s) de coletas anteriores (marcados para revisão).")
+        total_lotes = len(lotes_upload)
+        blocos = range(0, n, TAM_BLOCO_UPLOAD)
+        nome = os.path.splitext(nome_arq)[0]
 
-        id_p = str(uuid.uuid4())[:8]
-        
-        # Tamanho do lote
-        tam = 100
-        try:
-            if len(df.columns) > 3:
-                val = df.iloc[0, 3]
-                if val and val.strip(): tam = int(float(val))
-        except: tam = 100
-        
-        total_lotes = (len(df) // tam) + (1 if len(df) % tam > 0 else 0)
-        l_dados, l_lotes = [], []
-
-        # MONTAGEM DA LISTA
-        for i in range(total_lotes):
-            num = i + 1
-            sub = df.iloc[i*tam : (i+1)*tam]
-            for _, r in sub.iterrows():
-                d_site = str(r.iloc[0]).strip()
-                d_desc = str(r.iloc[1]).strip()
-                d_ean  = str(r.iloc[2]).strip()
-                d_cep  = str(r.iloc[4]).strip() if len(r) > 4 else ""
-                d_end  = str(r.iloc[5]).strip() if len(r) > 5 else ""
-                
-                if d_site == "" and l_dados: d_site = l_dados[-1][4]
-
-                l_dados.append([id_p, num, d_ean, d_desc, d_site, d_cep, d_end, ""])
-            l_lotes.append([id_p, num, "Livre", "", f"0/{len(sub)}", ""])
+        if local:
+            l_lotes = [[id_p, num] + _status_inicial(qtd, feitos) + [f"{feitos}/{qtd}", ""] for num, qtd, feitos in lotes_upload]
+            local.criar_projeto(id_p, nome, datetime.now(TZ_BRASIL).strftime("%d/%m/%Y"), total_lotes, l_lotes,
+                                (_bloco_upload({'id_p': id_p}, ini) for ini in blocos))
+            _limpar_upload(id_p)
+            st.success(f"✅ {n} linhas gravadas no banco local!")
+            return id_p, n, tam
+
+        if MODO_SHARD in ("aba", "planilha"):
+            # Shard próprio: o projeto começa na linha 2, sem ler nada
+            destino = _criar_shard(ss, id_p, nome, n)
+            prox_linha = 2
+        else:
+            # Aba compartilhada: descobre a última linha (coluna A) para indexar as faixas
+            destino = ABA_DADOS_PADRAO
+            ws_dados = abrir_aba_dados(ss, destino)
+            garantir_coluna_id(ws_dados)
+            col_a = retry_api(ws_dados.col_values, 1)
+            prox_linha = len(col_a) + 1
+
+        l_lotes = []
+        for num, qtd, feitos in lotes_upload:
+            linha_ini = prox_linha + (num - 1) * tam
+            l_lotes.append([id_p, num] + _status_inicial(qtd, feitos) + [f"{feitos}/{qtd}", "", linha_ini, linha_ini + qtd - 1, ""])
             
         # --- GRAVAÇÃO ---
+        # O projeto nasce como "Enviando" e só vira "Ativo" no fim dos blocos
         st.write("🚀 Gravando abas de controle...")
-        retry_api(ss.worksheet("projetos").append_row, [id_p, nome_arq.replace(".xlsx",""), datetime.now(TZ_BRASIL).strftime("%d/%m/%Y"), int(total_lotes), "Ativo"])
-        retry_api(ss.worksheet("controle_lotes").append_rows, l_lotes)
-        
-        if l_dados:
-            st.write(f"⏳ Calculando posição correta para {len(l_dados)} linhas...")
-            ws_dados = ss.worksheet("dados_brutos")
-            
-            # 1. Descobre a última linha (coluna A)
-            col_a = retry_api(ws_dados.col_values, 1) 
-            prox_linha = len(col_a) + 1
-            
-            # 2. Define o Range
-            linha_final = prox_linha + len(l_dados) - 1
-            range_destino = f"A{prox_linha}:H{linha_final}"
-            
-            st.write(f"📍 Gravando forçadamente em: `{range_destino}`")
-            
-            # 3. Update
-            retry_api(ws_dados.update, range_name=range_destino, values=l_dados)
-            
-            st.success("✅ DADOS SALVOS NAS COLUNAS CERTAS (A-H)!")
+        ws_p = abrir_aba(ss, "projetos")
+        garantir_coluna_destino(ws_p)
+        resp = retry_api(ws_p.append_row, [id_p, nome, datetime.now(TZ_BRASIL).strftime("%d/%m/%Y"), int(total_lotes), "Enviando", "" if destino == ABA_DADOS_PADRAO else destino])
+        ws_lotes = abrir_aba(ss, "controle_lotes")
+        garantir_colunas_controle(ws_lotes)
+        retry_api(ws_lotes.append_rows, l_lotes)
+        invalidar_cache("projetos")
+        invalidar_cache("controle_lotes")
+        marcar_alteracao("projetos", "controle_lotes")
+
+        estado = {
+            'id_p': id_p, 'tam': tam, 'prox_linha': prox_linha, 'destino': destino,
+            'linha_projeto': _linha_do_append(resp), 'blocos_feitos': set(), 'n_linhas': n
+        }
+        _salvar_estado_upload(estado)
         
-        return id_p, len(df), tam
+        if n:
+            st.write(f"⏳ Gravando {n} linhas a partir da linha {prox_linha}...")
+            try:
+                _gravar_dados_em_blocos(ss, estado)
+            except Exception:
+                st.warning(f"⚠️ Upload interrompido. Os blocos já gravados foram guardados; use 'Retomar' para o projeto {id_p}.")
+                raise
+            st.success("✅ DADOS SALVOS NAS COLUNAS CERTAS (A-J)!")
+
+        _finalizar_upload(ss, estado)
+        return id_p, n, tam
 
     except Exception as e:
         st.error(f"❌ ERRO: {e}")
         traceback.print_exc()
+        if not os.path.exists(_arquivo_upload(id_p)): _limpar_upload(id_p)  # Sem estado salvo não há o que retomar
         raise e
     
 def gerar_modelo_padrao():
-    colunas = ["Site*", "Descrição*", "EAN*", "Quantidade no Lote*", "CEP", "Endereço"]
-    df = pd.DataFrame(columns=colunas)
+    from modules import leitor_upload
+    df = pd.DataFrame(columns=leitor_upload.COLS_MODELO)
     out = io.BytesIO()
     with pd.ExcelWriter(out, engine='openpyxl') as writer: df.to_excel(writer, index=False)
     return out.getvalue()
 
 # --- FUNÇÕES DE ESCRITA ---
 
+def _localizar_linha_lote(ws_l, id_projeto, numero_lote):
+    # Acha a linha do lote em controle_lotes pelo cache e confere só ela (A:I).
+    # Se a linha mudou de lugar, invalida o cache e procura de novo.
+    for tentativa in range(2):
+        registros = ler_registros_cache("controle_lotes")
+        for i, row in enumerate(registros):
+            if str(row.get('id_projeto')) == str(id_projeto) and str(row.get('lote')) == str(numero_lote):
+                linha = i + 2
+                atual = (retry_api(ws_l.get, f"A{linha}:I{linha}") or [[]])[0]
+                atual = (list(atual) + [""] * 9)[:9]
+                if str(atual[0]) == str(id_projeto) and str(atual[1]) == str(numero_lote):
+                    return linha, atual
+                break
+        invalidar_cache("controle_lotes")
+    return None, None
+
+# --- RESERVAS (LEASE) ---
+# Uma reserva vale LEASE_MINUTOS e é renovada enquanto o operador trabalha.
+# Lote "Em Andamento" com lease vencido (ou sem lease) pode ser pego de novo.
+LEASE_MINUTOS = 30
+FMT_LEASE = "%Y-%m-%d %H:%M:%S"
+# Espera (s, mín,máx) entre gravar a reserva e reler a linha. A releitura NÃO é
+# compare-and-set: o Sheets não tem escrita condicional, então ela só estreita a
+# corrida entre processos. Se o outro processo gravar depois da nossa releitura,
+# os dois acham que ficaram com o lote; quem entrega é o dono atual da linha
+# (salvar_progresso_lote confere o usuário).
+ESPERA_CONFERENCIA_RESERVA = tuple(float(x) for x in os.environ.get("COLETA_ESPERA_RESERVA", "0.2,0.6").split(","))
+_lock_reserva = threading.Lock()
+
+def novo_lease():
+    return (datetime.now(TZ_BRASIL) + timedelta(minutes=LEASE_MINUTOS)).strftime(FMT_LEASE)
+
+def lease_vencido(valor):
+    try: ate = datetime.strptime(str(valor).strip(), FMT_LEASE).replace(tzinfo=TZ_BRASIL)
+    except: return True
+    return ate < datetime.now(TZ_BRASIL)
+
+def pode_reservar(status, dono, lease, usuario):
+    if status == "Livre": return True
+    if status == "Em Andamento": return dono == usuario or lease_vencido(lease)
+    return False
+
 def reservar_lote(id_projeto, numero_lote, usuario):
+    local = backend_local()
+    if local: return local.reservar_lote(id_projeto, numero_lote, usuario)
     try:
         ss = abrir_planilha()
-        ws = ss.worksheet("controle_lotes")
-        registros = retry_api(ws.get_all_records)
-        if not registros: return False
-        for i, row in enumerate(registros):
-            if str(row['id_projeto']) == str(id_projeto) and str(row['lote']) == str(numero_lote):
-                linha = i + 2 
-                if row['status'] == "Livre" or (row['status'] == "Em Andamento" and row['usuario'] == usuario):
-                    retry_api(ws.update, range_name=f"C{linha}:D{linha}", values=[["Em Andamento", usuario]])
-                    return True
-    except: pass
+        ws = abrir_aba(ss, "controle_lotes")
+        garantir_colunas_controle(ws)
+        with _lock_reserva:  # Serializa só ler-conferir-escrever deste processo
+            # 1. Localiza a linha e relê só ela logo antes de escrever
+            linha, atual = _localizar_linha_lote(ws, id_projeto, numero_lote)
+            if not linha: return False
+            if not pode_reservar(atual[2], atual[3], atual[8], usuario):
+                # Cache velho (ex.: lease renovado em outra réplica): fica com o que a planilha diz
+                _atualizar_cache_lote(id_projeto, numero_lote, "C", atual[2:4])
+                _atualizar_cache_lote(id_projeto, numero_lote, "I", [atual[8]])
+                return False
+            retomada = atual[2] == "Em Andamento" and atual[3] == usuario
+            lease = novo_lease()
+            retry_api(ws.batch_update, [
+                {'range': f"C{linha}:D{linha}", 'values': [["Em Andamento", usuario]]},
+                {'range': f"I{linha}", 'values': [[lease]]}
+            ])
+        # 2. Confere depois de escrever (fora da trava: quem vem depois neste processo
+        # já vê o lote reservado): se outro processo gravou junto, em geral só um fica
+        # com o lote. Retomada do próprio lote não disputa nada: sem espera nem releitura.
+        if not retomada:
+            time.sleep(random.uniform(*ESPERA_CONFERENCIA_RESERVA))
+            depois = (retry_api(ws.get, f"C{linha}:D{linha}") or [[]])[0]
+            if list(depois[:2]) != ["Em Andamento", usuario]:
+                invalidar_cache("controle_lotes")
+                return False
+        _atualizar_cache_lote(id_projeto, numero_lote, "C", ["Em Andamento", usuario])
+        _atualizar_cache_lote(id_projeto, numero_lote, "I", [lease])
+        marcar_alteracao("controle_lotes")
+        return True
+    except Exception as e:
+        print(f"Erro ao reservar lote: {e}")
     return False
 
+def renovar_lease(id_projeto, numero_lote, usuario):
+    local = backend_local()
+    if local: return local.renovar_lease(id_projeto, numero_lote, usuario)
+    # Retorna False se o lote não é mais deste usuário (lease venceu e outro pegou)
+    try:
+        ss = abrir_planilha()
+        ws = abrir_aba(ss, "controle_lotes")
+        linha, atual = _localizar_linha_lote(ws, id_projeto, numero_lote)
+        if not linha: return False
+        if atual[2] != "Em Andamento" or atual[3] != usuario: return False
+        lease = novo_lease()
+        retry_api(ws.update, range_name=f"I{linha}", values=[[lease]])
+        _atualizar_cache_lote(id_projeto, numero_lote, "I", [lease])
+        # Sem marcar_alteracao: renovar é a escrita mais frequente e faria todas as
+        # réplicas baixarem controle_lotes. Cache com lease velho pode mostrar o lote
+        # como livre; reservar_lote relê a linha antes de escrever e recusa.
+        return True
+    except Exception as e:
+        print(f"Erro ao renovar lease: {e}")
+        return True  # Falha de rede não tira o lote do operador
+
 # ⚠️ SALVAMENTO EM LOTE COM CONEXÃO CACHEADA
-def salvar_lote_links(id_projeto, numero_lote, alteracoes):
+def _registrar_reuso(ean, site, link):
+    try:
+        from modules import reuso_links
+        reuso_links.get_indice().registrar(ean, site, link)
+    except Exception as e:
+        print(f"Erro ao atualizar índice de reuso: {e}")
+
+# descartados: lista que recebe os id_linha que não foram achados na aba
+def salvar_lote_links(id_projeto, numero_lote, alteracoes, descartados=None):
+    if alteracoes and any(a.get('ean') for a in alteracoes):
+        _registrar_reuso([a.get('ean', "") for a in alteracoes], [a.get('site', "") for a in alteracoes], [a['link'] for a in alteracoes])
+    local = backend_local()
+    if local: return local.salvar_lote_links(alteracoes)
     if not alteracoes: return True
 
     try:
         ss = abrir_planilha() # USA O CACHE
-        ws = ss.worksheet("dados_brutos")
+        ws = ws_dados_projeto(ss, id_projeto)
+
+        # Linha pelo id estável quando houver, conferida contra a coluna I antes de escrever
+        ids = [str(a['id_linha']) for a in alteracoes if a.get('id_linha')]
+        mapa = localizar_linhas(ws, id_projeto, ids) if ids and id_projeto is not None else {}
         
         batch_data = []
+        perdidos = []
         for item in alteracoes:
-            linha = item['indice_excel'] 
+            id_l = str(item.get('id_linha') or "")
+            if id_l and id_projeto is not None:
+                # Com id, só a linha achada pelo id vale: o indice_excel pode ser de outra linha agora
+                if id_l not in mapa:
+                    perdidos.append(id_l)
+                    continue
+                linha = mapa[id_l]
+            else: linha = item['indice_excel']
             link = item['link']
             batch_data.append({
                 'range': f"H{linha}",
                 'values': [[link]]
             })
         
+        _avisar_perdidos(id_projeto, perdidos, descartados)
         if batch_data:
             retry_api(ws.batch_update, batch_data)
             return True
@@ -254,11 +1065,24 @@ def salvar_lote_links(id_projeto, numero_lote, alteracoes):
         return False
     return True
 
+def _avisar_perdidos(id_projeto, perdidos, descartados):
+    # Links cujo id_linha não existe mais na aba (linha apagada): não vão para linha nenhuma
+    if not perdidos: return
+    print(f"⚠️ Projeto {id_projeto}: {len(perdidos)} link(s) descartados, linha não existe mais ({', '.join(perdidos[:5])}).")
+    if descartados is not None: descartados.extend(perdidos)
+
 # ⚠️ SANITIZAÇÃO DE DADOS (CORRIGE O ERRO DE JSON)
-def salvar_progresso_lote(df_editado, id_projeto, numero_lote, concluir=False, checkpoint_val=""):
+# sincronizados: {linha: link já confirmado no Sheets}. Quando informado,
+# só as células que diferem dele são enviadas, e ele é atualizado no lugar.
+def salvar_progresso_lote(df_editado, id_projeto, numero_lote, concluir=False, checkpoint_val="", sincronizados=None, usuario=None, descartados=None):
+    # Com concluir=True e usuario, só entrega se o lote ainda é dele (False se outro pegou)
+    if 'ean' in df_editado.columns and 'site' in df_editado.columns:
+        _registrar_reuso(df_editado['ean'], df_editado['site'], df_editado['link'])
+    local = backend_local()
+    if local: return local.salvar_progresso_lote(df_editado, id_projeto, numero_lote, concluir, checkpoint_val, sincronizados, usuario)
     ss = abrir_planilha() # USA O CACHE
-    ws_d = ss.worksheet("dados_brutos")
-    ws_l = ss.worksheet("controle_lotes")
+    ws_d = ws_dados_projeto(ss, id_projeto)
+    ws_l = abrir_aba(ss, "controle_lotes")
     
     updates = []
     
@@ -266,128 +1090,276 @@ def salvar_progresso_lote(df_editado, id_projeto, numero_lote, concluir=False, c
     df_safe = df_editado.copy()
     df_safe['link'] = df_safe['link'].fillna("")
     
-    if '_row_index' in df_safe.columns:
-        for _, row in df_safe.iterrows():
-            try:
-                # GARANTE INT E STRING PUROS
-                linha = int(row['_row_index'])
-                link_val = str(row['link']) if row['link'] else ""
-                updates.append({
-                    'range': f'H{linha}', 
-                    'values': [[link_val]]
-                })
-            except: continue
+    # Linha de destino: pelo id estável (índice conferido contra a coluna I) ou,
+    # sem id, pelo _row_index da carga. 'chaves' é a linha que a sessão conhece,
+    # usada no dict de sincronizados.
+    chaves = []
+    destino = {}
+    ids = df_safe['id_linha'].fillna("").astype(str) if 'id_linha' in df_safe.columns else pd.Series("", index=df_safe.index)
+    if (ids != "").any():
+        destino = localizar_linhas(ws_d, id_projeto, [i for i in ids if i])
+
+    if '_row_index' in df_safe.columns or destino:
+        linhas = pd.to_numeric(df_safe['_row_index'], errors='coerce') if '_row_index' in df_safe.columns else pd.Series(np.nan, index=df_safe.index)
+        links = df_safe['link'].astype(str)
+        perdidos = []
+        for linha, id_l, link_val in zip(linhas, ids, links):
+            # GARANTE INT E STRING PUROS
+            chave = None if pd.isna(linha) else int(linha)
+            if id_l and id_l not in destino:
+                perdidos.append(id_l)  # Linha apagada: o _row_index antigo pode ser de outra linha agora
+                continue
+            alvo = destino.get(id_l, chave)
+            if alvo is None: continue
+            chave = alvo if chave is None else chave
+            # Linha que mudou de lugar é sempre reenviada
+            if sincronizados is not None and alvo == chave and sincronizados.get(chave) == link_val: continue
+            updates.append({
+                'range': f'H{alvo}', 
+                'values': [[link_val]]
+            })
+            chaves.append(chave)
+        _avisar_perdidos(id_projeto, perdidos, descartados)
     else:
-        # Fallback
-        todos = retry_api(ws_d.get_all_records)
-        if todos:
-            mapa = {}
-            for i, row in enumerate(todos):
+        # Fallback (linhas sem id e sem _row_index): EAN repetido no lote
+        # ocupa as linhas na ordem em que aparecem
+        mapa = {}
+        df_lote = _varrer_pelo_snapshot(id_projeto, numero_lote)
+        if df_lote is not None:
+            for rean, linha in zip(df_lote['ean'].astype(str), df_lote['_row_index']):
+                mapa.setdefault(rean, []).append(int(linha))
+        else:
+            todos = retry_api(ws_d.get_all_records)
+            for i, row in enumerate(todos or []):
                 rid = str(row.get('id_projeto', list(row.values())[0]))
                 rlote = str(row.get('lote', list(row.values())[1]))
                 rean = str(row.get('ean', list(row.values())[2]))
                 if rid == str(id_projeto) and rlote == str(numero_lote):
-                    mapa[rean] = i + 2
+                    mapa.setdefault(rean, []).append(i + 2)
+        if mapa:
             for _, row in df_safe.iterrows():
-                linha = mapa.get(str(row['ean']))
+                fila_ean = mapa.get(str(row['ean']))
+                linha = fila_ean.pop(0) if fila_ean else None
                 link_val = str(row['link']) if row['link'] else ""
                 if linha: 
                     updates.append({
                         'range': f'H{linha}', 
                         'values': [[link_val]]
                     })
+                    chaves.append(linha)
 
-    # 2. ENVIAR DADOS
+    # 2. ENVIAR DADOS (só o que não está sincronizado)
     if updates:
         try:
             retry_api(ws_d.batch_update, updates)
+            if sincronizados is not None:
+                for u, chave in zip(updates, chaves): sincronizados[chave] = u['values'][0][0]
         except Exception as e:
             print(f"Erro ao salvar links finais: {e}")
 
-    # 3. ATUALIZAR STATUS
+    # 3. ATUALIZAR STATUS (uma linha, localizada sem varrer a aba)
     preenchidos = len(df_safe[df_safe['link'].str.strip() != ""])
     prog_str = f"{preenchidos}/{len(df_safe)}"
     
-    lotes = retry_api(ws_l.get_all_records)
-    if lotes:
-        for i, row in enumerate(lotes):
-            if str(row['id_projeto']) == str(id_projeto) and str(row['lote']) == str(numero_lote):
-                linha = i + 2
-                
-                if concluir:
-                    usr_atual = row.get('usuario', '')
-                    retry_api(ws_l.update, range_name=f"C{linha}:F{linha}", values=[["Concluído", usr_atual, prog_str, ""]])
-                else:
-                    vals = [prog_str]
-                    rg = f"E{linha}"
-                    if checkpoint_val: 
-                        vals.append(checkpoint_val) 
-                        rg = f"E{linha}:F{linha}"
-                    retry_api(ws_l.update, range_name=rg, values=[vals])
-                break
+    linha, atual = _localizar_linha_lote(ws_l, id_projeto, numero_lote)
+    if linha:
+        if concluir:
+            usr_atual = atual[3]
+            if usuario is not None and (atual[2] != "Em Andamento" or usr_atual != usuario):
+                invalidar_cache("controle_lotes")
+                return False
+            retry_api(ws_l.batch_update, [
+                {'range': f"C{linha}:F{linha}", 'values': [["Concluído", usr_atual, prog_str, ""]]},
+                {'range': f"I{linha}", 'values': [[""]]}
+            ])
+            _atualizar_cache_lote(id_projeto, numero_lote, "C", ["Concluído", usr_atual, prog_str, ""])
+            _atualizar_cache_lote(id_projeto, numero_lote, "I", [""])
+        else:
+            vals = [prog_str]
+            rg = f"E{linha}"
+            if checkpoint_val: 
+                vals.append(checkpoint_val) 
+                rg = f"E{linha}:F{linha}"
+            retry_api(ws_l.update, range_name=rg, values=[vals])
+            _atualizar_cache_lote(id_projeto, numero_lote, "E", vals)
+        marcar_alteracao("controle_lotes")
     return True
 
 def salvar_log_tempo(usuario, id_proj, nome_proj, num_lote, duracao, acao, total, feitos):
+    # Só enfileira: quem grava no Sheets é o EscritorLog (modules/log_tempo.py)
     if duracao < 5: return 
-    try:
-        ss = abrir_planilha()
-        try: ws = ss.worksheet("registro_tempo")
-        except: 
-            ws = ss.add_worksheet("registro_tempo", 1000, 9)
-            ws.append_row(["id", "lote", "data", "responsavel", "h_ini", "h_fim", "duracao", "projeto", "desc"])
-        fim = datetime.now(TZ_BRASIL)
-        ini = fim - timedelta(seconds=duracao)
-        try:
-            ws.append_row([str(uuid.uuid4()), str(num_lote), ini.strftime("%Y-%m-%d"), str(usuario), ini.strftime("%H:%M:%S"), fim.strftime("%H:%M:%S"), int(duracao), str(nome_proj), f"{acao} ({feitos}/{total})"])
+    from modules import log_tempo
+    fim = datetime.now(TZ_BRASIL)
+    ini = fim - timedelta(seconds=duracao)
+    log_tempo.get_escritor().registrar([str(uuid.uuid4()), str(num_lote), ini.strftime("%Y-%m-%d"), str(usuario), ini.strftime("%H:%M:%S"), fim.strftime("%H:%M:%S"), int(duracao), str(nome_proj), f"{acao} ({feitos}/{total})", str(id_proj)])
+
+# --- EXPORTAÇÃO (STREAMING) ---
+LINHAS_POR_LEITURA_EXPORT = 20000  # linhas por batch_get
+COLUNAS_EXPORT = [
+    ('ean', 'EAN'),
+    ('descricao', 'Descrição do Produto'),
+    ('site', 'Site/Loja'),
+    ('link', 'LINK COLETADO'),
+    ('cep', 'CEP'),
+    ('endereco', 'Endereço'),
+    ('link_auto', 'Link Reaproveitado'),
+    ('lote', 'Lote de Origem')  # Sempre por último (vira inteiro na exportação)
+]
+FORMATOS_EXPORT = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+    'parquet': 'application/octet-stream'
+}
+
+class _IndiceDesatualizado(Exception): pass
+
+def _juntar_faixas(faixas):
+    # Junta faixas encostadas: (1,100),(101,200) -> (1,200)
+    res = []
+    for ini, fim in sorted(faixas):
+        if res and ini <= res[-1][1] + 1: res[-1] = (res[-1][0], max(res[-1][1], fim))
+        else: res.append((ini, fim))
+    return res
+
+def _faixas_pelo_indice(id_p):
+    faixas = []
+    for row in ler_registros_cache("controle_lotes"):
+        if str(row.get('id_projeto')) != str(id_p): continue
+        try: ini, fim = int(row.get('linha_ini') or 0), int(row.get('linha_fim') or 0)
+        except: return None
+        if ini < 2 or fim < ini: return None  # Lote sem índice: não dá para confiar
+        faixas.append((ini, fim))
+    return _juntar_faixas(faixas) or None
+
+def _faixas_pela_coluna_a(ws, id_p):
+    # Fallback barato: baixa só a coluna A (id_projeto) e acha as linhas do projeto
+    col_a = retry_api(ws.col_values, 1) or []
+    return _juntar_faixas((i + 1, i + 1) for i, v in enumerate(col_a) if i > 0 and str(v) == str(id_p))
+
+def _iterar_linhas_projeto(ws, id_p, faixas, validar):
+    # Gera as linhas (A-J) do projeto, no máximo LINHAS_POR_LEITURA_EXPORT por chamada
+    pedacos = []
+    for ini, fim in faixas:
+        for a in range(ini, fim + 1, LINHAS_POR_LEITURA_EXPORT):
+            pedacos.append((a, min(a + LINHAS_POR_LEITURA_EXPORT - 1, fim)))
+    grupo, qtd = [], 0
+    for item in pedacos + [None]:
+        a, b = item or (None, None)
+        if (a is None or qtd + (b - a + 1) > LINHAS_POR_LEITURA_EXPORT) and grupo:
+            blocos = retry_api(ws.batch_get, [f"A{x}:{COL_FIM_DADOS}{y}" for x, y in grupo]) or []
+            for bloco in blocos:
+                for linha in bloco:
+                    linha = (list(linha) + [""] * len(COLS_DADOS))[:len(COLS_DADOS)]
+                    if str(linha[0]) != str(id_p):
+                        if validar: raise _IndiceDesatualizado()
+                        continue
+                    yield linha
+            grupo, qtd = [], 0
+        if a is None: break
+        grupo.append((a, b)); qtd += b - a + 1
+
+def _linhas_export(linhas):
+    idx = [COLS_DADOS.index(c) for c, _ in COLUNAS_EXPORT]
+    for linha in linhas:
+        linha = list(linha) + [""] * (len(COLS_DADOS) - len(linha))  # Banco local/arquivo antigo: colunas a menos
+        saida = [linha[i] for i in idx]
+        try: saida[-1] = int(float(saida[-1]))  # Lote numérico
         except: pass
-    except: pass
+        yield saida
+
+def _escrever_xlsx(linhas):
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws_out = wb.create_sheet("Sheet1")
+    ws_out.column_dimensions['B'].width = 50 
+    ws_out.column_dimensions['D'].width = 60 
+    ws_out.append([t for _, t in COLUNAS_EXPORT])
+    n = 0
+    for linha in linhas:
+        ws_out.append(linha); n += 1
+    out = io.BytesIO()
+    wb.save(out)
+    return out.getvalue(), n
+
+def _escrever_csv(linhas):
+    import csv
+    out = io.StringIO()
+    w = csv.writer(out, delimiter=";")
+    w.writerow([t for _, t in COLUNAS_EXPORT])
+    n = 0
+    for linha in linhas:
+        w.writerow(linha); n += 1
+    return out.getvalue().encode("utf-8-sig"), n
+
+def _escrever_parquet(linhas):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    nomes = [t for _, t in COLUNAS_EXPORT]
+    schema = pa.schema([(t, pa.string()) for t in nomes[:-1]] + [(nomes[-1], pa.int64())])
+    out = io.BytesIO()
+    n = 0
+    with pq.ParquetWriter(out, schema, compression="zstd") as w:
+        buffer = []
+        for linha in linhas:
+            if not isinstance(linha[-1], int): linha[-1] = None
+            buffer.append(linha); n += 1
+            if len(buffer) >= LINHAS_POR_LEITURA_EXPORT:
+                w.write_table(pa.Table.from_pylist([dict(zip(nomes, l)) for l in buffer], schema=schema)); buffer = []
+        if buffer: w.write_table(pa.Table.from_pylist([dict(zip(nomes, l)) for l in buffer], schema=schema))
+    return out.getvalue(), n
 
-def baixar_excel(id_p):
-    print(f"--- 📥 INICIANDO DOWNLOAD DO PROJETO {id_p} ---")
+def baixar_excel(id_p, formato="xlsx", conferido=False):
+    # Lê só as linhas do projeto (pelo índice de faixas) e escreve em streaming.
+    # conferido=True: o snapshot acabou de ser conferido com a aba (exportacao.versao_dados)
+    print(f"--- 📥 INICIANDO DOWNLOAD DO PROJETO {id_p} ({formato}) ---")
+    escritores = {'xlsx': _escrever_xlsx, 'csv': _escrever_csv, 'parquet': _escrever_parquet}
     try:
+        escrever = escritores[formato]
+        from modules import arquivamento
+        if arquivamento.esta_arquivado(id_p):
+            conteudo, n = escrever(_linhas_export(arquivamento.iterar_linhas(id_p)))
+            return conteudo if n else None
+
+        local = backend_local()
+        if local:
+            conteudo, n = escrever(_linhas_export(local.iterar_linhas_projeto(id_p)))
+            return conteudo if n else None
+
+        # Snapshot colunar: confere a aba (colunas A e H:I) e lê só os batches do projeto
+        from modules import snapshot_dados
+        if snapshot_dados.disponivel():
+            try:
+                destino = destino_dados_projeto(id_p)
+                if not conferido: snapshot_dados.atualizar(destino, forcar=True)
+                conteudo, n = escrever(_linhas_export(snapshot_dados.iterar_linhas(destino, id_p)))
+                if n:
+                    print(f"✅ Arquivo gerado pelo snapshot! ({n} linhas)")
+                    return conteudo
+            except Exception as e:
+                print(f"Snapshot indisponível ({e}). Lendo pelo índice de faixas.")
+
         ss = abrir_planilha()
-        ws = ss.worksheet("dados_brutos")
-        data = retry_api(ws.get_all_values)
-        
-        if not data or len(data) < 2: 
-            print("❌ Planilha vazia ou sem dados.")
-            return None
+        ws = ws_dados_projeto(ss, id_p)
 
-        headers = [str(h).lower().strip() for h in data[0]]
-        df = pd.DataFrame(data[1:], columns=headers)
-        df_filtrado = df[df['id_projeto'].astype(str) == str(id_p)].copy()
-        
-        if df_filtrado.empty: return None
-
-        colunas_finais = {
-            'ean': 'EAN',
-            'descricao': 'Descrição do Produto',
-            'site': 'Site/Loja',
-            'link': 'LINK COLETADO',
-            'cep': 'CEP',
-            'endereco': 'Endereço',
-            'lote': 'Lote de Origem'
-        }
-        
-        cols_existentes = [c for c in colunas_finais.keys() if c in df_filtrado.columns]
-        df_final = df_filtrado[cols_existentes].rename(columns=colunas_finais)
-        
-        if 'Lote de Origem' in df_final.columns:
+        faixas = _faixas_pelo_indice(id_p)
+        conteudo, n = None, 0
+        if faixas:
             try:
-                df_final['Lote de Origem'] = pd.to_numeric(df_final['Lote de Origem'])
-                df_final = df_final.sort_values(by=['Lote de Origem'])
-            except: pass
-
-        out = io.BytesIO()
-        with pd.ExcelWriter(out, engine='openpyxl') as writer:
-            df_final.to_excel(writer, index=False)
-            ws_out = writer.sheets['Sheet1']
-            ws_out.column_dimensions['B'].width = 50 
-            ws_out.column_dimensions['D'].width = 60 
-            
-        print("✅ Excel gerado com sucesso!")
-        return out.getvalue()
+                conteudo, n = escrever(_linhas_export(_iterar_linhas_projeto(ws, id_p, faixas, validar=True)))
+            except _IndiceDesatualizado:
+                print("⚠️ Índice de faixas desatualizado. Usando a coluna A.")
+                conteudo = None
+        if conteudo is None:
+            faixas = _faixas_pela_coluna_a(ws, id_p)
+            if not faixas:
+                print("❌ Projeto sem dados.")
+                return None
+            conteudo, n = escrever(_linhas_export(_iterar_linhas_projeto(ws, id_p, faixas, validar=False)))
+
+        if n == 0: return None
+        print(f"✅ Arquivo gerado com sucesso! ({n} linhas)")
+        return conteudo
         
     except Exception as e:
         print(f"❌ Erro crítico no download: {e}")
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,87 @@
+import streamlit as st
+import threading
+import time
+import uuid
+import pandas as pd
+
+# --- LOTES EM MEMÓRIA POR SESSÃO ---
+# O DataFrame do lote de cada operador fica aqui (um armazém por processo),
+# e não direto no st.session_state, para o admin conseguir medir quanto cada
+# sessão ocupa e para lotes de sessões ociosas poderem ser descartados. A
+# sessão que volta depois do despejo simplesmente recarrega o lote.
+
+TEMPO_OCIOSO_MIN = 30            # sem interação por esse tempo -> df_cache é descartado
+INTERVALO_DESPEJO_SEG = 60
+COLS_CATEGORICAS = ['id_projeto', 'lote', 'site', 'cep', 'endereco', 'link_auto']
+
+class ArmazemLotes:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.itens = {}  # sid -> {'usuario', 'df', 'acesso'}
+        self.despejados = 0
+        self._ultimo_despejo = 0.0
+
+    def guardar(self, sid, usuario, df):
+        with self.lock:
+            self.itens[sid] = {'usuario': usuario, 'df': df, 'acesso': time.time()}
+
+    def obter(self, sid):
+        self.despejar_ociosos()
+        with self.lock:
+            item = self.itens.get(sid)
+            if not item: return None
+            item['acesso'] = time.time()
+            return item['df']
+
+    def remover(self, sid):
+        with self.lock: self.itens.pop(sid, None)
+
+    def despejar_ociosos(self, minutos=TEMPO_OCIOSO_MIN, forcar=False):
+        agora = time.time()
+        if not forcar and agora - self._ultimo_despejo < INTERVALO_DESPEJO_SEG: return 0
+        self._ultimo_despejo = agora
+        with self.lock:
+            velhos = [sid for sid, i in self.itens.items() if agora - i['acesso'] > minutos * 60]
+            for sid in velhos: del self.itens[sid]
+            self.despejados += len(velhos)
+        if velhos: print(f"🧹 {len(velhos)} lote(s) de sessões ociosas descartados da memória.")
+        return len(velhos)
+
+    def relatorio(self):
+        with self.lock: itens = list(self.itens.items())
+        agora = time.time()
+        linhas = [{
+            'sessão': sid[:8],
+            'usuário': i['usuario'],
+            'linhas': len(i['df']),
+            'bytes': int(i['df'].memory_usage(deep=True).sum()),
+            'ocioso (min)': round((agora - i['acesso']) / 60, 1)
+        } for sid, i in itens]
+        return pd.DataFrame(linhas)
+
+@st.cache_resource
+def get_armazem():
+    return ArmazemLotes()
+
+def _sid():
+    if '_sid' not in st.session_state: st.session_state['_sid'] = uuid.uuid4().hex
+    return st.session_state['_sid']
+
+def compactar_lote(df):
+    # Colunas repetidas viram categoria (cada valor distinto guardado uma vez).
+    # MARCADOR e BUSCA_GOOGLE não são guardados: a tela monta só para a página.
+    df = df.drop(columns=[c for c in ['MARCADOR', 'BUSCA_GOOGLE'] if c in df.columns])
+    for c in COLS_CATEGORICAS:
+        if c in df.columns: df[c] = df[c].astype(str).astype('category')
+    df['_row_index'] = pd.to_numeric(df['_row_index']).astype('int32')
+    df['link'] = df['link'].fillna("").astype(object)
+    return df
+
+def guardar_df(df, usuario):
+    get_armazem().guardar(_sid(), usuario, df)
+
+def obter_df():
+    return get_armazem().obter(_sid())
+
+def remover_df():
+    get_armazem().remover(_sid())
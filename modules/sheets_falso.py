@@ -0,0 +1,246 @@
+import threading
+import time
+import random
+import re
+from collections import Counter
+
+# --- GOOGLE SHEETS FALSO (EM MEMÓRIA) ---
+# Imita a parte da API do gspread que services.py usa, com latência e erros
+# de cota configuráveis. Serve para medir mudanças sem tocar a planilha real:
+#   ss = PlanilhaFalsa(latencia_ms=150, cota_min=300)
+#   services.usar_planilha(ss)
+
+CABECALHOS_PADRAO = {
+    "projetos": ["id", "nome", "data", "total_lotes", "status"],
+    "controle_lotes": ["id_projeto", "lote", "status", "usuario", "progresso", "checkpoint"],
+    "dados_brutos": ["id_projeto", "lote", "ean", "descricao", "site", "cep", "endereco", "link", "id_linha", "link_auto"],
+}
+
+class RespostaFalsa:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+class APIErrorFalso(Exception):
+    # Mesmo formato do gspread.exceptions.APIError (e.response.status_code)
+    def __init__(self, status_code, mensagem, retry_after=None):
+        super().__init__(f"{status_code}: {mensagem}")
+        self.response = RespostaFalsa(status_code, {"Retry-After": str(retry_after)} if retry_after else {})
+        self.code = status_code
+
+class WorksheetNotFound(Exception):
+    # Mesmo nome do gspread.exceptions.WorksheetNotFound (services reconhece pelo nome)
+    pass
+
+def _col_idx(letras):
+    n = 0
+    for c in letras.upper(): n = n * 26 + (ord(c) - ord("A") + 1)
+    return n - 1
+
+def _parse_range(rng, max_linhas):
+    # "A2:H10", "H5", "A5:I" -> (linha_ini, col_ini, linha_fim, col_fim), base 0
+    rng = rng.split("!")[-1]
+    partes = rng.split(":")
+    m = re.fullmatch(r"([A-Z]+)(\d*)", partes[0].upper())
+    l_ini, c_ini = int(m.group(2) or 1) - 1, _col_idx(m.group(1))
+    if len(partes) == 1: return l_ini, c_ini, l_ini, c_ini
+    m = re.fullmatch(r"([A-Z]+)(\d*)", partes[1].upper())
+    l_fim = int(m.group(2)) - 1 if m.group(2) else max(max_linhas - 1, l_ini)
+    return l_ini, c_ini, l_fim, _col_idx(m.group(1))
+
+def _numericise(v):
+    # get_all_records do gspread converte "12" -> 12 e "1.5" -> 1.5
+    if isinstance(v, str):
+        try: return int(v)
+        except ValueError: pass
+        try: return float(v)
+        except ValueError: return v
+    return v
+
+def _texto(v):
+    return "" if v is None else str(v)
+
+class Worksheet:
+    def __init__(self, planilha, title, linhas=None, cols=26):
+        self.planilha = planilha
+        self.title = title
+        self.linhas = [list(l) for l in (linhas or [])]
+        self.col_count = cols
+
+    @property
+    def row_count(self):
+        return max(len(self.linhas), 1000)
+
+    def _chamada(self, nome):
+        self.planilha._chamada(nome)
+
+    def _garantir(self, n_linhas, n_cols):
+        while len(self.linhas) < n_linhas: self.linhas.append([])
+        for l in self.linhas[:n_linhas]:
+            if len(l) < n_cols: l.extend([""] * (n_cols - len(l)))
+
+    def _apara(self, linha):
+        # O Sheets não devolve células vazias no fim da linha
+        linha = [_texto(v) for v in linha]
+        while linha and linha[-1] == "": linha.pop()
+        return linha
+
+    def _ler(self, rng):
+        l_ini, c_ini, l_fim, c_fim = _parse_range(rng, len(self.linhas))
+        res = [self._apara(l[c_ini:c_fim + 1]) for l in self.linhas[l_ini:l_fim + 1]]
+        while res and not res[-1]: res.pop()
+        return res
+
+    def _escrever(self, rng, values):
+        l_ini, c_ini, _, _ = _parse_range(rng, len(self.linhas))
+        largura = max((len(v) for v in values), default=0)
+        if c_ini + largura > self.col_count:
+            raise APIErrorFalso(400, f"Range ({self.title}!{rng}) exceeds grid limits")
+        self._garantir(l_ini + len(values), c_ini + largura)
+        for i, v in enumerate(values):
+            for j, x in enumerate(v): self.linhas[l_ini + i][c_ini + j] = x
+
+    # --- LEITURA ---
+    def get_all_values(self):
+        self._chamada("get_all_values")
+        with self.planilha.lock:
+            res = [self._apara(l) for l in self.linhas]
+            while res and not res[-1]: res.pop()
+            largura = max((len(l) for l in res), default=0)
+            return [l + [""] * (largura - len(l)) for l in res]
+
+    def get_all_records(self):
+        self._chamada("get_all_records")
+        with self.planilha.lock:
+            if not self.linhas: return []
+            header = [_texto(h) for h in self.linhas[0]]
+            while header and header[-1] == "": header.pop()
+            res = []
+            for l in self.linhas[1:]:
+                l = [_texto(v) for v in l] + [""] * len(header)
+                res.append({h: _numericise(l[i]) for i, h in enumerate(header)})
+            return res
+
+    def col_values(self, col):
+        self._chamada("col_values")
+        with self.planilha.lock:
+            res = [_texto(l[col - 1]) if len(l) >= col else "" for l in self.linhas]
+            while res and res[-1] == "": res.pop()
+            return res
+
+    def row_values(self, row):
+        self._chamada("row_values")
+        with self.planilha.lock:
+            return self._apara(self.linhas[row - 1]) if row <= len(self.linhas) else []
+
+    def get(self, rng):
+        self._chamada("get")
+        with self.planilha.lock: return self._ler(rng)
+
+    def batch_get(self, ranges):
+        self._chamada("batch_get")
+        with self.planilha.lock: return [self._ler(r) for r in ranges]
+
+    # --- ESCRITA ---
+    def update(self, range_name=None, values=None, **kwargs):
+        self._chamada("update")
+        with self.planilha.lock:
+            self._escrever(range_name, values)
+        return {"updatedRange": f"{self.title}!{range_name}"}
+
+    def batch_update(self, data, **kwargs):
+        self._chamada("batch_update")
+        with self.planilha.lock:
+            for item in data: self._escrever(item['range'], item['values'])
+        return {}
+
+    def _anexar(self, values):
+        # Como o append do Sheets: escreve logo depois da última linha com dados
+        with self.planilha.lock:
+            ultima = len(self.linhas)
+            while ultima and not any(_texto(v) for v in self.linhas[ultima - 1]): ultima -= 1
+            del self.linhas[ultima:]
+            ini = len(self.linhas) + 1
+            for v in values: self.linhas.append(list(v))
+            col_fim = chr(64 + max(len(v) for v in values))
+            return {"updates": {"updatedRange": f"{self.title}!A{ini}:{col_fim}{len(self.linhas)}"}}
+
+    def append_rows(self, values, **kwargs):
+        self._chamada("append_rows")
+        return self._anexar(values)
+
+    def append_row(self, values, **kwargs):
+        self._chamada("append_row")
+        return self._anexar([values])
+
+    def add_cols(self, n):
+        self._chamada("add_cols")
+        self.col_count += n
+
+    def delete_rows(self, start_index, end_index=None):
+        # Como o deleteDimension do Sheets: as linhas de baixo sobem
+        self._chamada("delete_rows")
+        with self.planilha.lock:
+            del self.linhas[start_index - 1:(end_index or start_index)]
+
+    def batch_clear(self, ranges):
+        self._chamada("batch_clear")
+        with self.planilha.lock:
+            for rng in ranges:
+                l_ini, c_ini, l_fim, c_fim = _parse_range(rng, len(self.linhas))
+                for l in self.linhas[l_ini:l_fim + 1]:
+                    for j in range(c_ini, min(c_fim + 1, len(l))): l[j] = ""
+
+class PlanilhaFalsa:
+    def __init__(self, latencia_ms=0, jitter_ms=0, cota_min=None, prob_erro_5xx=0.0, abas=None):
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.cota_min = cota_min          # None = sem limite; senão 429 acima de N chamadas/min
+        self.prob_erro_5xx = prob_erro_5xx
+        self.lock = threading.RLock()
+        self.contador = Counter()
+        self.erros = Counter()
+        self._janela = []
+        self.abas = {}
+        for nome, header in (abas or CABECALHOS_PADRAO).items():
+            self.abas[nome] = Worksheet(self, nome, [header], cols=len(header))
+
+    def _chamada(self, nome):
+        # Latência + cota por minuto + erro 5xx aleatório, como a API real
+        atraso = (self.latencia_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000.0
+        if atraso > 0: time.sleep(atraso)
+        with self.lock:
+            self.contador[nome] += 1
+            if self.cota_min:
+                agora = time.monotonic()
+                self._janela = [t for t in self._janela if agora - t < 60]
+                if len(self._janela) >= self.cota_min:
+                    self.erros[429] += 1
+                    raise APIErrorFalso(429, "Quota exceeded", retry_after=max(1, int(60 - (agora - self._janela[0]))))
+                self._janela.append(agora)
+        if self.prob_erro_5xx and random.random() < self.prob_erro_5xx:
+            with self.lock: self.erros[503] += 1
+            raise APIErrorFalso(503, "Service unavailable")
+
+    @property
+    def title(self):
+        return "Planilha falsa"
+
+    def worksheet(self, nome):
+        self._chamada("worksheet")
+        with self.lock:
+            if nome not in self.abas: raise WorksheetNotFound(nome)
+            return self.abas[nome]
+
+    def add_worksheet(self, title, rows=1000, cols=26, **kwargs):
+        self._chamada("add_worksheet")
+        with self.lock:
+            self.abas[title] = Worksheet(self, title, [], cols=cols)
+            return self.abas[title]
+
+    def del_worksheet(self, ws):
+        self._chamada("del_worksheet")
+        with self.lock: self.abas.pop(ws.title, None)
+
+    def total_chamadas(self):
+        with self.lock: return sum(self.contador.values())
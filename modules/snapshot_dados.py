@@ -0,0 +1,181 @@
+import threading
+import hashlib
+import json
+import os
+import time
+import numpy as np
+from modules import services
+
+# --- SNAPSHOT COLUNAR DAS ABAS DE DADOS ---
+# Cópia local de cada aba de dados (dados_brutos ou shard) em Arrow IPC,
+# aberta por memory map. O arquivo tem um record batch por projeto e o meta
+# guarda quais batches são de cada projeto: a consulta por id_projeto lê só
+# esses batches (sem tocar no resto do arquivo) e filtra o lote em cima deles.
+# Atualização incremental: lê só as colunas A (id_projeto) e H:I (link,
+# id_linha); linhas novas no fim são buscadas e anexadas, links diferentes
+# são corrigidos no lugar. Se A ou I não batem com a cópia (linhas inseridas,
+# apagadas ou aba reescrita), a cópia é refeita do zero. O mapa de batches e
+# um resumo (sha1) por projeto, usado como versão dos dados (cache de
+# exportação), vão nos metadados do schema: ficam no mesmo arquivo que os
+# dados e trocam junto com ele no os.replace, então quem lê nunca vê um mapa
+# de outra versão do arquivo. O .json ao lado só guarda o controle da
+# atualização (n_linhas, atualizado_em).
+
+ATIVO = os.environ.get("COLETA_SNAPSHOT", "1") == "1"
+INTERVALO_MIN_SEG = 30  # Leituras seguidas dentro disso usam a cópia sem conferir
+_locks = {}
+_lock_global = threading.Lock()
+
+def disponivel():
+    if not ATIVO: return False
+    try: import pyarrow  # noqa: F401
+    except ImportError: return False
+    return True
+
+def _pasta():
+    d = services.caminho_local("snapshot")
+    os.makedirs(d, exist_ok=True)
+    return d
+
+def _arquivo(destino):
+    return os.path.join(_pasta(), destino.replace("/", "__") + ".arrow")
+
+def _ler_meta(destino):
+    try:
+        with open(_arquivo(destino) + ".json", encoding="utf-8") as f: return json.load(f)
+    except (FileNotFoundError, ValueError): return None
+
+def _trava(destino):
+    with _lock_global: return _locks.setdefault(destino, threading.Lock())
+
+def _schema():
+    import pyarrow as pa
+    return pa.schema([(c, pa.string()) for c in services.COLS_DADOS] + [("_linha", pa.int32())])
+
+def _para_tabela(linhas, linha_ini):
+    import pyarrow as pa
+    n = len(services.COLS_DADOS)
+    linhas = [(list(l) + [""] * n)[:n] for l in linhas]
+    colunas = list(zip(*linhas)) if linhas else [()] * n
+    arrays = [pa.array([str(v) for v in c], pa.string()) for c in colunas]
+    arrays.append(pa.array(np.arange(linha_ini, linha_ini + len(linhas), dtype=np.int32)))
+    return pa.Table.from_arrays(arrays, schema=_schema())
+
+def _abrir(destino):
+    # Tabela inteira, sem cópia (os buffers apontam para o memory map)
+    import pyarrow as pa
+    return pa.ipc.open_file(pa.memory_map(_arquivo(destino), "r")).read_all()
+
+def _gravar(destino, tabela, n_linhas):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    tabela = tabela.take(pc.sort_indices(tabela, sort_keys=[("id_projeto", "ascending"), ("_linha", "ascending")]))
+    ids = tabela.column('id_projeto').to_numpy(zero_copy_only=False)
+    cortes = [0] + [i for i in range(1, len(ids)) if ids[i] != ids[i - 1]] + [len(ids)]
+    lotes, projetos, versoes = [], {}, {}
+    for a, b in zip(cortes, cortes[1:]):
+        if b <= a: continue
+        h = hashlib.sha1()
+        for lote in tabela.slice(a, b - a).combine_chunks().to_batches():
+            h.update(lote.serialize())
+            projetos.setdefault(str(ids[a]), []).append(len(lotes))
+            lotes.append(lote)
+        versoes[str(ids[a])] = h.hexdigest()[:16]
+    schema = _schema().with_metadata({'projetos': json.dumps(projetos), 'versoes': json.dumps(versoes)})
+    tmp = _arquivo(destino) + f".{os.getpid()}.tmp"
+    with pa.OSFile(tmp, "wb") as f, pa.ipc.new_file(f, schema) as w:
+        for lote in lotes: w.write_batch(lote)
+    meta = {'n_linhas': n_linhas, 'atualizado_em': time.time()}
+    with open(tmp + ".json", "w", encoding="utf-8") as f: json.dump(meta, f)
+    os.replace(tmp, _arquivo(destino))
+    os.replace(tmp + ".json", _arquivo(destino) + ".json")
+    return meta
+
+def _reconstruir(destino, ws):
+    valores = services.retry_api(ws.get_all_values) or [[]]
+    print(f"🧊 Snapshot de {destino} refeito ({len(valores) - 1} linhas).")
+    return _gravar(destino, _para_tabela(valores[1:], 2), len(valores) - 1)
+
+def atualizar(destino, forcar=False):
+    with _trava(destino):
+        meta = _ler_meta(destino)
+        if meta and not forcar and time.time() - meta['atualizado_em'] < INTERVALO_MIN_SEG: return meta
+        ws = services.abrir_aba_dados(services.abrir_planilha(), destino)
+        if not meta or not os.path.exists(_arquivo(destino)): return _reconstruir(destino, ws)
+
+        col_a, col_hi = services.retry_api(ws.batch_get, ["A2:A", f"H2:{services.COL_ID_LINHA}"]) or [[], []]
+        total = max(len(col_a), len(col_hi))
+        n = meta['n_linhas']
+        if total < n: return _reconstruir(destino, ws)
+
+        import pyarrow as pa
+        tabela = _abrir(destino)
+        if tabela.schema != _schema() or b'projetos' not in (tabela.schema.metadata or {}):
+            return _reconstruir(destino, ws)  # Colunas mudaram de versão (ou arquivo sem o mapa)
+        tabela = tabela.take(np.argsort(tabela.column('_linha').to_numpy(), kind="stable"))
+        col_a = [str(l[0]) if l else "" for l in col_a] + [""] * (total - len(col_a))
+        col_hi = [(list(l) + ["", ""])[:2] for l in col_hi] + [["", ""]] * (total - len(col_hi))
+
+        # Linhas deslocadas: id_projeto ou id_linha mudou em alguma linha já copiada
+        mesma = lambda col, valores: tabela.column(col).combine_chunks().equals(pa.array(valores, pa.string()))
+        if not mesma('id_projeto', col_a[:n]) or not mesma('id_linha', [str(x[1]) for x in col_hi[:n]]):
+            return _reconstruir(destino, ws)
+
+        mudou = False
+        novos_links = [str(x[0]) for x in col_hi[:n]]
+        if not mesma('link', novos_links):
+            tabela = tabela.set_column(services.COLS_DADOS.index('link'), 'link', pa.array(novos_links, pa.string()))
+            mudou = True
+        if total > n:
+            novas = services.retry_api(ws.get, f"A{n + 2}:{services.COL_FIM_DADOS}{total + 1}") or []
+            novas += [[]] * (total - n - len(novas))
+            tabela = pa.concat_tables([tabela, _para_tabela(novas, n + 2)])
+            mudou = True
+        if mudou: return _gravar(destino, tabela, total)
+        meta['atualizado_em'] = time.time()
+        with open(_arquivo(destino) + ".json", "w", encoding="utf-8") as f: json.dump(meta, f)
+        return meta
+
+def _metadado(leitor, chave):
+    return json.loads((leitor.schema.metadata or {}).get(chave.encode(), b"{}"))
+
+def _tabela_projeto(destino, id_projeto, lote=None):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    # Mapa e batches saem do mesmo arquivo aberto (um _gravar no meio não os separa)
+    leitor = pa.ipc.open_file(pa.memory_map(_arquivo(destino), "r"))
+    batches = [leitor.get_batch(i) for i in _metadado(leitor, 'projetos').get(str(id_projeto), []) if i < leitor.num_record_batches]
+    if not batches: return _schema().empty_table()
+    tabela = pa.Table.from_batches(batches)
+    if lote is not None: tabela = tabela.filter(pc.equal(tabela['lote'], str(lote)))
+    return tabela
+
+def consultar(destino, id_projeto, lote=None, forcar=False):
+    # DataFrame com as linhas do projeto (e lote), _row_index = linha na aba
+    atualizar(destino, forcar)
+    df = _tabela_projeto(destino, id_projeto, lote).to_pandas()
+    return df.rename(columns={'_linha': '_row_index'})
+
+def versao_projeto(destino, id_projeto):
+    # Resumo (sha1) das linhas do projeto na aba: muda quando qualquer célula A-J dele muda
+    import pyarrow as pa
+    atualizar(destino, forcar=True)
+    return _metadado(pa.ipc.open_file(pa.memory_map(_arquivo(destino), "r")), 'versoes').get(str(id_projeto))
+
+def iterar_linhas(destino, id_projeto):
+    # Linhas A-J do projeto em ordem de linha, um batch por vez
+    atualizar(destino)
+    tabela = _tabela_projeto(destino, id_projeto).drop(['_linha'])
+    for lote in tabela.to_batches():
+        yield from (list(l) for l in zip(*(c.to_pylist() for c in lote.columns)))
+
+def colunas(destino, nomes):
+    # Colunas da aba inteira (para varreduras de histórico, ex.: reuso de links)
+    atualizar(destino)
+    tabela = _abrir(destino)
+    return {c: tabela.column(c).to_pylist() for c in nomes}
+
+def apagar(destino):
+    for arq in (_arquivo(destino), _arquivo(destino) + ".json"):
+        try: os.remove(arq)
+        except FileNotFoundError: pass
@@ -2,7 +2,8 @@ import streamlit as st
 import pandas as pd
 import time
 from datetime import datetime
-from modules import services, ui
+from itertools import islice
+from modules import services, ui, fila_salvamento, metricas, sessoes, log_tempo, relatorios, arquivamento, reuso_links, exportacao, distribuicao
 
 # --- TELA DE LOGIN ---
 def tela_login(senhas):
@@ -27,94 +28,337 @@ def tela_login(senhas):
 # --- TELA ADMIN ---
 def tela_admin():
     st.markdown("## ⚙️ Painel Admin")
-    t1, t2 = st.tabs(["Novo Projeto", "Relatórios"])
+    t1, t2, t3, t4, t5 = st.tabs(["Novo Projeto", "Relatórios", "📈 API Sheets", "🗄️ Armazenamento", "🎯 Distribuição"])
     with t1:
         st.markdown("### 1. Baixar Modelo")
         st.download_button("📥 Modelo Excel", services.gerar_modelo_padrao(), "modelo.xlsx")
         st.markdown("### 2. Enviar")
         with st.form("upload"):
-            arq = st.file_uploader("Excel (.xlsx)", type=["xlsx"])
+            arq = st.file_uploader("Excel (.xlsx) ou CSV", type=["xlsx", "csv"])
             if st.form_submit_button("🚀 Criar", type="primary") and arq:
                 try:
-                    df = pd.read_excel(arq, dtype=str)
                     with st.spinner("Enviando..."):
-                        id_p, q, t = services.processar_upload(df, arq.name)
+                        # O arquivo vai direto: services lê em blocos, sem carregar tudo num DataFrame
+                        id_p, q, t = services.processar_upload(arq, arq.name)
                         if id_p:
                             st.success(f"Sucesso! ID: {id_p} | Lotes: {int(q/t) + 1}")
                             st.balloons()
                 except Exception as e: st.error(f"Erro ao processar: {e}")
 
+        pendentes = services.uploads_pendentes()
+        if pendentes:
+            st.markdown("### ⚠️ Uploads interrompidos")
+            for id_pend in pendentes:
+                if st.button(f"🔁 Retomar projeto {id_pend}", key=f"ret_{id_pend}"):
+                    try:
+                        with st.spinner("Retomando..."):
+                            services.retomar_upload(id_pend)
+                        st.success(f"Projeto {id_pend} concluído!")
+                    except Exception as e: st.error(f"Erro ao retomar: {e}")
+
     with t2:
-        projs = services.carregar_projetos_ativos()
-        if not projs.empty:
-            p_dict = {r['nome']: r['id'] for _, r in projs.iterrows()}
-            sel = st.selectbox("Projeto:", list(p_dict.keys()))
-            if st.button("📦 Gerar Excel"):
-                with st.spinner("Baixando..."):
-                    dado = services.baixar_excel(p_dict[sel])
-                    if dado: st.download_button("📥 Download", dado, f"{sel}.xlsx")
-                    else: st.error("Erro ao baixar.")
+        tela_produtividade()
+        st.divider()
+        tela_exportacao()
+
+    with t3:
+        tela_metricas_api()
+
+    with t4:
+        tela_armazenamento()
+
+    with t5:
+        tela_distribuicao()
+
+# --- DISTRIBUIÇÃO (ADMIN) ---
+def tela_distribuicao():
+    st.markdown("#### 🎯 Distribuição automática de lotes")
+    cfg = distribuicao.carregar_config()
+    st.metric("Lotes livres na fila", distribuicao.get_distribuidor().tamanho())
+    ordem = st.multiselect("Critérios (na ordem de peso):", distribuicao.CRITERIOS, default=cfg['ordem'],
+                           help="afinidade = mesmo site/CEP do último lote do operador; prioridade = coluna abaixo; fifo = projeto mais antigo primeiro")
+    projs = services.carregar_projetos_ativos()
+    editado = None
+    if not projs.empty:
+        df = pd.DataFrame({'id': projs['id'].astype(str), 'projeto': projs['nome'],
+                           'prioridade': [cfg['prioridades'].get(str(i), 0) for i in projs['id']]})
+        editado = st.data_editor(df, disabled=['id', 'projeto'], hide_index=True, use_container_width=True, key="ed_prioridades")
+    if st.button("💾 Salvar política"):
+        prioridades = {} if editado is None else {r['id']: int(r['prioridade'] or 0) for _, r in editado.iterrows() if int(r['prioridade'] or 0)}
+        distribuicao.salvar_config(ordem, prioridades)
+        st.success("Política salva.")
+
+# --- EXPORTAÇÃO (ADMIN) ---
+def tela_exportacao():
+    st.markdown("#### 📦 Exportar projetos")
+    projs = services.carregar_projetos_ativos()
+    p_dict = {r['nome']: r['id'] for _, r in projs.iterrows()} if not projs.empty else {}
+    # Projetos arquivados saem das abas, mas continuam exportáveis pelo arquivo local
+    p_dict.update({f"{a['nome']} (arquivado)": id_a for id_a, a in arquivamento.projetos_arquivados().items()})
+    if p_dict:
+        sel = st.multiselect("Projetos:", list(p_dict.keys()), help="Mais de um projeto sai num .zip.")
+        todos = st.checkbox(f"Todos os projetos ({len(p_dict)})")
+        fmt = st.radio("Formato:", list(services.FORMATOS_EXPORT.keys()), horizontal=True,
+                       help="CSV e Parquet são mais rápidos para projetos grandes.")
+        if st.button("📦 Gerar"):
+            nomes = list(p_dict.keys()) if todos else sel
+            if nomes: exportacao.get_exportador().enviar([(p_dict[n], n) for n in nomes], fmt)
+            else: st.warning("Escolha ao menos um projeto.")
+    fragmento_exportacoes()
+
+@st.fragment
+def fragmento_exportacoes():
+    # Roda em segundo plano: a tela só mostra o andamento e se recarrega sozinha enquanto houver trabalho
+    exportador = exportacao.get_exportador()
+    for t in exportador.listar():
+        c1, c2 = st.columns([3, 1])
+        texto = f"{t['criado_em']} · {t['total']} projeto(s) · {t['formato']} · {t['status']}"
+        if t['do_cache']: texto += f" · {t['do_cache']} do cache"
+        c1.progress(t['feitos'] / t['total'], text=texto)
+        if t['arquivo']:
+            mime = "application/zip" if t['arquivo'].endswith(".zip") else services.FORMATOS_EXPORT[t['formato']]
+            try:
+                with open(t['arquivo'], "rb") as f:
+                    c2.download_button("📥 Download", f.read(), t['nome_download'], mime=mime, key=f"exp_{t['id']}")
+            except FileNotFoundError: c2.caption("Arquivo expirado")
+        for nome, erro in t['erros'].items(): c1.caption(f"⚠️ {nome}: {erro}")
+    if exportador.pendentes():
+        time.sleep(1.5)
+        st.rerun(scope="fragment")
+
+# --- ARMAZENAMENTO (ADMIN) ---
+def tela_memoria_sessoes():
+    st.markdown("#### 🧠 Memória dos lotes por sessão")
+    armazem = sessoes.get_armazem()
+    c1, c2 = st.columns([3, 1])
+    if c2.button(f"🧹 Descartar ociosos (> {sessoes.TEMPO_OCIOSO_MIN} min)"):
+        n = armazem.despejar_ociosos(forcar=True)
+        st.toast(f"{n} lote(s) descartado(s).")
+    rel = armazem.relatorio()
+    if rel.empty:
+        c1.info("Nenhum lote carregado neste processo.")
+    else:
+        c1.metric("Total em memória", f"{rel['bytes'].sum() / 1024 ** 2:.1f} MB", help=f"{len(rel)} sessão(ões); {armazem.despejados} despejo(s) desde o início")
+        st.dataframe(rel.sort_values('bytes', ascending=False), hide_index=True, use_container_width=True)
+    st.divider()
+
+def tela_arquivamento():
+    st.markdown("#### 🗃️ Arquivar projetos concluídos")
+    try: prontos = arquivamento.projetos_arquivaveis()
+    except Exception as e: st.warning(f"Não foi possível listar os projetos: {e}"); prontos = []
+    if not prontos:
+        st.caption("Nenhum projeto com todos os lotes concluídos.")
+    else:
+        st.dataframe(pd.DataFrame(prontos)[['id', 'nome', 'data', 'total_lotes']], hide_index=True, use_container_width=True)
+        if st.button(f"🗃️ Arquivar {len(prontos)} projeto(s)", help="Move para o arquivo local e tira das abas do Sheets"):
+            with st.spinner("Arquivando..."):
+                try:
+                    feitos = arquivamento.arquivar([p['id'] for p in prontos])
+                    st.success(f"{len(feitos)} projeto(s) arquivado(s).")
+                except Exception as e: st.error(f"Erro ao arquivar: {e}")
+    arquivados = arquivamento.projetos_arquivados()
+    if arquivados:
+        with st.expander(f"📚 {len(arquivados)} projeto(s) no arquivo"):
+            st.dataframe(pd.DataFrame([{'id': k, **v} for k, v in arquivados.items()]), hide_index=True, use_container_width=True)
+    st.divider()
+
+def tela_reuso_links():
+    st.markdown("#### ♻️ Reuso de links (EAN + site)")
+    c1, c2 = st.columns([3, 1])
+    c1.metric("Links conhecidos", reuso_links.get_indice().tamanho(), help="Usados para pré-preencher novos uploads")
+    if c2.button("🔁 Refazer do histórico"):
+        with st.spinner("Lendo abas de dados e arquivo..."):
+            try: st.success(f"Índice refeito: {reuso_links.reconstruir()} chaves.")
+            except Exception as e: st.error(f"Erro ao refazer índice: {e}")
+    st.divider()
+
+def tela_armazenamento():
+    tela_memoria_sessoes()
+    tela_reuso_links()
+    if not services.backend_local(): tela_arquivamento()
+    local = services.backend_local()
+    if not local:
+        st.info("Backend atual: **Google Sheets** (banco vivo). Para usar o banco local, rode com `COLETA_BACKEND=sqlite`.")
+        return
+
+    info = local.info_espelho()
+    st.markdown("Backend atual: **SQLite local** — o Google Sheets é um espelho exportado periodicamente.")
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Versão do banco", info['versao'])
+    c2.metric("Versão no espelho", info['versao_espelho'])
+    c3.metric("Último espelho", info['espelho_em'] or "-")
+
+    if st.button("🪞 Exportar espelho agora"):
+        with st.spinner("Exportando para o Google Sheets..."):
+            try: local.exportar_para_sheets(); st.success("Espelho atualizado!")
+            except Exception as e: st.error(f"Erro ao exportar: {e}")
+
+    if local.vazio() and st.button("📥 Importar dados atuais do Sheets"):
+        with st.spinner("Importando..."):
+            try: local.importar_do_sheets(); st.success("Importação concluída!")
+            except Exception as e: st.error(f"Erro ao importar: {e}")
+
+# --- PRODUTIVIDADE (ADMIN) ---
+def tela_produtividade():
+    st.markdown("#### 📊 Produtividade")
+    c1, c2 = st.columns([3, 1])
+    forcar = c2.button("🔄 Processar novos registros")
+    try: relatorios.atualizar_rollups(forcar)  # Incremental: só linhas novas desde a marca d'água
+    except Exception as e: st.warning(f"Não foi possível atualizar os agregados: {e}")
+    estado = relatorios.carregar_estado()
+    if estado['atualizado_em']:
+        c1.caption(f"{estado['marca_dagua']} registros processados · atualizado às {datetime.fromtimestamp(estado['atualizado_em'], services.TZ_BRASIL).strftime('%H:%M')}")
+
+    r1, r2, r3 = st.tabs(["Operadores", "Lotes", "Projetos (previsão)"])
+    with r1: st.dataframe(relatorios.tabela_operadores(estado), hide_index=True, use_container_width=True)
+    with r2: st.dataframe(relatorios.tabela_ciclo_lotes(estado), hide_index=True, use_container_width=True)
+    with r3: st.dataframe(relatorios.tabela_eta_projetos(estado), hide_index=True, use_container_width=True)
+
+# --- MÉTRICAS DA API (ADMIN) ---
+def tela_metricas_api():
+    st_log = log_tempo.get_escritor().status()
+    if st_log['pendentes'] or st_log['ultimo_erro']:
+        st.warning(f"⏳ {st_log['pendentes']} registro(s) de tempo aguardando gravação. Última falha: {st_log['ultimo_erro'] or '-'}")
+
+    c1, c2 = st.columns([3, 1])
+    janela = c1.select_slider("Janela (minutos):", [5, 15, 30, 60, 180], value=30)
+    if c2.button("🧹 Zerar métricas"): metricas.limpar()
+
+    df = metricas.como_dataframe(janela)
+    if df.empty:
+        st.info("Nenhuma chamada registrada nesta janela (métricas são por processo).")
+        return
+
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("Chamadas", len(df))
+    m2.metric("Chamadas/min", f"{len(df) / janela:.1f}")
+    m3.metric("p95 latência", f"{df['latencia'].quantile(0.95):.2f}s")
+    m4.metric("Erros", int((df['erro'] != "").sum()))
+
+    st.markdown("#### Chamadas por minuto")
+    st.bar_chart(metricas.chamadas_por_minuto(df))
+    st.markdown("#### Latência por função")
+    st.dataframe(metricas.latencia_por_funcao(df), hide_index=True, use_container_width=True)
+    st.markdown("#### Maiores consumidores")
+    st.dataframe(metricas.maiores_chamadores(df), hide_index=True, use_container_width=True)
+
+# --- SYNC DIFERENCIAL ---
+def _sincronizados_da_sessao(df_ref, id_p):
+    # Base carregada do Sheets + o que a fila de salvamento já confirmou
+    sync = st.session_state.setdefault('links_sync', {})
+    linhas = [int(x) for x in df_ref['_row_index']]
+    sync.update(fila_salvamento.get_fila().confirmados_de(id_p, linhas))
+    return sync
+
+# --- FILA DE PENDENTES ---
+ITENS_POR_PAGINA = 50
+CHAVES_LOTE = ['df_cache', 'saved_indices', 'links_sync', 'pendentes', 'pagina_idx', 'editor_versao', 'marcador_idx']
+
+def _montar_pendentes(df):
+    # Uma vez por lote: índices (na ordem) das linhas ainda sem link
+    sem_link = df['link'].fillna("").astype(str).str.strip() == ""
+    return dict.fromkeys(df.index[sem_link])
+
+def _limpar_estado_lote(*extras):
+    sessoes.remover_df()
+    for k in list(extras) + CHAVES_LOTE:
+        if k in st.session_state: del st.session_state[k]
+
+def _avisar_descartados(descartados):
+    # Links de linhas que sumiram da planilha (apagadas por alguém): não foram gravados
+    if descartados:
+        st.warning(f"⚠️ {len(descartados)} link(s) não gravados: a linha foi apagada da planilha.")
+        time.sleep(2)
+
+def _montar_pagina(df_ref, pagina):
+    # Colunas derivadas só para as linhas da página (nada disso fica guardado na sessão)
+    df_view = df_ref.loc[pagina, ['ean', 'descricao', 'link']].reset_index(drop=True)
+    df_view['ean'] = df_view['ean'].astype(str)
+    marcados = st.session_state.get('marcador_idx', set())
+    if marcados:
+        df_view.insert(0, 'MARCADOR', [">>> PAREI AQUI <<<" if i in marcados else "" for i in pagina])
+    df_view.insert(df_view.columns.get_loc('link'), 'BUSCA_GOOGLE', "https://www.google.com/search?q=" + df_view['ean'])
+    return df_view
 
 # --- FRAGMENTO DA TABELA (COM SCROLL FIXO E PERFORMANCE) ---
 @st.fragment
 def fragmento_tabela(id_p, lote, user, nome_p):
-    if 'df_cache' not in st.session_state:
-        st.error("⚠️ Erro de estado. Por favor, aperte F5.")
-        return
-    
     # 1. MESTRE (O Banco de Dados na Memória)
-    df_ref = st.session_state['df_cache']
+    df_ref = sessoes.obter_df()
+    if df_ref is None:
+        # Lote descartado por inatividade: recarrega do banco
+        _limpar_estado_lote()
+        st.rerun()
+
+    # Renova o lease enquanto o operador trabalha (no máximo a cada 1/3 da validade)
+    if time.time() - st.session_state.get('lease_renovado_em', 0) > services.LEASE_MINUTOS * 20:
+        if services.renovar_lease(id_p, lote, user):
+            st.session_state['lease_renovado_em'] = time.time()
+        else:
+            # O lote é de outro operador agora: nada mais desta tela pode ir para ele
+            st.error("⚠️ Sua reserva deste lote expirou e ele foi pego por outro operador. Escolha outro lote.")
+            _limpar_estado_lote('lote_ativo', 'h_ini', 'status', 'lease_renovado_em')
+            time.sleep(2)
+            st.rerun()
+
+    # Fila de pendentes: dict ordenado {índice do df_ref: None}. Remover é O(1)
+    # e a página é só o começo dele, então nada aqui depende do tamanho do lote.
+    if 'pendentes' not in st.session_state:
+        st.session_state['pendentes'] = _montar_pendentes(df_ref)
+    pendentes = st.session_state['pendentes']
+    versao = st.session_state.setdefault('editor_versao', 0)
+    chave_editor = f"editor_links_{versao}"
 
     # 2. CALLBACK DE SALVAMENTO (O Cérebro)
     def callback_salvar():
         # Pega as alterações enviadas pelo editor
-        # O Streamlit retorna um dicionário: {"indice_original": {"coluna": "valor"}}
-        changes = st.session_state["editor_links"].get("edited_rows", {})
+        # O Streamlit retorna {"posição na página": {"coluna": "valor"}}
+        changes = st.session_state[chave_editor].get("edited_rows", {})
         
         if not changes: return
 
+        pagina = st.session_state.get('pagina_idx', [])
         lista_para_salvar = []
         
-        for idx_str, val in changes.items():
-            idx = int(idx_str) # Esse é o índice ORIGINAL da linha (não importa se filtrou)
+        for pos_str, val in changes.items():
+            pos = int(pos_str)
+            if "link" not in val or pos >= len(pagina): continue
+            idx = pagina[pos]  # Índice no df_ref da linha mostrada nessa posição
+            novo_link = val["link"] or ""
             
-            if "link" in val:
-                novo_link = val["link"]
-                
-                # A. Atualiza a memória MESTRE imediatamente
-                df_ref.at[idx, 'link'] = novo_link
-                
-                # B. Prepara o pacote para o Google Sheets
-                # Usamos a coluna oculta _row_index para garantir que vai na linha certa do Excel
-                linha_excel = int(df_ref.iloc[idx]['_row_index'])
-                
-                lista_para_salvar.append({
-                    'indice_excel': linha_excel,
-                    'link': novo_link
-                })
-                
-                # C. Feedback Visual Instantâneo
-                if novo_link and str(novo_link).strip() != "":
-                    st.toast(f"✅ Item salvo!", icon="⚡")
+            # A. Atualiza a memória MESTRE e a fila de pendentes (O(linhas editadas))
+            df_ref.at[idx, 'link'] = novo_link
+            if str(novo_link).strip() != "": pendentes.pop(idx, None)
+            
+            # B. Prepara o pacote para o Google Sheets
+            # Usamos a coluna oculta _row_index para garantir que vai na linha certa do Excel
+            lista_para_salvar.append({
+                'indice_excel': int(df_ref.at[idx, '_row_index']),
+                'id_linha': str(df_ref.at[idx, 'id_linha']) if 'id_linha' in df_ref.columns else "",
+                'ean': str(df_ref.at[idx, 'ean']),
+                'site': str(df_ref.at[idx, 'site']),
+                'link': novo_link
+            })
+            
+            # C. Feedback Visual Instantâneo
+            if str(novo_link).strip() != "":
+                st.toast("✅ Item na fila de envio!", icon="⚡")
 
-        # D. Envia para o Google em Lote (Sem travar a tela)
+        # D. Enfileira para o Google (a thread da fila envia em lote, sem travar a tela)
         if lista_para_salvar:
-            # Chama o serviço de lote (que já está blindado com cache e retry)
-            services.salvar_lote_links(id_p, lote, lista_para_salvar)
+            fila_salvamento.get_fila().enfileirar(id_p, lote, lista_para_salvar)
+            # Nova chave = editor novo, sem edições velhas presas a posições que mudaram
+            st.session_state['editor_versao'] = versao + 1
 
     # 3. PREPARAÇÃO DA VISUALIZAÇÃO (A Fila)
-    # Filtramos apenas o que NÃO tem link.
-    # O .copy() é crucial para o Streamlit entender que é uma nova renderização limpa.
-    mask_pendentes = (df_ref['link'] == "") | (df_ref['link'].isna())
-    df_view = df_ref[mask_pendentes].copy()
-
-    # Criação da coluna de busca (caso não exista)
-    if 'BUSCA_GOOGLE' not in df_view.columns:
-        df_view['BUSCA_GOOGLE'] = df_view.apply(lambda x: f"https://www.google.com/search?q={x['ean']}", axis=1)
+    # Só a próxima página de pendentes vai para o data_editor
+    pagina = list(islice(pendentes, ITENS_POR_PAGINA))
+    st.session_state['pagina_idx'] = pagina
+    df_view = _montar_pagina(df_ref, pagina)
 
     # Métricas de Progresso
     total = len(df_ref)
-    restantes = len(df_view)
+    restantes = len(pendentes)
     feitos = total - restantes
     progresso = int((feitos / total) * 100) if total > 0 else 0
 
@@ -125,6 +369,17 @@ def fragmento_tabela(id_p, lote, user, nome_p):
         st.markdown(f"### 🔨 Fila de Trabalho: **{restantes}** itens restantes")
         st.progress(progresso, text=f"Progresso: {feitos}/{total} concluídos")
 
+    with c_entrega:
+        st_fila = fila_salvamento.get_fila().status(id_p, lote)
+        if st_fila['pendentes']:
+            st.caption(f"⏳ {st_fila['pendentes']} link(s) aguardando envio")
+        else:
+            st.caption("☁️ Tudo enviado ao Google")
+        if st_fila['ultimo_erro']:
+            st.caption(f"⚠️ Última falha de envio: {st_fila['ultimo_erro']} (tentando de novo)")
+        if st_fila['descartados']:
+            st.caption(f"⚠️ {st_fila['descartados']} link(s) não gravados: a linha foi apagada da planilha")
+
     # SE ACABOU O TRABALHO
     if df_view.empty:
         st.success("🎉 PARABÉNS! Lote finalizado.")
@@ -150,10 +405,13 @@ def fragmento_tabela(id_p, lote, user, nome_p):
         cols_ordem = ['ean', 'descricao', 'BUSCA_GOOGLE', 'link']
         if 'MARCADOR' in df_view.columns: cols_ordem.insert(0, 'MARCADOR')
 
+        if restantes > len(df_view):
+            st.caption(f"Mostrando os próximos {len(df_view)} de {restantes} pendentes. A página anda sozinha conforme você cola.")
+
         # TABELA EDITÁVEL
         st.data_editor(
-            df_view,                  # Mostra apenas os pendentes
-            key="editor_links",       # Chave única
+            df_view,                  # Mostra só a página atual de pendentes
+            key=chave_editor,         # Chave muda a cada edição aplicada
             on_change=callback_salvar,# Salva assim que edita
             column_config=cols_config,
             column_order=cols_ordem,
@@ -177,14 +435,16 @@ def fragmento_tabela(id_p, lote, user, nome_p):
         if st.button("💾 Salvar Checkpoint e Sair"):
             check = sel_pausa if sel_pausa != "(Não pausar agora)" else ""
             with st.spinner("Salvando posição..."):
-                services.salvar_progresso_lote(df_ref, id_p, lote, False, check)
+                fila_salvamento.get_fila().descarregar()
+                descartados = []
+                services.salvar_progresso_lote(df_ref, id_p, lote, False, check, _sincronizados_da_sessao(df_ref, id_p), descartados=descartados)
+                _avisar_descartados(descartados)
                 tempo = (datetime.now(services.TZ_BRASIL) - st.session_state['h_ini']).total_seconds()
                 services.salvar_log_tempo(user, id_p, nome_p, lote, tempo, "Pausa", total, feitos)
                 
                 # Limpa sessão
                 st.session_state['status'] = 'PAUSADO'
-                del st.session_state['df_cache']
-                if 'saved_indices' in st.session_state: del st.session_state['saved_indices']
+                _limpar_estado_lote()
                 st.rerun()
 
     with c2:
@@ -198,32 +458,25 @@ def fragmento_tabela(id_p, lote, user, nome_p):
                 time.sleep(1)
             
             with st.spinner("Finalizando e sincronizando..."):
-                # Garante um último salvamento geral
-                services.salvar_progresso_lote(df_ref, id_p, lote, True)
+                # Esvazia a fila e garante um último salvamento geral
+                fila_salvamento.get_fila().descarregar()
+                descartados = []
+                if not services.salvar_progresso_lote(df_ref, id_p, lote, True, sincronizados=_sincronizados_da_sessao(df_ref, id_p), usuario=user, descartados=descartados):
+                    st.error("⚠️ Este lote não está mais reservado para você (outro operador pegou). Ele não foi entregue.")
+                    _limpar_estado_lote('lote_ativo', 'h_ini', 'status', 'lease_renovado_em')
+                    time.sleep(2)
+                    st.rerun()
+                _avisar_descartados(descartados)
                 tempo = (datetime.now(services.TZ_BRASIL) - st.session_state['h_ini']).total_seconds()
                 services.salvar_log_tempo(user, id_p, nome_p, lote, tempo, "Fim", total, feitos)
                 
                 # Limpa tudo
-                for k in ['lote_ativo', 'h_ini', 'status', 'df_cache', 'saved_indices']: 
-                    if k in st.session_state: del st.session_state[k]
+                _limpar_estado_lote('lote_ativo', 'h_ini', 'status')
                 
                 st.balloons()
                 time.sleep(1)
                 st.rerun()
 
-    with c2:
-        # Botão de entregar só habilita se tudo estiver feito (opcional, mas recomendado)
-        # Se quiser permitir entrega parcial, remova o 'disabled'
-        pode_entregar = df_show.empty 
-        if st.button("✅ Entregar Lote", type="primary", disabled=not pode_entregar, help="Termine todos os itens para entregar"):
-            with st.spinner("Finalizando..."):
-                services.salvar_progresso_lote(df_ref, id_p, lote, True)
-                tempo = (datetime.now(services.TZ_BRASIL) - st.session_state['h_ini']).total_seconds()
-                services.salvar_log_tempo(user, id_p, nome_p, lote, tempo, "Fim", total, preenchidos)
-                for k in ['lote_ativo', 'h_ini', 'status', 'df_cache', 'saved_indices']: 
-                    if k in st.session_state: del st.session_state[k]
-                st.balloons(); time.sleep(1); st.rerun()
-
 # --- TELA PRODUÇÃO ---
 def tela_producao(user):
     st.title(f"🏭 Produção | {user}")
@@ -231,6 +484,17 @@ def tela_producao(user):
     if projs.empty: st.info("Sem projetos."); return
 
     p_dict = {r['nome']: r['id'] for _, r in projs.iterrows()}
+    # Projeto escolhido pelo distribuidor entra no selectbox antes de ele ser criado
+    if '_proximo_projeto' in st.session_state: st.session_state['sb_p'] = st.session_state.pop('_proximo_projeto')
+    if 'lote_ativo' not in st.session_state and st.button("🎯 Próximo lote", type="primary", help="Reserva o próximo lote livre pela política de distribuição"):
+        escolha = distribuicao.get_distribuidor().proximo(user)
+        nome_n = next((n for n, i in p_dict.items() if escolha and str(i) == str(escolha[0])), None)
+        if not nome_n: st.info("Nenhum lote livre no momento.")
+        else:
+            st.session_state['_proximo_projeto'] = nome_n
+            st.session_state.update({'lote_ativo': escolha[1], 'status': 'TRABALHANDO', 'h_ini': datetime.now(services.TZ_BRASIL), 'lease_renovado_em': time.time()})
+            _limpar_estado_lote()
+            st.rerun()
     nome_p = st.selectbox("Projeto:", ["Selecione..."] + list(p_dict.keys()), key="sb_p")
     if nome_p == "Selecione...": st.stop()
     id_p = p_dict[nome_p]
@@ -254,19 +518,19 @@ def tela_producao(user):
         sel = c1.selectbox("Trabalho:", ["Selecione..."]+opts, key="sb_l")
         if sel != "Selecione..." and c2.button("Acessar", type="primary"):
             num = int(sel.split()[1])
-            if "NOVO" in sel:
-                if not services.reservar_lote(id_p, num, user):
-                    st.error("Erro ao reservar."); time.sleep(2); st.rerun()
+            # RETOMAR também passa pela reserva: confere o dono e renova o lease
+            if not services.reservar_lote(id_p, num, user):
+                st.error("Erro ao reservar (o lote pode ter sido pego por outro operador)."); time.sleep(2); st.rerun()
+            distribuicao.get_distribuidor().registrar(id_p, num, user)
             
-            st.session_state.update({'lote_ativo': num, 'status': 'TRABALHANDO', 'h_ini': datetime.now(services.TZ_BRASIL)})
-            if 'df_cache' in st.session_state: del st.session_state['df_cache']
-            if 'saved_indices' in st.session_state: del st.session_state['saved_indices']
+            st.session_state.update({'lote_ativo': num, 'status': 'TRABALHANDO', 'h_ini': datetime.now(services.TZ_BRASIL), 'lease_renovado_em': time.time()})
+            _limpar_estado_lote()
             st.rerun()
     else:
         lote = st.session_state['lote_ativo']
         
-        if 'df_cache' not in st.session_state:
-            df = services.carregar_dados_lote(id_p, lote)
+        if sessoes.obter_df() is None:
+            df = services.carregar_dados_lote(id_p, lote).reset_index(drop=True)
             
             if df.empty:
                 st.error("Erro ao carregar dados. Limpe o cache.")
@@ -281,20 +545,21 @@ def tela_producao(user):
                 raw = info.iloc[0]['checkpoint']
                 if str(raw) not in ["nan", ""]: chk = str(raw).strip()
             
-            df.insert(0, "MARCADOR", "")
+            # Marcador guardado só como índices (a coluna é montada na página)
+            st.session_state['marcador_idx'] = set()
             if chk: 
                 mask = df['descricao'].astype(str).str.strip() == chk
-                df.loc[mask, 'MARCADOR'] = ">>> PAREI AQUI <<<"
+                st.session_state['marcador_idx'] = set(df.index[mask])
                 st.session_state['last_check'] = chk
             
-            # CRIAÇÃO DA COLUNA DE BUSCA (AQUI, UMA VEZ SÓ)
-            if 'BUSCA_GOOGLE' not in df.columns:
-                df['BUSCA_GOOGLE'] = df.apply(lambda x: f"https://www.google.com/search?q={x['ean']}", axis=1)
-
-            st.session_state['df_cache'] = df
+            df = sessoes.compactar_lote(df)
+            sessoes.guardar_df(df, user)
+            st.session_state['pendentes'] = _montar_pendentes(df)
+            # O que veio do Sheets já está sincronizado por definição
+            st.session_state['links_sync'] = {int(r): str(l) for r, l in zip(df['_row_index'], df['link'])}
         
-        df_header = st.session_state['df_cache']
-        if not df_header.empty:
+        df_header = sessoes.obter_df()
+        if df_header is not None and not df_header.empty:
             site_val = df_header.iloc[0]['site'] if 'site' in df_header.columns else '-'
             cep_val = df_header.iloc[0]['cep'] if 'cep' in df_header.columns else '-'
             end_val = df_header.iloc[0]['endereco'] if 'endereco' in df_header.columns else '-'
@@ -0,0 +1,108 @@
+# --- TESTE DE CARGA (SEM TOCAR A PLANILHA REAL) ---
+# Simula N operadores fazendo reservar -> editar -> checkpoint -> entregar
+# contra o Google Sheets falso em memória (modules/sheets_falso.py).
+#
+#   python teste_carga.py --operadores 20 --linhas 5000 --latencia-ms 150
+#
+# Mostra p50/p99 por função de services.py e o total de chamadas à "API".
+import argparse
+import random
+import threading
+import time
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+from modules import services, sheets_falso, metricas
+
+tempos = defaultdict(list)
+_lock_tempos = threading.Lock()
+
+def medir(nome, func, *args, **kwargs):
+    t = time.perf_counter()
+    try: return func(*args, **kwargs)
+    finally:
+        with _lock_tempos: tempos[nome].append(time.perf_counter() - t)
+
+def criar_projeto(n_linhas, tam_lote):
+    df = pd.DataFrame({
+        "Site*": ["Loja Teste"] + [""] * (n_linhas - 1),
+        "Descrição*": [f"Produto {i}" for i in range(n_linhas)],
+        "EAN*": [str(7890000000000 + i) for i in range(n_linhas)],
+        "Quantidade no Lote*": [str(tam_lote)] + [""] * (n_linhas - 1),
+        "CEP": ["01000-000"] * n_linhas,
+        "Endereço": ["Rua Teste, 1"] * n_linhas,
+    })
+    id_p, _, _ = medir("processar_upload", services.processar_upload, df, "carga.xlsx")
+    return id_p
+
+def operador(nome, id_p, cola_por_vez, conflitos):
+    while True:
+        df_lotes = medir("carregar_lotes_do_projeto", services.carregar_lotes_do_projeto, id_p)
+        livres = df_lotes[df_lotes['status'] == 'Livre']['lote'].tolist() if not df_lotes.empty else []
+        if not livres: return
+        lote = random.choice(livres[:5])  # Vários operadores disputando os primeiros lotes
+        if not medir("reservar_lote", services.reservar_lote, id_p, lote, nome):
+            with _lock_tempos: conflitos[0] += 1
+            continue
+
+        df = medir("carregar_dados_lote", services.carregar_dados_lote, id_p, lote)
+        sync = {int(r): str(l) for r, l in zip(df['_row_index'], df['link'])}
+        linhas = df['_row_index'].astype(int).tolist()
+        fez_checkpoint = False
+        for k in range(0, len(linhas), cola_por_vez):
+            alteracoes = [{'indice_excel': r, 'link': f"https://loja.teste/{id_p}/{r}"} for r in linhas[k:k + cola_por_vez]]
+            if medir("salvar_lote_links", services.salvar_lote_links, id_p, lote, alteracoes):
+                for a in alteracoes: sync[a['indice_excel']] = a['link']
+            for a in alteracoes: df.loc[df['_row_index'] == a['indice_excel'], 'link'] = a['link']
+            if not fez_checkpoint and k >= len(linhas) // 2:
+                fez_checkpoint = True
+                medir("salvar_progresso_lote (checkpoint)", services.salvar_progresso_lote, df, id_p, lote, False, "meio", sync)
+        medir("salvar_progresso_lote (entrega)", services.salvar_progresso_lote, df, id_p, lote, True, sincronizados=sync, usuario=nome)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--operadores", type=int, default=10)
+    ap.add_argument("--linhas", type=int, default=2000)
+    ap.add_argument("--tam-lote", type=int, default=100)
+    ap.add_argument("--cola-por-vez", type=int, default=5, help="links enviados por salvar_lote_links")
+    ap.add_argument("--latencia-ms", type=float, default=100)
+    ap.add_argument("--jitter-ms", type=float, default=50)
+    ap.add_argument("--cota-api-min", type=int, default=0, help="429 acima de N chamadas/min na planilha falsa (0 = sem)")
+    ap.add_argument("--cota-cliente-min", type=int, default=100000, help="token bucket do services.retry_api")
+    ap.add_argument("--erro-5xx", type=float, default=0.0)
+    args = ap.parse_args()
+
+    ss = sheets_falso.PlanilhaFalsa(args.latencia_ms, args.jitter_ms, args.cota_api_min or None, args.erro_5xx)
+    services.usar_planilha(ss)
+    services.configurar_cota(args.cota_cliente_min, args.cota_cliente_min)
+    metricas.limpar()
+
+    id_p = criar_projeto(args.linhas, args.tam_lote)
+    chamadas_upload = ss.total_chamadas()
+
+    conflitos = [0]
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=operador, args=(f"op{i}", id_p, args.cola_por_vez, conflitos)) for i in range(args.operadores)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    duracao = time.perf_counter() - t0
+
+    print(f"\n=== {args.operadores} operadores, {args.linhas} linhas, lotes de {args.tam_lote} ===")
+    print(f"Duração: {duracao:.1f}s | reservas perdidas: {conflitos[0]}")
+    print(f"\n{'função':40} {'n':>6} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    for nome, ts in sorted(tempos.items()):
+        ts = np.array(ts) * 1000
+        print(f"{nome:40} {len(ts):>6} {np.percentile(ts, 50):>10.1f} {np.percentile(ts, 99):>10.1f}")
+
+    print(f"\nChamadas à API: {ss.total_chamadas()} (upload: {chamadas_upload}) | erros simulados: {dict(ss.erros)}")
+    for op, n in ss.contador.most_common(): print(f"  {op:20} {n}")
+
+    # Confere que nenhum link se perdeu
+    aba = services.destino_dados_projeto(id_p)  # shard do projeto (ou dados_brutos)
+    df_final = pd.DataFrame(ss.abas[aba].get_all_values()[1:], columns=services.COLS_DADOS)
+    df_final = df_final[df_final['id_projeto'] == id_p]
+    vazios = int((df_final['link'] == "").sum())
+    print(f"\nLinhas sem link no fim: {vazios} de {len(df_final)}")
+
+if __name__ == "__main__":
+    main()
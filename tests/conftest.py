@@ -0,0 +1,39 @@
+import os
+import sys
+import pandas as pd
+import pytest
+import streamlit as st
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import services, sheets_falso  # noqa: E402
+
+# --- PLANILHA FALSA POR TESTE ---
+# Cada teste roda contra um Google Sheets em memória (modules/sheets_falso.py)
+# e um DIR_LOCAL próprio; os singletons do st.cache_resource são recriados.
+
+@pytest.fixture
+def planilha(tmp_path, monkeypatch):
+    monkeypatch.setattr(services, "DIR_LOCAL", str(tmp_path))
+    st.cache_resource.clear()
+    ss = sheets_falso.PlanilhaFalsa()
+    services.usar_planilha(ss)
+    services.configurar_cota(100000, 100000)  # A planilha falsa não tem cota
+    services._indice_linhas.clear()
+    yield ss
+    st.cache_resource.clear()
+    services.usar_planilha(None)
+
+def criar_projeto(n_linhas, tam_lote, site="Loja Teste", nome="teste.xlsx"):
+    df = pd.DataFrame({
+        "Site*": [site] + [""] * (n_linhas - 1),
+        "Descrição*": [f"Produto {i}" for i in range(n_linhas)],
+        "EAN*": [str(7890000000000 + i) for i in range(n_linhas)],
+        "Quantidade no Lote*": [str(tam_lote)] + [""] * (n_linhas - 1),
+        "CEP": ["01000-000"] * n_linhas,
+        "Endereço": ["Rua Teste, 1"] * n_linhas,
+    })
+    id_p, _, _ = services.processar_upload(df, nome)
+    return id_p
+
+def linhas_da_aba(ss, aba):
+    return ss.abas[aba].get_all_values()[1:]
@@ -0,0 +1,18 @@
+from modules import services, armazenamento
+from conftest import criar_projeto
+
+def test_importar_do_sheets_le_shards(planilha, tmp_path, monkeypatch):
+    monkeypatch.setattr(services, "MODO_SHARD", "nenhum")
+    a = criar_projeto(25, 10)
+    monkeypatch.setattr(services, "MODO_SHARD", "aba")
+    b = criar_projeto(12, 5, site="Outra Loja")
+    assert f"dados_{b}" in planilha.abas
+
+    banco = armazenamento.BackendSQLite(str(tmp_path / "importado.db"))
+    banco.importar_do_sheets()
+
+    con = banco._con()
+    contagem = dict(con.execute("SELECT id_projeto, COUNT(*) FROM dados_brutos GROUP BY id_projeto"))
+    assert contagem == {a: 25, b: 12}
+    assert {r[0] for r in con.execute("SELECT DISTINCT site FROM dados_brutos WHERE id_projeto = ?", (b,))} == {"Outra Loja"}
+    assert con.execute("SELECT COUNT(*) FROM controle_lotes WHERE id_projeto = ?", (b,)).fetchone()[0] == 3
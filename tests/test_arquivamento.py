@@ -0,0 +1,110 @@
+import time
+import pytest
+from modules import services, arquivamento
+from conftest import criar_projeto, linhas_da_aba
+
+def _concluir(ss, id_p):
+    # Marca todos os lotes do projeto como concluídos direto na planilha
+    for l in ss.abas["controle_lotes"].linhas[1:]:
+        if l[0] == id_p: l[2] = "Concluído"
+    services.invalidar_cache()
+
+def test_arquiva_shard_e_dados_brutos(planilha, monkeypatch):
+    monkeypatch.setattr(services, "MODO_SHARD", "nenhum")
+    a = criar_projeto(25, 10)
+    b = criar_projeto(30, 10)
+    c = criar_projeto(15, 10)
+    monkeypatch.setattr(services, "MODO_SHARD", "aba")
+    d = criar_projeto(12, 5)
+    for id_p in (a, d): _concluir(planilha, id_p)
+
+    assert sorted(arquivamento.arquivar([a, d, b])) == sorted([a, d])  # b não está concluído
+
+    assert f"dados_{d}" not in planilha.abas
+    assert {l[0] for l in linhas_da_aba(planilha, "projetos")} == {b, c}
+    assert {l[0] for l in linhas_da_aba(planilha, "controle_lotes")} == {b, c}
+    dados = linhas_da_aba(planilha, "dados_brutos")
+    assert [l[0] for l in dados] == [b] * 30 + [c] * 15
+    # Faixas de dados_brutos recalculadas: b começa na linha 2, c logo depois
+    faixas = {(l[0], int(l[1])): (int(l[6]), int(l[7])) for l in linhas_da_aba(planilha, "controle_lotes")}
+    assert faixas[(b, 1)] == (2, 11) and faixas[(c, 1)] == (32, 41) and faixas[(c, 2)] == (42, 46)
+    assert len(list(arquivamento.iterar_linhas(a))) == 25
+    assert len(list(arquivamento.iterar_linhas(d))) == 12
+    # Exportação continua pelo arquivo local
+    assert services.baixar_excel(a, "csv")
+
+def test_arquivar_nao_perde_escrita_concorrente(planilha, monkeypatch):
+    monkeypatch.setattr(services, "MODO_SHARD", "nenhum")
+    a = criar_projeto(20, 10)
+    b = criar_projeto(20, 10)
+    _concluir(planilha, a)
+    gravar = arquivamento._gravar_arquivo
+
+    def gravar_e_outra_replica_reserva(*args):
+        gravar(*args)
+        # Outra réplica reserva um lote de b depois da leitura do arquivamento
+        for l in planilha.abas["controle_lotes"].linhas[1:]:
+            if l[0] == b and str(l[1]) == "2": l[2:4], l[8] = ["Em Andamento", "op9"], "2099-01-01 00:00:00"
+    monkeypatch.setattr(arquivamento, "_gravar_arquivo", gravar_e_outra_replica_reserva)
+
+    assert arquivamento.arquivar([a]) == [a]
+    lote = next(l for l in linhas_da_aba(planilha, "controle_lotes") if l[0] == b and l[1] == "2")
+    assert lote[2:4] == ["Em Andamento", "op9"] and lote[8] == "2099-01-01 00:00:00"
+
+def test_arquivar_de_novo_termina_o_que_ficou(planilha, monkeypatch):
+    a = criar_projeto(10, 5)
+    b = criar_projeto(10, 5)
+    _concluir(planilha, a)
+    apagar = arquivamento._apagar_linhas_dos_projetos
+
+    def cai_no_controle(ws, ids, trava):
+        if ws.title == "controle_lotes": raise Exception("queda")
+        return apagar(ws, ids, trava)
+    monkeypatch.setattr(arquivamento, "_apagar_linhas_dos_projetos", cai_no_controle)
+    try: arquivamento.arquivar([a])
+    except Exception: pass
+    assert arquivamento.esta_arquivado(a) and f"dados_{a}" not in planilha.abas
+
+    monkeypatch.setattr(arquivamento, "_apagar_linhas_dos_projetos", apagar)
+    assert arquivamento.arquivar([a]) == [a]
+    assert {l[0] for l in linhas_da_aba(planilha, "controle_lotes")} == {b}
+    assert {l[0] for l in linhas_da_aba(planilha, "projetos")} == {b}
+
+def test_sem_trava_nao_arquiva(planilha, monkeypatch):
+    from modules import cache_compartilhado as cc
+    a = criar_projeto(10, 5)
+    _concluir(planilha, a)
+    comp = cc.CacheRedis(cc.RedisMemoria())
+    monkeypatch.setattr(services, "cache_compartilhado", lambda: comp)
+    monkeypatch.setattr(cc, "ESPERA_TRAVA", 0)
+    token = comp.adquirir("arquivamento", 0)  # Outra réplica arquivando
+    with pytest.raises(Exception, match="Outro processo"):
+        arquivamento.arquivar([a])
+    assert f"dados_{a}" in planilha.abas and not arquivamento.esta_arquivado(a)
+    comp.liberar("arquivamento", token)
+    assert arquivamento.arquivar([a]) == [a]
+
+def test_trava_perdida_interrompe_a_remocao(planilha, monkeypatch):
+    monkeypatch.setattr(services, "MODO_SHARD", "nenhum")
+    a = criar_projeto(10, 5)
+    b = criar_projeto(10, 5)
+    _concluir(planilha, a)
+    gravar = arquivamento._gravar_arquivo
+
+    def gravar_e_perder_a_trava(*args):
+        gravar(*args)
+        # A trava venceu e foi para outra réplica (renovação falhou)
+        comp = services.cache_compartilhado()
+        comp.r.dados.clear()
+        comp.adquirir("arquivamento", 0)
+        time.sleep(0.05)
+    from modules import cache_compartilhado as cc
+    comp = cc.CacheRedis(cc.RedisMemoria())
+    monkeypatch.setattr(services, "cache_compartilhado", lambda: comp)
+    monkeypatch.setattr(cc, "VALIDADE_TRAVA", 0.03)  # Renova a cada 10 ms
+    monkeypatch.setattr(arquivamento, "_gravar_arquivo", gravar_e_perder_a_trava)
+
+    with pytest.raises(Exception, match="não está mais"):
+        arquivamento.arquivar([a])
+    assert len(linhas_da_aba(planilha, "dados_brutos")) == 20  # Nada apagado sem a trava
+    assert arquivamento.esta_arquivado(a)
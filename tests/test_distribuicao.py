@@ -0,0 +1,62 @@
+from modules import services, distribuicao
+from conftest import criar_projeto
+
+def test_afinidade_sem_ler_grupos_com_a_trava(planilha, monkeypatch):
+    monkeypatch.setattr(services.random, "uniform", lambda a, b: 0)
+    a = criar_projeto(20, 10, site="Loja A")
+    b = criar_projeto(20, 10, site="Loja B")
+    d = distribuicao.Distribuidor()
+    lidos = []
+    def grupos(id_p):
+        assert not d.lock.locked()  # A varredura dos dados não pode segurar a fila
+        lidos.append(id_p)
+        return {"1": f"{id_p}|x", "2": f"{id_p}|x"}
+    monkeypatch.setattr(distribuicao, "_grupos_do_projeto", grupos)
+
+    assert services.reservar_lote(b, 1, "ana")
+    services.salvar_progresso_lote(services.carregar_dados_lote(b, 1), b, 1, True, usuario="ana")
+    d.registrar(b, 1, "ana")
+    assert d.proximo("ana") == (b, 2, False)  # Mesmo grupo do último lote, mesmo com o projeto a na frente
+    assert sorted(lidos) == sorted([a, b])
+
+    d.proximo("ana")
+    assert len(lidos) == 2  # Grupos em cache dentro da validade
+    monkeypatch.setattr(distribuicao, "VALIDADE_GRUPOS_SEG", -1)
+    d.proximo("ana")
+    assert len(lidos) > 2
+
+def test_retomada_nao_le_grupos(planilha, monkeypatch):
+    monkeypatch.setattr(services.random, "uniform", lambda a, b: 0)
+    a = criar_projeto(20, 10, site="Loja A")
+    b = criar_projeto(20, 10, site="Loja B")
+    d = distribuicao.Distribuidor()
+    lidos = []
+    monkeypatch.setattr(distribuicao, "_grupos_do_projeto", lambda id_p: lidos.append(id_p) or {})
+
+    assert services.reservar_lote(a, 1, "ana")
+    d.registrar(a, 1, "ana")
+    assert d.proximo("ana") == (a, 1, True)
+    assert lidos == []
+
+def test_grupos_so_do_ultimo_projeto_e_do_melhor_candidato(planilha, monkeypatch):
+    monkeypatch.setattr(services.random, "uniform", lambda a, b: 0)
+    ids = [criar_projeto(20, 10, site=f"Loja {i}") for i in range(4)]
+    d = distribuicao.Distribuidor()
+    lidos = []
+    monkeypatch.setattr(distribuicao, "_grupos_do_projeto", lambda id_p: lidos.append(id_p) or {})
+
+    assert services.reservar_lote(ids[2], 1, "ana")
+    services.salvar_progresso_lote(services.carregar_dados_lote(ids[2], 1), ids[2], 1, True, usuario="ana")
+    d.registrar(ids[2], 1, "ana")
+    assert d.proximo("ana") == (ids[2], 2, False)
+    assert sorted(lidos) == sorted([ids[2], ids[0]])
+
+def test_fila_montada_sem_segurar_a_trava(planilha, monkeypatch):
+    criar_projeto(20, 10)
+    d = distribuicao.Distribuidor()
+    ler = services.carregar_lotes_do_projeto
+    def lotes(id_p):
+        assert not d.lock.locked()  # Leitura do controle_lotes fora da trava da fila
+        return ler(id_p)
+    monkeypatch.setattr(services, "carregar_lotes_do_projeto", lotes)
+    assert d.tamanho() == 2
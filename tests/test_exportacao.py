@@ -0,0 +1,47 @@
+import io
+import os
+import pandas as pd
+from modules import services, snapshot_dados, exportacao
+from conftest import criar_projeto
+
+def _csv(conteudo):
+    return pd.read_csv(io.BytesIO(conteudo), sep=";", dtype=str, keep_default_na=False, encoding="utf-8-sig")
+
+def test_exporta_pela_planilha_sem_snapshot(planilha, monkeypatch):
+    monkeypatch.setattr(snapshot_dados, "ATIVO", False)
+    id_p = criar_projeto(250, 100)
+    df = _csv(services.baixar_excel(id_p, "csv"))
+    assert len(df) == 250
+    assert df.iloc[:, -1].tolist() == ["1"] * 100 + ["2"] * 100 + ["3"] * 50
+
+def test_exporta_pela_coluna_a_com_indice_desatualizado(planilha, monkeypatch):
+    monkeypatch.setattr(snapshot_dados, "ATIVO", False)
+    monkeypatch.setattr(services, "MODO_SHARD", "nenhum")  # Os dois projetos em dados_brutos
+    outro = criar_projeto(30, 10)
+    id_p = criar_projeto(40, 10)
+    # Faixas apontando para as linhas de outro projeto: cai na leitura pela coluna A
+    registros = services.ler_registros_cache("controle_lotes")
+    for r in registros:
+        if str(r['id_projeto']) == id_p: r['linha_ini'], r['linha_fim'] = 2, 11
+    df = _csv(services.baixar_excel(id_p, "csv"))
+    assert len(df) == 40
+    assert set(df.iloc[:, 0]) != {outro}
+
+def test_cache_de_exportacao_guarda_versao_em_uso(planilha, monkeypatch):
+    id_p = criar_projeto(30, 10)
+    snapshot_dados.atualizar(f"dados_{id_p}")
+    antes = planilha.contador["batch_get"]
+    v1, do_cache = exportacao.gerar_projeto(id_p, "csv")
+    assert not do_cache and planilha.contador["batch_get"] - antes == 1  # Uma conferência do snapshot, não duas
+    assert exportacao.gerar_projeto(id_p, "csv") == (v1, True)
+
+    ws = planilha.abas[f"dados_{id_p}"]
+    ws.linhas[1][7] = "https://loja.teste/novo"
+    monkeypatch.setattr(exportacao, "RETENCAO_VERSAO_SEG", -1)
+    v2, do_cache = exportacao.gerar_projeto(id_p, "csv", em_uso=lambda: {v1})
+    assert v2 != v1 and not do_cache
+    assert os.path.exists(v1)  # Um trabalho ainda zipa/serve a versão anterior
+
+    ws.linhas[1][7] = "https://loja.teste/outro"
+    v3, _ = exportacao.gerar_projeto(id_p, "csv")
+    assert os.path.exists(v3) and not os.path.exists(v1) and not os.path.exists(v2)
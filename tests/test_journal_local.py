@@ -0,0 +1,44 @@
+import fcntl
+import json
+import os
+from modules import services, journal_local, fila_salvamento, log_tempo
+
+def _vivo(caminho):
+    # Outro processo vivo: segura a trava do arquivo dele
+    fd = os.open(caminho + ".lock", os.O_CREAT | os.O_RDWR)
+    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    return fd
+
+def _journal(nome, id_p, linha):
+    with open(services.caminho_local(nome), "w", encoding="utf-8") as f:
+        json.dump({f"{id_p}|{linha}": {'link': "https://x", 'id_linha': "", 'ean': "", 'site': "", 'id_projeto': id_p, 'lote': "1"}}, f)
+
+def test_fila_adota_journal_so_de_processo_morto(planilha, monkeypatch):
+    monkeypatch.setattr(fila_salvamento.FilaSalvamento, "_loop", lambda self: None)
+    _journal("fila_links.json", "antigo", 2)        # Nome fixo de antes do journal por processo
+    _journal("fila_links.morto-11.json", "morto", 3)
+    _journal("fila_links.vivo-12.json", "vivo", 4)
+    fd = _vivo(services.caminho_local("fila_links.vivo-12.json"))
+
+    fila = fila_salvamento.FilaSalvamento(journal_local.arquivo_do_processo("fila_links.json"))
+
+    assert set(fila.pendentes) == {("antigo", 2), ("morto", 3)}
+    assert sorted(os.listdir(services.DIR_LOCAL)) == sorted([
+        os.path.basename(fila.arquivo_journal), os.path.basename(fila.arquivo_journal) + ".lock",
+        "fila_links.vivo-12.json", "fila_links.vivo-12.json.lock"])
+    with open(fila.arquivo_journal, encoding="utf-8") as f: assert len(json.load(f)) == 2
+    os.close(fd)
+
+def test_spool_de_tempo_adota_o_de_processo_morto(planilha, monkeypatch):
+    monkeypatch.setattr(log_tempo.EscritorLog, "_loop", lambda self: None)
+    for nome, id_r in (("spool_registro_tempo.morto-21.jsonl", "a"), ("spool_registro_tempo.vivo-22.jsonl", "b")):
+        with open(services.caminho_local(nome), "w", encoding="utf-8") as f: f.write(json.dumps([id_r, "1"]) + "\n")
+    fd = _vivo(services.caminho_local("spool_registro_tempo.vivo-22.jsonl"))
+
+    escritor = log_tempo.EscritorLog(journal_local.arquivo_do_processo("spool_registro_tempo.jsonl"))
+    escritor.registrar(["c", "2"])
+
+    assert escritor.buffer == [["a", "1"], ["c", "2"]]
+    assert not os.path.exists(services.caminho_local("spool_registro_tempo.morto-21.jsonl"))
+    with open(escritor.arquivo_spool, encoding="utf-8") as f: assert [json.loads(l) for l in f] == [["a", "1"], ["c", "2"]]
+    os.close(fd)
@@ -0,0 +1,55 @@
+import io
+import pandas as pd
+import pytest
+from modules import leitor_upload
+
+def _csv(texto, codificacao):
+    return io.BytesIO(texto.encode(codificacao))
+
+def test_csv_do_excel_brasileiro_em_blocos():
+    texto = ("Site*;Descrição*;EAN*;Quantidade no Lote*;CEP;Endereço\r\n"
+             "Loja São João;Pão;0789;10;01000-000;Rua Á\r\n"
+             ";Café;0790;;;\r\n"
+             ";;;;;\r\n"
+             ";Açúcar;0791;;;\r\n")
+    avisos = []
+    blocos = list(leitor_upload.ler_blocos(_csv(texto, "cp1252"), "itens.CSV", 2, avisos))
+    df = pd.concat(blocos)
+    assert [len(b) for b in blocos] == [2, 1]  # A linha em branco sai do segundo bloco
+    assert df[1].tolist() == ["Pão", "Café", "Açúcar"] and df[0].tolist() == ["Loja São João", "", ""]
+    assert df[2].tolist() == ["0789", "0790", "0791"]  # EAN continua texto, com o zero
+    assert avisos == []
+
+def test_csv_utf8_com_virgula_e_cabecalho_diferente():
+    texto = "Loja,Descricao,EAN\nLoja A,Produto,123\nLoja B,Outro,456\nLoja C,Mais um,789\n"
+    avisos = []
+    blocos = list(leitor_upload.ler_blocos(_csv("﻿" + texto, "utf-8"), "itens.csv", 2, avisos))
+    assert [len(b) for b in blocos] == [2, 1]
+    assert list(blocos[0].columns) == list(range(len(leitor_upload.COLS_MODELO)))
+    assert pd.concat(blocos)[2].tolist() == ["123", "456", "789"]
+    assert (pd.concat(blocos)[5] == "").all()  # Coluna que o arquivo não tem vem vazia
+    assert avisos == ["Coluna 1: esperado 'Site*', veio 'Loja'"]  # Acento e asterisco não contam
+
+def test_xlsx_em_blocos():
+    from openpyxl import Workbook
+    wb = Workbook()
+    ws = wb.active
+    ws.append(leitor_upload.COLS_MODELO)
+    ws.append(["Loja A", "Produto 1", 7891000100101, 50, "01000-000", None])
+    ws.append([None, None, None, None, None, None])
+    ws.append([None, "Produto 2", "0789", None, None, None])
+    ws.append([None, "Produto 3", 7891000100103.0, None, None, None])
+    arq = io.BytesIO()
+    wb.save(arq)
+    arq.seek(0)
+    avisos = []
+    blocos = list(leitor_upload.ler_blocos(arq, "itens.xlsx", 2, avisos))
+    df = pd.concat(blocos)
+    assert [len(b) for b in blocos] == [1, 2]
+    assert df[2].tolist() == ["7891000100101", "0789", "7891000100103"]  # Número sem ".0"
+    assert df[3].tolist() == ["50", "", ""] and df[5].tolist() == ["", "", ""]
+    assert avisos == []
+
+def test_arquivo_com_poucas_colunas_e_recusado():
+    with pytest.raises(ValueError):
+        list(leitor_upload.ler_blocos(_csv("Site;EAN\nLoja;123\n", "utf-8"), "itens.csv", 10))
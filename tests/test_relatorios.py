@@ -0,0 +1,55 @@
+import pytest
+from modules import log_tempo, relatorios, services, sheets_falso
+from conftest import linhas_da_aba
+
+def _linha(id_proj, nome, lote, desc, data="2026-10-01", duracao=60):
+    return ["x", str(lote), data, "ana", "10:00:00", "10:01:00", str(duracao), nome, desc, id_proj]
+
+def test_projetos_com_mesmo_nome_nao_se_misturam():
+    estado = relatorios._estado_vazio()
+    relatorios._aplicar_linha(estado, _linha("p1", "teste.xlsx", 1, "Pausa (4/10)"))
+    relatorios._aplicar_linha(estado, _linha("p2", "teste.xlsx", 1, "Pausa (3/10)"))
+    relatorios._aplicar_linha(estado, _linha("p1", "teste.xlsx", 1, "Fim (10/10)"))
+
+    assert estado['operadores']['ana']['itens'] == 4 + 3 + 6
+    assert set(estado['lotes']) == {"p1|1", "p2|1"}
+    assert estado['lotes']["p1|1"]['concluido'] and not estado['lotes']["p2|1"]['concluido']
+    assert estado['concluidos_dia'] == {"p1": {"2026-10-01": 1}}
+
+def test_registro_antigo_sem_id_usa_o_nome():
+    estado = relatorios._estado_vazio()
+    relatorios._aplicar_linha(estado, _linha("", "velho.xlsx", 2, "Fim (5/5)")[:9])
+    assert "nome:velho.xlsx|2" in estado['lotes']
+    assert estado['concluidos_dia'] == {"nome:velho.xlsx": {"2026-10-01": 1}}
+
+def test_rollups_leem_o_id_gravado_pelo_log(planilha):
+    # Aba antiga, ainda sem a coluna id_projeto
+    ws = planilha.add_worksheet("registro_tempo", 1000, 9)
+    ws.append_row(log_tempo.CABECALHO[:9])
+    for id_p in ("p1", "p2"):
+        services.salvar_log_tempo("ana", id_p, "teste.xlsx", 1, 60, "Fim", 10, 10)
+    assert log_tempo.get_escritor().flush()
+    assert ws.get_all_values()[0] == log_tempo.CABECALHO
+    assert [l[9] for l in linhas_da_aba(planilha, "registro_tempo")] == ["p1", "p2"]
+
+    assert relatorios.atualizar_rollups(forcar=True) == 2
+    estado = relatorios.carregar_estado()
+    assert sorted(estado['concluidos_dia']) == ["p1", "p2"]
+
+def test_sem_registro_tempo_nao_ha_rollups(planilha):
+    assert "registro_tempo" not in planilha.abas
+    assert relatorios.atualizar_rollups(forcar=True) == 0
+
+def test_erro_da_api_nao_vira_zero(planilha, monkeypatch):
+    def negado(nome): raise sheets_falso.APIErrorFalso(403, "sem permissão")
+    monkeypatch.setattr(planilha, "worksheet", negado)
+    with pytest.raises(sheets_falso.APIErrorFalso):
+        relatorios.atualizar_rollups(forcar=True)
+
+def test_erro_da_api_nao_cria_registro_tempo(planilha, monkeypatch):
+    def negado(nome): raise sheets_falso.APIErrorFalso(403, "sem permissão")
+    monkeypatch.setattr(planilha, "worksheet", negado)
+    services.salvar_log_tempo("ana", "p1", "teste.xlsx", 1, 60, "Pausa", 10, 3)
+    assert log_tempo.get_escritor().flush() is False
+    assert "registro_tempo" not in planilha.abas
+    assert log_tempo.get_escritor().status()['pendentes'] == 1
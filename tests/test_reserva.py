@@ -0,0 +1,94 @@
+import threading
+from modules import services
+from conftest import criar_projeto
+
+def _lote(ss, id_p, lote):
+    for l in ss.abas["controle_lotes"].linhas[1:]:
+        if l[0] == id_p and str(l[1]) == str(lote): return l
+
+def test_reserva_disputada_fica_com_um_so(planilha, monkeypatch):
+    monkeypatch.setattr(services.random, "uniform", lambda a, b: 0)
+    id_p = criar_projeto(20, 10)
+    resultados = {}
+    threads = [threading.Thread(target=lambda u=u: resultados.__setitem__(u, services.reservar_lote(id_p, 1, u)))
+               for u in ("ana", "bia", "caio")]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    ganhadores = [u for u, ok in resultados.items() if ok]
+    assert len(ganhadores) == 1
+    assert _lote(planilha, id_p, 1)[2:4] == ["Em Andamento", ganhadores[0]]
+
+def test_cabecalho_do_controle_conferido_uma_vez(planilha, monkeypatch):
+    monkeypatch.setattr(services.random, "uniform", lambda a, b: 0)
+    id_p = criar_projeto(30, 10)
+    services.reservar_lote(id_p, 1, "ana")
+    antes = planilha.contador["row_values"]
+    assert services.reservar_lote(id_p, 2, "bia") and services.reservar_lote(id_p, 3, "caio")
+    assert planilha.contador["row_values"] == antes
+
+def test_entrega_so_pelo_dono(planilha, monkeypatch):
+    monkeypatch.setattr(services.random, "uniform", lambda a, b: 0)
+    id_p = criar_projeto(10, 10)
+    assert services.reservar_lote(id_p, 1, "ana")
+    # O lease venceu e outro operador pegou o lote
+    _lote(planilha, id_p, 1)[3] = "bia"
+    services.invalidar_cache()
+    df = services.carregar_dados_lote(id_p, 1)
+    df['link'] = "https://loja.teste/x"
+
+    assert services.salvar_progresso_lote(df, id_p, 1, True, usuario="ana") is False
+    assert _lote(planilha, id_p, 1)[2:4] == ["Em Andamento", "bia"]
+    assert services.salvar_progresso_lote(df, id_p, 1, True, usuario="bia")
+    assert _lote(planilha, id_p, 1)[2] == "Concluído"
+
+def test_handles_das_abas_abertos_uma_vez(planilha, monkeypatch):
+    monkeypatch.setattr(services.random, "uniform", lambda a, b: 0)
+    id_p = criar_projeto(30, 10)
+    services.reservar_lote(id_p, 1, "ana")
+    antes = planilha.contador["worksheet"]
+    assert services.reservar_lote(id_p, 2, "bia") and services.renovar_lease(id_p, 2, "bia")
+    df = services.carregar_dados_lote(id_p, 2)
+    assert services.salvar_progresso_lote(df, id_p, 2, True, usuario="bia")
+    assert planilha.contador["worksheet"] == antes
+
+def test_abertura_de_aba_aparece_nas_metricas(planilha, monkeypatch):
+    from modules import metricas
+    monkeypatch.setattr(services.random, "uniform", lambda a, b: 0)
+    id_p = criar_projeto(10, 10)
+    services.usar_planilha(planilha)  # Handles esquecidos: a reserva abre controle_lotes de novo
+    metricas.limpar()
+    assert services.reservar_lote(id_p, 1, "ana")
+    df = metricas.como_dataframe()
+    aberturas = df[df['operacao'] == "worksheet"]
+    assert ("controle_lotes", "reservar_lote") in set(zip(aberturas['aba'], aberturas['chamador']))
+
+def test_renovar_lease_nao_sobe_versao(planilha, monkeypatch):
+    monkeypatch.setattr(services.random, "uniform", lambda a, b: 0)
+    id_p = criar_projeto(10, 10)
+    assert services.reservar_lote(id_p, 1, "ana")
+    versao = planilha.abas["versoes"].get_all_values()
+    assert services.renovar_lease(id_p, 1, "ana")
+    assert planilha.abas["versoes"].get_all_values() == versao
+
+def test_aba_versoes_inexistente_nao_e_erro(planilha, capsys):
+    from modules import metricas
+    assert "versoes" not in planilha.abas
+    metricas.limpar()
+    services.ler_versoes(planilha)
+    assert "versoes" in planilha.abas
+    assert "Erro fatal" not in capsys.readouterr().out
+    df = metricas.como_dataframe()
+    assert (df['erro'] == "").all()
+
+def test_retomada_nao_espera_a_conferencia(planilha, monkeypatch):
+    esperas = []
+    monkeypatch.setattr(services.random, "uniform", lambda a, b: esperas.append((a, b)) or 0)
+    monkeypatch.setattr(services, "ESPERA_CONFERENCIA_RESERVA", (0.5, 0.9))
+    id_p = criar_projeto(10, 10)
+    assert services.reservar_lote(id_p, 1, "ana")
+    assert esperas.count((0.5, 0.9)) == 1
+    leituras = planilha.contador["get"]
+    assert services.reservar_lote(id_p, 1, "ana")
+    assert esperas.count((0.5, 0.9)) == 1
+    assert planilha.contador["get"] == leituras + 1  # Só a leitura antes de escrever, sem a conferência
+    assert _lote(planilha, id_p, 1)[2:4] == ["Em Andamento", "ana"]
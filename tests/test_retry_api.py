@@ -0,0 +1,53 @@
+import pytest
+from modules import services, sheets_falso
+
+@pytest.fixture
+def esperas(monkeypatch):
+    # Dormidas do retry_api/LimitadorCota, sem dormir de verdade
+    feitas = []
+    monkeypatch.setattr(services.time, "sleep", feitas.append)
+    return feitas
+
+def _falha_antes(erros):
+    # Função que levanta cada erro da lista, na ordem, e depois responde "ok"
+    chamadas = []
+    def get(*args):
+        chamadas.append(args)
+        if len(chamadas) <= len(erros): raise erros[len(chamadas) - 1]
+        return "ok"
+    return get, chamadas
+
+def test_classificacao_dos_erros():
+    assert services._classificar_erro(sheets_falso.APIErrorFalso(429, "cota", retry_after=7)) == (429, True, 7.0)
+    assert services._classificar_erro(sheets_falso.APIErrorFalso(503, "fora")) == (503, True, None)
+    assert services._classificar_erro(sheets_falso.APIErrorFalso(400, "range inválido")) == (400, False, None)
+    assert services._classificar_erro(ConnectionResetError()) == (None, True, None)
+    assert services._classificar_erro(ValueError("bug")) == (None, False, None)
+
+def test_retry_after_respeitado_e_cota_pausada(planilha, esperas):
+    services.configurar_cota(60, 60)
+    get, chamadas = _falha_antes([sheets_falso.APIErrorFalso(429, "cota", retry_after=7)])
+    assert services.retry_api(get, "A1") == "ok"
+    assert len(chamadas) == 2
+    assert 7 in esperas
+    # O 429 segura o balde inteiro: a próxima chamada de leitura também espera
+    esperas.clear()
+    assert services._limitadores["leitura"].adquirir() > 6
+
+def test_erro_transitorio_sem_retry_after_usa_backoff(planilha, esperas):
+    get, chamadas = _falha_antes([sheets_falso.APIErrorFalso(503, "fora"), ConnectionResetError()])
+    assert services.retry_api(get, "A1") == "ok"
+    assert len(chamadas) == 3
+    assert len(esperas) == 2 and all(0 <= e <= 30 for e in esperas)
+
+def test_erro_permanente_nao_tenta_de_novo(planilha, esperas):
+    get, chamadas = _falha_antes([sheets_falso.APIErrorFalso(400, "range inválido")] * 5)
+    with pytest.raises(sheets_falso.APIErrorFalso):
+        services.retry_api(get, "A1")
+    assert len(chamadas) == 1 and esperas == []
+
+def test_limitador_enfileira_acima_da_cota(esperas):
+    limitador = services.LimitadorCota(60)
+    assert sum(limitador.adquirir() for _ in range(60)) == 0  # Balde cheio: sem espera
+    assert limitador.adquirir() == pytest.approx(1.0, abs=0.1)  # 1/s de reposição
+    assert limitador.adquirir() == pytest.approx(2.0, abs=0.1)
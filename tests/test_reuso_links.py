@@ -0,0 +1,29 @@
+import pandas as pd
+from modules import reuso_links
+from conftest import criar_projeto, linhas_da_aba
+
+def test_chave_ignora_zeros_pontuacao_caixa_e_acento():
+    ch = reuso_links.chaves(pd.Series(["0789-100", "789100", "", None]), pd.Series([" Lojá A", "loja a", "Loja A", "Loja A"]))
+    assert ch.tolist() == ["789100|loja a", "789100|loja a", "", ""]
+
+def test_upload_preenche_links_e_conclui_lote_inteiro(planilha):
+    eans = [str(7890000000000 + i) for i in range(11)]
+    # Lote 1 inteiro e o primeiro item do lote 2 já foram coletados (site escrito de outro jeito)
+    reuso_links.get_indice().registrar(["0" + e for e in eans], ["LOJA TESTE "] * 11, [f"https://loja.teste/{e}" for e in eans])
+    id_p = criar_projeto(20, 10)
+
+    dados = linhas_da_aba(planilha, f"dados_{id_p}")
+    assert [l[7] for l in dados[:11]] == [f"https://loja.teste/{e}" for e in eans]
+    assert [l[9] for l in dados] == ["1"] * 11 + [""] * 9  # Marcados para revisão
+    assert all(l[7] == "" for l in dados[11:])
+
+    lotes = {l[1]: l for l in linhas_da_aba(planilha, "controle_lotes") if l[0] == id_p}
+    assert lotes["1"][2:5] == ["Concluído", "auto", "10/10"]
+    assert lotes["2"][2:5] == ["Livre", "", "1/10"]
+
+def test_link_digitado_nao_e_sobrescrito(planilha):
+    reuso_links.get_indice().registrar(["111", "222"], ["Loja", "Loja"], ["https://antigo/1", "https://antigo/2"])
+    dados = pd.DataFrame({'ean': ["111", "222", "333"], 'site': ["Loja"] * 3, 'link': ["https://meu", "", ""], 'link_auto': [""] * 3})
+    assert reuso_links.preencher_upload(dados) == 1
+    assert dados['link'].tolist() == ["https://meu", "https://antigo/2", ""]
+    assert dados['link_auto'].tolist() == ["", "1", ""]
@@ -0,0 +1,49 @@
+from modules import services
+from conftest import criar_projeto
+
+def test_salvar_links_confere_linhas_deslocadas(planilha):
+    id_p = criar_projeto(20, 10)
+    df = services.carregar_dados_lote(id_p, 2)  # Índice id_linha -> linha montado aqui
+    alvo = df.iloc[3]
+    # Alguém apagou uma linha acima na aba: tudo sobe uma linha, o índice ficou velho
+    del planilha.abas[f"dados_{id_p}"].linhas[1]
+
+    alteracoes = [{'indice_excel': int(alvo['_row_index']), 'id_linha': alvo['id_linha'], 'link': "https://loja.teste/ok"}]
+    assert services.salvar_lote_links(id_p, 2, alteracoes)
+
+    linhas = planilha.abas[f"dados_{id_p}"].get_all_values()
+    gravadas = [l for l in linhas if len(l) > 7 and l[7] == "https://loja.teste/ok"]
+    assert len(gravadas) == 1 and gravadas[0][8] == alvo['id_linha']
+
+def test_link_de_linha_apagada_nao_vai_para_a_vizinha(planilha):
+    id_p = criar_projeto(10, 10)
+    df = services.carregar_dados_lote(id_p, 1)
+    apagada, vizinha = df.iloc[2], df.iloc[3]
+    ws = planilha.abas[f"dados_{id_p}"]
+    ws.linhas = [l for l in ws.linhas if l[8:9] != [apagada['id_linha']]]
+
+    descartados = []
+    item = {'indice_excel': int(apagada['_row_index']), 'id_linha': apagada['id_linha'], 'link': "https://loja.teste/perdido"}
+    assert services.salvar_lote_links(id_p, 1, [item], descartados)
+    assert descartados == [apagada['id_linha']]
+
+    df.loc[df.index[2], 'link'] = "https://loja.teste/perdido"
+    descartados = []
+    services.salvar_progresso_lote(df, id_p, 1, False, descartados=descartados)
+    assert descartados == [apagada['id_linha']]
+    linha_vizinha = next(l for l in ws.get_all_values() if l[8:9] == [vizinha['id_linha']])
+    assert all("perdido" not in str(c) for l in ws.get_all_values() for c in l)
+    assert linha_vizinha[7] == ""
+
+def test_fila_conta_links_descartados(planilha, monkeypatch):
+    from modules import fila_salvamento
+    monkeypatch.setattr(fila_salvamento.FilaSalvamento, "_loop", lambda self: None)
+    id_p = criar_projeto(10, 10)
+    df = services.carregar_dados_lote(id_p, 1)
+    ws = planilha.abas[f"dados_{id_p}"]
+    ws.linhas = [l for l in ws.linhas if l[8:9] != [df.iloc[0]['id_linha']]]
+    fila = fila_salvamento.FilaSalvamento(services.caminho_local("fila.json"))
+    fila.enfileirar(id_p, 1, [{'indice_excel': int(r['_row_index']), 'id_linha': r['id_linha'], 'link': "https://x"} for _, r in df.iloc[:2].iterrows()])
+    assert fila._enviar()
+    st = fila.status(id_p, 1)
+    assert st['pendentes'] == 0 and st['descartados'] == 1
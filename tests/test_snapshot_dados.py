@@ -0,0 +1,24 @@
+import json
+from modules import services, snapshot_dados
+from conftest import criar_projeto
+
+def test_mapa_de_batches_vem_do_proprio_arquivo(planilha, monkeypatch):
+    monkeypatch.setattr(services, "MODO_SHARD", "nenhum")
+    a = criar_projeto(25, 10)
+    destino = services.ABA_DADOS_PADRAO
+    snapshot_dados.atualizar(destino, forcar=True)
+    b = criar_projeto(15, 10)  # Entra pela atualização incremental (linhas novas no fim)
+    snapshot_dados.atualizar(destino, forcar=True)
+    versao_a = snapshot_dados.versao_projeto(destino, a)
+
+    # Meta .json de outra versão do arquivo (ex.: _gravar de outra thread no meio da leitura)
+    arq_meta = snapshot_dados._arquivo(destino) + ".json"
+    with open(arq_meta, encoding="utf-8") as f: meta = json.load(f)
+    meta.update({'projetos': {a: [5], b: [0]}, 'versoes': {}})
+    with open(arq_meta, "w", encoding="utf-8") as f: json.dump(meta, f)
+
+    assert len(snapshot_dados.consultar(destino, a)) == 25
+    df_b = snapshot_dados.consultar(destino, b, lote=2)
+    assert len(df_b) == 5 and set(df_b['id_projeto']) == {b}
+    assert list(df_b['_row_index']) == list(range(37, 42))
+    assert snapshot_dados.versao_projeto(destino, a) == versao_a
@@ -0,0 +1,54 @@
+import pandas as pd
+import pytest
+from modules import services, sheets_falso
+from conftest import criar_projeto, linhas_da_aba
+
+def _contar_blocos(monkeypatch, original, falha=None):
+    # Anota as gravações de bloco de dados; a de número `falha` cai com erro não transitório
+    gravados = []
+    def update(self, range_name=None, values=None, **kwargs):
+        if self.title.startswith("dados_") and not range_name.startswith("A1:"):  # Cabeçalho do shard não conta
+            if falha and len(gravados) == falha - 1: raise sheets_falso.APIErrorFalso(400, "Upload interrompido")
+            gravados.append(range_name)
+        return original(self, range_name=range_name, values=values, **kwargs)
+    monkeypatch.setattr(sheets_falso.Worksheet, "update", update)
+    return gravados
+
+def test_upload_interrompido_e_retomado_sem_duplicar(planilha, monkeypatch):
+    monkeypatch.setattr(services, "TAM_BLOCO_UPLOAD", 10)
+    original = sheets_falso.Worksheet.update
+    gravados = _contar_blocos(monkeypatch, original, falha=3)
+    with pytest.raises(sheets_falso.APIErrorFalso):
+        criar_projeto(35, 10)
+    id_p, = services.uploads_pendentes()
+    assert [p[4] for p in linhas_da_aba(planilha, "projetos")] == ["Enviando"]
+    assert gravados == ["A32:J36", "A2:J11"]  # Último bloco primeiro
+
+    gravados = _contar_blocos(monkeypatch, original)
+    assert services.retomar_upload(id_p) == (id_p, 35, 10)
+    assert gravados == ["A12:J21", "A22:J31"]  # Só os blocos que faltavam
+
+    dados = linhas_da_aba(planilha, f"dados_{id_p}")
+    assert [l[8] for l in dados] == [f"{id_p}-{i}" for i in range(35)]
+    assert [l[2] for l in dados] == [str(7890000000000 + i) for i in range(35)]
+    assert [int(l[1]) for l in dados] == [i // 10 + 1 for i in range(35)]
+    assert [p[4] for p in linhas_da_aba(planilha, "projetos")] == ["Ativo"]
+    assert services.uploads_pendentes() == []
+
+def test_linhas_do_upload_montadas_por_bloco():
+    bloco = pd.DataFrame({
+        "Site*": ["", " Loja B ", ""],
+        "Descrição*": [" Produto 1", "Produto 2", "Produto 3"],
+        "EAN*": ["111", "222 ", "333"],
+        "Quantidade no Lote*": ["", "", ""],
+        "CEP": ["01000-000", "", "02000-000"],
+    })
+    dados = services._montar_linhas_upload(bloco, "p1", 4, inicio=3, site_anterior="Loja A")
+    assert list(dados.columns) == services.COLS_DADOS
+    assert dados['site'].tolist() == ["Loja A", "Loja B", "Loja B"]  # Em branco herda o de cima, até do bloco anterior
+    assert dados['lote'].tolist() == [1, 2, 2]
+    assert dados['id_linha'].tolist() == ["p1-3", "p1-4", "p1-5"]
+    assert dados['ean'].tolist() == ["111", "222", "333"]
+    assert dados['descricao'].tolist() == ["Produto 1", "Produto 2", "Produto 3"]
+    assert dados['endereco'].tolist() == ["", "", ""]  # Coluna ausente no arquivo
+    assert (dados['link'] == "").all() and (dados['link_auto'] == "").all()